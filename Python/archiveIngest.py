@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Parallel ingest of compressed historical TLE archives
+#
+# Every file of an archive directory or glob is decompressed as a stream
+# (gzip, bz2, xz or plain text) and parsed into a columnar catalog in a
+# process pool.  The per-file catalogs are merged into one catalog sorted by
+# satnum and epoch with duplicate element sets removed.
+
+import bz2
+import glob
+import gzip
+import lzma
+import os
+import sys, getopt
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from catalogCache import writeCache
+from tleCatalog import COLUMN_NAMES, TleCatalog, iterTLE, parseTLE
+
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+def archiveFiles(archive):
+    # TLE files of a directory (all regular files) or a glob pattern
+    if os.path.isdir(archive):
+        filenames = [os.path.join(archive, name) for name in os.listdir(archive)]
+        filenames = [name for name in filenames if os.path.isfile(name)]
+    else:
+        filenames = glob.glob(archive)
+    return sorted(filenames)
+
+
+def openTLE(filename):
+    # Text stream of a possibly compressed TLE file
+    opener = OPENERS.get(os.path.splitext(filename)[1].lower(), open)
+    return opener(filename, 'rt', encoding='ascii', errors='replace')
+
+
+def readArchiveFile(filename):
+    # Parse one archive file, returning its catalog and size in bytes
+    lines1 = []
+    lines2 = []
+    with openTLE(filename) as tleFile:
+        for line1, line2 in iterTLE(tleFile):
+            lines1.append(line1)
+            lines2.append(line2)
+    return parseTLE(lines1, lines2), os.path.getsize(filename)
+
+
+def mergeCatalogs(catalogs):
+    # One catalog sorted by satnum and epoch, without duplicate element sets
+    # (the first occurrence in the sequence of catalogs is kept)
+    columns = {name: np.concatenate([catalog.columns()[name] for catalog in catalogs])
+               for name in COLUMN_NAMES}
+    order = np.lexsort((columns['epoch'], columns['satnum']))
+    satnum = columns['satnum'][order]
+    epoch = columns['epoch'][order]
+    unique = np.append(True, (satnum[1:] != satnum[:-1]) | (epoch[1:] != epoch[:-1]))
+    return TleCatalog({name: column[order[unique]] for name, column in columns.items()})
+
+
+def ingestArchive(archive, workers=None, progress=True):
+    # Parse every file of the archive in a process pool and merge the results
+    filenames = archiveFiles(archive)
+    catalogs = [None] * len(filenames)
+    elementSets = 0
+    totalBytes = 0
+    startTime = time.time()
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(readArchiveFile, filename): i
+                   for i, filename in enumerate(filenames)}
+        for done, future in enumerate(as_completed(futures), 1):
+            catalog, size = future.result()
+            # Keep file order so the merge does not depend on worker timing
+            catalogs[futures[future]] = catalog
+            elementSets += len(catalog)
+            totalBytes += size
+            if progress:
+                elapsed = max(time.time() - startTime, 1e-9)
+                print(f'{done:6d}/{len(filenames)} files', f'{elementSets:10d} element sets',
+                      f'{elementSets/elapsed:10.0f} TLE/s', f'{totalBytes/elapsed/1e6:8.2f} MB/s')
+
+    if not catalogs:
+        return parseTLE([], [])
+    catalog = mergeCatalogs(catalogs)
+    if progress:
+        print('Merged ', elementSets, ' element sets into ', len(catalog),
+              ' unique element sets in ', f'{time.time()-startTime:.2f}', ' s')
+    return catalog
+
+
+def main(argv):
+
+    # Defaults
+    archive = '.'
+    outputDir = None
+    workers = None
+
+    try:
+        opts, args = getopt.getopt(argv,"hi:o:w:",["archive=","odir=","workers="])
+    except getopt.GetoptError:
+        print('archiveIngest.py -i <archiveDirOrGlob> -o <cacheDir> -w <workers>')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print('archiveIngest.py -i <archiveDirOrGlob> -o <cacheDir> -w <workers>')
+            sys.exit()
+        elif opt in ("-i", "--archive"):
+            archive = arg
+        elif opt in ("-o", "--odir"):
+            outputDir = arg
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+
+    catalog = ingestArchive(archive, workers)
+    if outputDir:
+        if os.path.exists(outputDir):
+            print('Error: output directory already exists: ', outputDir)
+            sys.exit(1)
+        # Same column layout as catalogCache, opened with catalogCache.readCache
+        writeCache(catalog, outputDir)
+        print('Wrote merged catalog to ', outputDir)
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+# Monte Carlo ensembles of a breakup
+#
+# Every realization draws a fragment cloud from the standard breakup model
+# (breakupModel.breakupFragments), propagates it over the time grid and
+# records what each sensor sees: the fragments that rise above its horizon,
+# their passes and the first time any fragment is up.  The generators of the
+# realizations are spawned from one SeedSequence, realization i always using
+# child i, so an ensemble is reproduced from its seed whatever the number of
+# workers.  Realizations run on a pool of worker processes that hold the time
+# grid and the sensors; only the per-sensor summaries come back, are written
+# to the output as they arrive and are folded into running statistics, so
+# memory does not grow with the number of realizations.
+
+import os
+import sys, getopt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from skyfield.api import EarthSatellite, Topos, load
+
+from breakupModel import BREAKUP_TYPES, breakupFragments, collisionMass
+from groundSites import readSites
+from keplerPropagation import propagateStates
+from scheduleOutput import OUTPUT_FORMATS, RecordWriter
+from sensorView import sensorGeometry, sensorPasses
+from tleCatalog import readCatalog
+
+BLOCK_SIZE = 250     # fragments propagated together
+
+ENSEMBLE_FIELDS = ('realization', 'sensor', 'fragments', 'detected', 'passes',
+                   'firstDetection')
+
+# Parent object of satelliteBreakup.py
+LINE1 = '1  5398U 71067E   20004.97039155 +.00000142 +00000-0 +43247-4 0  9992'
+LINE2 = '2  5398 087.6227 269.5184 0065476 094.7647 266.1031 14.33848082536070'
+
+
+def realizationSeeds(seed, nRealizations):
+    # Independent seed sequences of the realizations of an ensemble
+    return np.random.SeedSequence(seed).spawn(nRealizations)
+
+
+class EnsembleStatistics:
+
+    # Running per-sensor statistics, updated one realization at a time
+    # (Welford's mean and variance), so no realization is kept
+    def __init__(self, nSensors):
+        self.count = 0
+        self.fragments = 0
+        self.mean = np.zeros(nSensors)
+        self.m2 = np.zeros(nSensors)
+        self.minimum = np.full(nSensors, np.iinfo(np.int64).max)
+        self.maximum = np.zeros(nSensors, dtype=np.int64)
+        self.fraction = np.zeros(nSensors)
+        self.detections = np.zeros(nSensors, dtype=np.int64)
+        self.firstDetection = np.zeros(nSensors)
+
+    def add(self, table):
+        # Fold in the per-sensor table of one realization
+        detected = table['detected']
+        self.count += 1
+        self.fragments += table['fragments'][0]
+        delta = detected - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (detected - self.mean)
+        self.minimum = np.minimum(self.minimum, detected)
+        self.maximum = np.maximum(self.maximum, detected)
+        self.fraction += detected / max(table['fragments'][0], 1)
+        seen = np.isfinite(table['firstDetection'])
+        self.detections += seen
+        self.firstDetection += np.where(seen, table['firstDetection'], 0.0)
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    def printSummary(self, sensorNames):
+        print('Realizations:', self.count, ' mean fragments:',
+              f'{self.fragments / max(self.count, 1):.1f}')
+        for s, name in enumerate(sensorNames):
+            first = self.firstDetection[s] / self.detections[s] if self.detections[s] else np.nan
+            print('Sensor:', name,
+                  f'detected {self.mean[s]:.1f} +- {self.std()[s]:.1f}',
+                  f'({self.minimum[s]}-{self.maximum[s]})',
+                  f'fraction {self.fraction[s] / max(self.count, 1):.3f}',
+                  f'P(detect) {self.detections[s] / max(self.count, 1):.3f}',
+                  f'first detection {first:.1f} min')
+
+
+# Time grid and sensors of a worker process, see _attachWorker
+_worker = {}
+
+def _attachWorker(tt, sensors):
+    _worker['times'] = load.timescale().tt_jd(tt)
+    _worker['sensors'] = sensors
+
+def runRealization(realization, seedSequence, r, v, dt, breakup, horizon=0.0, j2=False,
+                   blockSize=BLOCK_SIZE):
+    # Per-sensor summary of one realization: fragments detected (above the
+    # horizon at some grid sample), their passes and the first detection
+    # (minutes after the breakup, NaN if none).  Fragments are propagated
+    # blockSize at a time so a large cloud is never held over the whole grid
+    times, sensors = _worker['times'], _worker['sensors']
+    rng = np.random.default_rng(seedSequence)
+    states, lc, areaToMass = breakupFragments(r, v, rng=rng, **breakup)
+    detected = np.zeros(len(sensors), dtype=np.int64)
+    passes = np.zeros(len(sensors), dtype=np.int64)
+    first = np.full(len(sensors), np.inf)
+    for start in range(0, len(states), blockSize):
+        rGcrs = propagateStates(states[start:start + blockSize], dt, j2)[..., :3]
+        el, az, distance, visible = sensorGeometry(rGcrs, times, sensors, horizon)
+        detected += np.count_nonzero(visible.any(axis=2), axis=1)
+        passes += np.bincount(sensorPasses(el, az, distance, horizon)['site'],
+                              minlength=len(sensors))
+        seen = visible.any(axis=1)
+        first = np.minimum(first, np.where(seen.any(axis=1), dt[seen.argmax(axis=1)], np.inf))
+    return {
+        'realization': np.full(len(sensors), realization),
+        'sensor': np.arange(len(sensors)),
+        'fragments': np.full(len(sensors), len(states)),
+        'detected': detected,
+        'passes': passes,
+        'firstDetection': np.where(np.isfinite(first), first / 60.0, np.nan),
+    }
+
+def iterEnsemble(r, v, tt, dt, sensors, breakup, nRealizations, seed=None, workers=None,
+                 horizon=0.0, j2=False, blockSize=BLOCK_SIZE):
+    # Generator of the per-sensor tables of the realizations in order, on a
+    # pool of workers (serially if workers is 0).  At most two realizations
+    # per worker are in flight
+    seeds = realizationSeeds(seed, nRealizations)
+    if workers == 0:
+        _attachWorker(tt, sensors)
+        for i, seedSequence in enumerate(seeds):
+            yield runRealization(i, seedSequence, r, v, dt, breakup, horizon, j2, blockSize)
+        return
+    maxInFlight = 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(workers, initializer=_attachWorker,
+                             initargs=(tt, sensors)) as executor:
+        pending = deque()
+        for i in range(nRealizations + 1):
+            if i < nRealizations:
+                pending.append(executor.submit(runRealization, i, seeds[i], r, v, dt,
+                                               breakup, horizon, j2, blockSize))
+            while pending and (len(pending) >= maxInFlight or i >= nRealizations):
+                yield pending.popleft().result()
+
+def main(argv):
+
+    # Defaults
+    inputFile = None    # parent from LINE1/LINE2
+    outputFile = 'breakupEnsemble.csv'
+    sitesFile = None
+    fmt = None          # from the output file extension
+    nRealizations = 100
+    seed = None
+    workers = None      # one per core
+    breakupType = 'collision'
+    targetMass = 1000.0     # kg
+    projectileMass = 1.0    # kg
+    impactVelocity = 10.0   # km/s
+    scale = 1.0             # explosion scale factor
+    lMin = 0.1              # m, smallest fragment followed
+    lMax = 1.0              # m
+    offset = 0.125          # breakup time after the parent epoch, days
+    duration = 1.0          # days
+    step = 1.0              # minutes
+    horizon = 0.0           # degrees
+    j2 = False
+
+    usage = ('breakupEnsemble.py -i <tleFile> -o <outputFile> -s <sitesFile>' +
+             ' -n <realizations> --seed <seed> -w <workers> --format csv|jsonl' +
+             ' --type collision|explosion --mass <kg> --projectile <kg>' +
+             ' --velocity <km/s> --scale <S> --lmin <m> --lmax <m> --offset <days>' +
+             ' --duration <days> --step <minutes> --horizon <degrees> --j2')
+    try:
+        opts, args = getopt.getopt(argv,"hi:o:s:n:w:f:",["ifile=","ofile=","sites=",
+                                        "realizations=","seed=","workers=","format=",
+                                        "type=","mass=","projectile=","velocity=","scale=",
+                                        "lmin=","lmax=","offset=","duration=","step=",
+                                        "horizon=","j2"])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputFile = arg
+        elif opt in ("-o", "--ofile"):
+            outputFile = arg
+        elif opt in ("-s", "--sites"):
+            sitesFile = arg
+        elif opt in ("-n", "--realizations"):
+            nRealizations = int(arg)
+        elif opt in ['--seed']:
+            seed = int(arg)
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-f", "--format"):
+            if arg not in OUTPUT_FORMATS:
+                print('Unknown output format: ', arg)
+                sys.exit(2)
+            fmt = arg
+        elif opt in ['--type']:
+            if arg not in BREAKUP_TYPES:
+                print('Unknown breakup type: ', arg)
+                sys.exit(2)
+            breakupType = arg
+        elif opt in ['--mass']:
+            targetMass = float(arg)
+        elif opt in ['--projectile']:
+            projectileMass = float(arg)
+        elif opt in ['--velocity']:
+            impactVelocity = float(arg)
+        elif opt in ['--scale']:
+            scale = float(arg)
+        elif opt in ['--lmin']:
+            lMin = float(arg)
+        elif opt in ['--lmax']:
+            lMax = float(arg)
+        elif opt in ['--offset']:
+            offset = float(arg)
+        elif opt in ['--duration']:
+            duration = float(arg)
+        elif opt in ['--step']:
+            step = float(arg)
+        elif opt in ['--horizon']:
+            horizon = float(arg)
+        elif opt in ['--j2']:
+            j2 = True
+
+    ts = load.timescale()
+    if inputFile:
+        satellite = readCatalog(inputFile).satellite(0, ts)
+    else:
+        satellite = EarthSatellite(LINE1, LINE2, ts=ts)
+    if sitesFile:
+        sensorNames, sensors = readSites(sitesFile)
+    else:
+        sensorNames = ['sensorLocation', 'sensor']
+        sensors = [Topos(latitude_degrees=45.0, longitude_degrees=72.0, elevation_m=100.0),
+                   Topos(latitude_degrees=0.0, longitude_degrees=0.0)]
+
+    # Parent state at the breakup and the grid following it
+    tBreakup = ts.tt_jd(satellite.epoch.tt + offset)
+    geocentric = satellite.at(tBreakup)
+    dt = np.arange(0.0, duration * 1440.0, step) * 60.0
+    tt = tBreakup.tt + dt / 86400.0
+    breakup = {'breakupType': breakupType, 'scale': scale, 'lMin': lMin, 'lMax': lMax,
+               'mass': collisionMass(targetMass, projectileMass, impactVelocity)}
+    print('Breakup:', satellite.model.satnum, breakupType, 'at', tBreakup.utc_jpl())
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print('Seed:', seed)
+
+    statistics = EnsembleStatistics(len(sensors))
+    with RecordWriter(outputFile, ENSEMBLE_FIELDS, fmt) as writer:
+        for table in iterEnsemble(geocentric.position.km, geocentric.velocity.km_per_s, tt,
+                                  dt, sensors, breakup, nRealizations, seed, workers,
+                                  horizon, j2):
+            statistics.add(table)
+            table['sensor'] = np.array(sensorNames)[table['sensor']]
+            writer.writeTable(table)
+    statistics.printSummary(sensorNames)
+    print('Wrote', writer.count, 'records to', outputFile)
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Breakup fragment clouds
+#
+# The fragments of a breakup are held as one array of inertial state vectors
+# (nPieces, 6) in km and km/s, ready for keplerPropagation.propagateStates.
+#
+# breakupFragments draws a cloud from the NASA standard breakup model
+# (Johnson et al., "NASA's new breakup model of EVOLVE 4.0", 2001): a power
+# law in characteristic length Lc (m) for the number of fragments, the
+# spacecraft area-to-mass (m^2/kg) distributions in log10(A/M) for a given
+# Lc, and a normal distribution of log10 of the ejection speed (m/s) for a
+# given A/M.  Every draw comes from the generator passed in, so a seeded
+# generator reproduces a cloud exactly.
+
+import numpy as np
+
+BREAKUP_TYPES = ('collision', 'explosion')
+
+CATASTROPHIC_ENERGY = 40.0     # J/g, specific impact energy of a catastrophic collision
+SMALL_FRAGMENT_LC = 0.08       # m, below this the small debris A/M distribution
+LARGE_FRAGMENT_LC = 0.11       # m, above this the spacecraft A/M distribution
+DELTA_V_SIGMA = 0.4            # log10(m/s)
+
+
+def collisionMass(targetMass, projectileMass, impactVelocity):
+    # Mass (kg) scaling the fragment count of a collision at impactVelocity
+    # (km/s): both bodies if catastrophic, else projectile mass times the
+    # impact velocity squared
+    energy = 0.5 * projectileMass * (impactVelocity * 1000.0) ** 2 / (targetMass * 1000.0)
+    if energy >= CATASTROPHIC_ENERGY:
+        return targetMass + projectileMass
+    return projectileMass * impactVelocity ** 2
+
+
+def fragmentExponent(breakupType):
+    # Exponent of the cumulative size distribution N(>Lc) ~ Lc^-k
+    if breakupType not in BREAKUP_TYPES:
+        raise ValueError('breakup type must be one of ' + ', '.join(BREAKUP_TYPES))
+    return 1.71 if breakupType == 'collision' else 1.6
+
+
+def cumulativeCount(lc, breakupType='collision', mass=1.0, scale=1.0):
+    # Mean number of fragments larger than lc (m): 0.1 M^0.75 Lc^-1.71 for a
+    # collision with mass M (kg, see collisionMass), 6 S Lc^-1.6 for an
+    # explosion of scale S
+    k = fragmentExponent(breakupType)
+    if breakupType == 'collision':
+        return 0.1 * mass ** 0.75 * np.power(lc, -k)
+    return 6.0 * scale * np.power(lc, -k)
+
+
+def drawSizes(nPieces, lMin, lMax, exponent, rng):
+    # Characteristic lengths (m) between lMin and lMax following the power
+    # law, by inverting its cumulative distribution
+    u = rng.uniform(0.0, 1.0, nPieces)
+    tail = (lMax / lMin) ** -exponent
+    return lMin * (1.0 - u * (1.0 - tail)) ** (-1.0 / exponent)
+
+
+def _piecewise(x, x0, y0, x1, y1):
+    # y0 below x0, y1 above x1 and linear in between
+    return np.interp(x, [x0, x1], [y0, y1])
+
+
+def _smallAreaToMass(chi, rng):
+    # log10(A/M) of debris below 8 cm for chi = log10(Lc)
+    mu = _piecewise(chi, -1.75, -0.3, -1.25, -1.0)
+    sigma = np.where(chi <= -3.5, 0.2, 0.2 + 0.1333 * (chi + 3.5))
+    return rng.normal(mu, sigma)
+
+
+def _largeAreaToMass(chi, rng):
+    # log10(A/M) of spacecraft fragments above 11 cm, a mix of two normals
+    alpha = _piecewise(chi, -1.95, 0.0, 0.55, 1.0)
+    mu1 = _piecewise(chi, -1.1, -0.6, 0.0, -0.95)
+    sigma1 = _piecewise(chi, -1.3, 0.1, -0.3, 0.3)
+    mu2 = _piecewise(chi, -0.7, -1.2, -0.1, -2.0)
+    sigma2 = _piecewise(chi, -0.5, 0.5, -0.3, 0.3)
+    first = rng.uniform(0.0, 1.0, len(chi)) < alpha
+    return np.where(first, rng.normal(mu1, sigma1), rng.normal(mu2, sigma2))
+
+
+def drawAreaToMass(lc, rng):
+    # Area-to-mass ratios (m^2/kg) of fragments of characteristic lengths lc
+    # (m).  Between 8 and 11 cm each fragment takes the small or the large
+    # distribution with a probability moving linearly in log10(Lc)
+    chi = np.log10(lc)
+    large = _piecewise(chi, np.log10(SMALL_FRAGMENT_LC), 0.0,
+                       np.log10(LARGE_FRAGMENT_LC), 1.0)
+    useLarge = rng.uniform(0.0, 1.0, len(lc)) < large
+    return 10.0 ** np.where(useLarge, _largeAreaToMass(chi, rng), _smallAreaToMass(chi, rng))
+
+
+def drawDeltaV(areaToMass, breakupType, rng):
+    # Ejection speeds (km/s) of fragments with the given area-to-mass ratios
+    chi = np.log10(areaToMass)
+    if breakupType == 'collision':
+        mu = 0.9 * chi + 2.9
+    else:
+        mu = 0.2 * chi + 1.85
+    return 10.0 ** rng.normal(mu, DELTA_V_SIGMA) / 1000.0
+
+
+def isotropicDirections(nPieces, rng):
+    # Unit vectors (nPieces, 3) uniform on the sphere
+    direction = rng.normal(size=(nPieces, 3))
+    return direction / np.linalg.norm(direction, axis=1)[:, np.newaxis]
+
+
+def ejectFragments(r, v, nPieces, ejectionVelocity, rng=None):
+    # State vectors of nPieces fragments leaving the parent at position r
+    # (km) and velocity v (km/s) with speed ejectionVelocity (km/s) relative
+    # to it, in directions drawn from a uniform cube and normalised
+    if rng is None:
+        rng = np.random.default_rng()
+    direction = rng.uniform(-1.0, 1.0, (nPieces, 3))
+    delta = ejectionVelocity * direction / np.linalg.norm(direction, axis=1)[:, np.newaxis]
+    states = np.empty((nPieces, 6))
+    states[:, :3] = r
+    states[:, 3:] = np.asarray(v) + delta
+    return states
+
+
+def breakupFragments(r, v, breakupType='collision', mass=1.0, scale=1.0, lMin=0.1,
+                     lMax=1.0, rng=None):
+    # One realization of the standard breakup model of a parent at position
+    # r (km) and velocity v (km/s): the number of fragments between lMin and
+    # lMax (m) is Poisson with the model mean, then every fragment gets a
+    # size, an area-to-mass ratio and an ejection speed in an isotropic
+    # direction.  Returns the state vectors (n, 6), Lc (m) and A/M (m^2/kg)
+    if rng is None:
+        rng = np.random.default_rng()
+    mean = cumulativeCount(lMin, breakupType, mass, scale) \
+        - cumulativeCount(lMax, breakupType, mass, scale)
+    nPieces = rng.poisson(mean)
+    lc = drawSizes(nPieces, lMin, lMax, fragmentExponent(breakupType), rng)
+    areaToMass = drawAreaToMass(lc, rng)
+    speed = drawDeltaV(areaToMass, breakupType, rng)
+    states = np.empty((nPieces, 6))
+    states[:, :3] = r
+    states[:, 3:] = np.asarray(v) + speed[:, np.newaxis] * isotropicDirections(nPieces, rng)
+    return states, lc, areaToMass
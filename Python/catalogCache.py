@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Memory-mapped binary cache of parsed TLE catalogs
+#
+# A parsed catalog is stored as one fixed-dtype .npy file per column in a
+# directory keyed by a hash of the TLE file contents.  Later runs open the
+# columns with mmap instead of re-parsing the text, so several processes
+# share the same pages.  When the TLE file changes its hash changes and the
+# cache is rebuilt; stale entries for the same file are removed.
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from tleCatalog import CATALOG_COLUMNS, TleCatalog, readCatalog
+
+CACHE_DIRNAME = '.catalogCache'
+HASH_BLOCK_SIZE = 1 << 20
+CACHE_FORMAT = b'2'     # bumped when a column changes meaning, e.g. epochyr
+
+
+def catalogHash(tleFilename):
+    # Hash of the TLE file contents and the cache format, so caches written
+    # with older columns are rebuilt
+    digest = hashlib.sha1(CACHE_FORMAT)
+    with open(tleFilename, 'rb') as tleFile:
+        for block in iter(lambda: tleFile.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cachePath(tleFilename, cacheDir=None, tleHash=None):
+    # Directory holding the compiled columns of a TLE file
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(os.path.abspath(tleFilename)), CACHE_DIRNAME)
+    if tleHash is None:
+        tleHash = catalogHash(tleFilename)
+    return os.path.join(cacheDir, os.path.basename(tleFilename) + '-' + tleHash)
+
+
+def writeCache(catalog, path):
+    # Write the catalog columns, then move the directory into place in one
+    # rename so readers never see a partial cache
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmpPath = tempfile.mkdtemp(dir=parent)
+    for name, dtype in CATALOG_COLUMNS:
+        np.save(os.path.join(tmpPath, name + '.npy'),
+                np.ascontiguousarray(getattr(catalog, name), dtype=dtype))
+    try:
+        os.rename(tmpPath, path)
+    except OSError:
+        # Another process finished the same cache first
+        shutil.rmtree(tmpPath, ignore_errors=True)
+
+
+def readCache(path):
+    # Open the cached columns read-only with mmap
+    return TleCatalog({name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                       for name, dtype in CATALOG_COLUMNS})
+
+
+def removeStaleCaches(path):
+    # Remove caches built from earlier versions of the same TLE file
+    parent = os.path.dirname(path)
+    name = os.path.basename(path)
+    prefix = name.rsplit('-', 1)[0] + '-'
+    for entry in os.listdir(parent):
+        stale = os.path.join(parent, entry)
+        if (entry.startswith(prefix) and len(entry) == len(name)
+                and stale != path and os.path.isdir(stale)):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def loadCatalog(tleFilename, cacheDir=None):
+    # Columnar catalog of a TLE file, parsed once and memory-mapped afterwards
+    path = cachePath(tleFilename, cacheDir)
+    if not os.path.isdir(path):
+        writeCache(readCatalog(tleFilename), path)
+        removeStaleCaches(path)
+    return readCache(path)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Incremental catalog ingest
+#
+# An incoming TLE feed is compared with the stored catalog by satellite
+# number and epoch.  Only element sets that are newer than the latest stored
+# epoch of their object are written, and a change summary (new, updated and
+# missing objects) is produced for downstream schedule jobs.
+
+import json
+
+import numpy as np
+
+
+def latestEpochs(satnum, epoch):
+    # Sorted unique satellite numbers and the latest epoch of each
+    satnum = np.asarray(satnum)
+    epoch = np.asarray(epoch)
+    order = np.lexsort((epoch, satnum))
+    satnum = satnum[order]
+    epoch = epoch[order]
+    last = np.flatnonzero(np.append(satnum[1:] != satnum[:-1], True))
+    return satnum[last], epoch[last]
+
+
+def catalogChanges(feed, storedSatnums, storedEpochs):
+    # Compare a feed catalog with the stored latest epoch per object
+    # storedSatnums must be sorted and unique, as returned by latestEpochs
+    storedSatnums = np.asarray(storedSatnums)
+    storedEpochs = np.asarray(storedEpochs)
+
+    position = np.searchsorted(storedSatnums, feed.satnum)
+    position = np.minimum(position, max(len(storedSatnums) - 1, 0))
+    if len(storedSatnums):
+        known = storedSatnums[position] == feed.satnum
+        storedLatest = np.where(known, storedEpochs[position], -np.inf)
+    else:
+        known = np.zeros(len(feed), dtype=bool)
+        storedLatest = np.full(len(feed), -np.inf)
+
+    changed = feed.epoch > storedLatest
+    return {
+        'rows': np.flatnonzero(changed),
+        'new': np.unique(feed.satnum[~known]),
+        'updated': np.unique(feed.satnum[known & changed]),
+        'missing': np.setdiff1d(storedSatnums, feed.satnum),
+    }
+
+
+def affectedSatnums(changes):
+    # Objects whose orbit changed and need their schedule recomputed
+    return np.union1d(changes['new'], changes['updated'])
+
+
+def printChangeSummary(changes):
+    print('Element sets to write: ', len(changes['rows']))
+    print('New objects:           ', len(changes['new']))
+    print('Updated objects:       ', len(changes['updated']))
+    print('Decayed/missing:       ', len(changes['missing']))
+
+
+def writeChangeSummary(changes, summaryFilename):
+    # JSON change summary consumed by the schedule jobs
+    summary = {
+        'elementSets': len(changes['rows']),
+        'new': changes['new'].tolist(),
+        'updated': changes['updated'].tolist(),
+        'missing': changes['missing'].tolist(),
+    }
+    with open(summaryFilename, 'w') as summaryFile:
+        json.dump(summary, summaryFile)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Columnar catalog export to CSV and binary column files
+#
+# Rows are formatted straight from the catalog columns a chunk at a time, so
+# no per-satellite dicts or skyfield objects are built.  Floating point
+# columns are written as the shortest repr that reads back exactly.
+
+import gzip
+
+import numpy as np
+
+EXPORT_CHUNK_SIZE = 10000
+
+# CSV field name, catalog column, format
+EXPORT_FIELDS = [
+    ('satnum', 'satnum', '%d'),
+    ('epochyr', 'epochyr', '%d'),
+    ('epochdays', 'epochdays', '%r'),
+    ('jdsatepoch', 'epoch', '%r'),
+    ('ndot', 'ndot', '%r'),
+    ('nddot', 'nddot', '%r'),
+    ('bstar', 'bstar', '%r'),
+    ('inclination', 'inclination', '%r'),
+    ('rightascension', 'raan', '%r'),
+    ('eccentricity', 'eccentricity', '%r'),
+    ('argofperigee', 'argPerigee', '%r'),
+    ('meanmotion', 'meanMotion', '%r'),
+    ('meananomaly', 'meanAnomaly', '%r'),
+    ('line1', 'line1', '%s'),
+    ('line2', 'line2', '%s'),
+]
+DEFAULT_CSV_FIELDS = [name for name, column, fmt in EXPORT_FIELDS[:13]]
+
+
+def exportFields(fields=None):
+    # (name, column, format) of the selected fields, in the order given
+    if fields is None:
+        fields = DEFAULT_CSV_FIELDS
+    byName = {field[0]: field for field in EXPORT_FIELDS}
+    unknown = [name for name in fields if name not in byName]
+    if unknown:
+        raise ValueError('Unknown export fields: ' + ', '.join(unknown))
+    return [byName[name] for name in fields]
+
+
+def _openText(filename, mode):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', newline='')
+    return open(filename, mode, newline='')
+
+
+def _columnValues(catalog, column, rows):
+    values = getattr(catalog, column)[rows]
+    if values.dtype.kind == 'S':
+        return [value.decode('ascii') for value in values.tolist()]
+    return values.tolist()
+
+
+def exportCSV(catalog, filename, fields=None, chunkSize=EXPORT_CHUNK_SIZE, append=False):
+    # Write the selected fields as CSV, gzip compressed if filename ends in .gz
+    selected = exportFields(fields)
+    rowFormat = ','.join(fmt for name, column, fmt in selected) + '\r\n'
+    with _openText(filename, 'a' if append else 'w') as csvfile:
+        if not append:
+            csvfile.write(','.join(name for name, column, fmt in selected) + '\r\n')
+        for start in range(0, len(catalog), chunkSize):
+            rows = slice(start, start + chunkSize)
+            values = zip(*[_columnValues(catalog, column, rows)
+                           for name, column, fmt in selected])
+            csvfile.write(''.join(rowFormat % row for row in values))
+
+
+def exportColumns(catalog, filename, fields=None, compress=False):
+    # Write the selected fields as one array each in a NumPy .npz file
+    selected = exportFields(fields)
+    arrays = {name: np.asarray(getattr(catalog, column)) for name, column, fmt in selected}
+    if compress:
+        np.savez_compressed(filename, **arrays)
+    else:
+        np.savez(filename, **arrays)
+
+
+def readColumns(filename):
+    # Dict of field name to array from a file written by exportColumns
+    with np.load(filename) as columns:
+        return {name: columns[name] for name in columns.files}
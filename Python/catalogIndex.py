@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Epoch-aware index over (satnum, epoch) for multi-epoch TLE histories
+#
+# Element sets are sorted by satellite number and epoch.  Each element set is
+# valid from the midpoint with the previous epoch of the same object to the
+# midpoint with the next one ('nearest'), or from its own epoch to the next
+# epoch ('previous', no element set from the future is used).  Lookups are
+# binary searches on a single sorted key, so they are O(log n) and vectorized.
+
+import numpy as np
+
+LOOKUP_MODES = ('nearest', 'previous')
+
+
+class ElementSetIndex:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.order = np.lexsort((catalog.epoch, catalog.satnum))
+        self.satnum = np.asarray(catalog.satnum)[self.order]
+        self.epoch = np.asarray(catalog.epoch)[self.order]
+
+        # Objects as contiguous runs of the sorted arrays
+        n = len(self.satnum)
+        self.starts = np.flatnonzero(np.append(True, self.satnum[1:] != self.satnum[:-1])) \
+            if n else np.zeros(0, dtype=np.int64)
+        self.stops = np.append(self.starts[1:], n)
+        self.objectSatnums = self.satnum[self.starts]
+        self.rank = np.repeat(np.arange(len(self.starts)), self.stops - self.starts)
+
+        # Single sorted key: object rank * span + epoch offset
+        self.epoch0 = self.epoch.min() - 1.0 if n else 0.0
+        self.span = self.epoch.max() - self.epoch0 + 1.0 if n else 1.0
+        self.key = self.rank * self.span + (self.epoch - self.epoch0)
+
+    def __len__(self):
+        return len(self.objectSatnums)
+
+    def _objectRank(self, satnums):
+        satnums = np.asarray(satnums)
+        rank = np.searchsorted(self.objectSatnums, satnums)
+        rank = np.minimum(rank, max(len(self.objectSatnums) - 1, 0))
+        known = (self.objectSatnums[rank] == satnums) if len(self.objectSatnums) \
+            else np.zeros(satnums.shape, dtype=bool)
+        return rank, known
+
+    def _validity(self, mode):
+        # Start and stop of the validity interval of every sorted element set
+        if mode not in LOOKUP_MODES:
+            raise ValueError('mode must be one of ' + ', '.join(LOOKUP_MODES))
+        if mode == 'nearest':
+            switch = 0.5 * (self.epoch[1:] + self.epoch[:-1])
+        else:
+            switch = self.epoch[1:]
+        # Before its first epoch an object uses its oldest element set
+        sameObject = self.rank[1:] == self.rank[:-1]
+        validStart = np.append(-np.inf, np.where(sameObject, switch, -np.inf))
+        validStop = np.append(np.where(sameObject, switch, np.inf), np.inf)
+        return validStart, validStop
+
+    def lookup(self, satnums, jd, mode='nearest'):
+        # Catalog row of the best element set of each satnum at Julian date jd
+        # (arrays broadcast together); -1 where the object is not indexed
+        satnums, jd = np.broadcast_arrays(np.asarray(satnums), np.asarray(jd, dtype=np.float64))
+        rank, known = self._objectRank(satnums)
+        if not len(self.key):
+            return np.full(satnums.shape, -1, dtype=np.int64)
+
+        # Last element set with epoch <= jd, kept inside the object's run
+        offset = np.clip(jd - self.epoch0, 0.0, self.span - 0.5)
+        position = np.searchsorted(self.key, rank * self.span + offset, side='right') - 1
+        position = np.clip(position, self.starts[rank], self.stops[rank] - 1)
+
+        if mode == 'nearest':
+            following = np.minimum(position + 1, self.stops[rank] - 1)
+            closer = np.abs(self.epoch[following] - jd) < np.abs(self.epoch[position] - jd)
+            position = np.where(closer, following, position)
+        elif mode not in LOOKUP_MODES:
+            raise ValueError('mode must be one of ' + ', '.join(LOOKUP_MODES))
+
+        return np.where(known, self.order[position], -1)
+
+    def elementSets(self, jd, mode='nearest'):
+        # Catalog row of the best element set of every indexed object at jd
+        return self.lookup(self.objectSatnums, jd, mode)
+
+    def windowSegments(self, jdStart, jdEnd, mode='nearest'):
+        # Element sets covering [jdStart, jdEnd] for every object, switching
+        # element sets inside the window.  Returns catalog rows and the start
+        # and stop Julian date of each segment, ordered by satnum and time
+        if not len(self.key):
+            return self.order, np.zeros(0), np.zeros(0)
+        validStart, validStop = self._validity(mode)
+        inWindow = (validStart < jdEnd) & (validStop > jdStart)
+        start = np.maximum(validStart[inWindow], jdStart)
+        stop = np.minimum(validStop[inWindow], jdEnd)
+        return self.order[inWindow], start, stop
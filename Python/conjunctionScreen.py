@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+# All-vs-all conjunction screening of the catalog
+#
+# Close approaches between catalog objects are found without comparing every
+# pair at every time:
+#  - Apogee/perigee filter: objects whose radial shell [perigee, apogee]
+#    overlaps no other shell are not propagated, and pairs of disjoint
+#    shells are never compared.
+#  - Spatial hashing: the catalog is propagated over a coarse grid a chunk of
+#    samples at a time, and at every sample the mid-step positions are
+#    hashed into cubic cells as large as the distance any pair can close in
+#    half a step.  Only pairs in the same or neighbouring cells are compared,
+#    so the work grows with the number of objects rather than its square,
+#    and a pair is kept if it is approaching and its closest approach along
+#    its relative velocity comes within reach of the threshold in the step.
+#  - Orbital-plane filter: two orbits can only meet near the line where their
+#    planes cross.  Pairs whose orbit radii differ there by more than the
+#    screening distance (with margins for J2 drift over the window) are
+#    dropped.
+# The remaining pairs are approaching at the sample, and if they recede at the
+# next one the time of closest approach (TCA) between the two is refined by
+# bisection of the relative range rate.  Pairs already within the threshold
+# and moving apart at the start of the window, or still closing at its end,
+# come closest at that end of the window.  Positions are TEME km, times TT
+# Julian dates.
+
+import sys, getopt
+
+import numpy as np
+
+from skyfield.api import load
+from skyfield.constants import DAY_S
+
+from catalogCache import loadCatalog
+from catalogIndex import ElementSetIndex
+from gridContext import sgp4Times
+from keplerPropagation import j2Rates
+from passSearch import bisect
+from propagation import iterPropagation, propagatePoints, satrecArray, satrecList
+from scheduleOutput import OUTPUT_FORMATS, RecordWriter
+from visibilityScreen import orbitRadii
+
+THRESHOLD_KM = 10.0         # reported miss distance
+STEP_S = 30.0               # coarse grid
+CHUNK_STEPS = 120           # grid samples propagated together
+RADIAL_MARGIN_KM = 30.0     # mean elements vs osculating positions (short-period terms)
+MAX_GRAVITY_GRADIENT = 3.4e-6  # 1/s^2, 2 GM/R^3 at the surface with 10% for J2
+TOLERANCE_S = 1e-3          # TCA accuracy
+
+CONJUNCTION_FIELDS = ('satnum1', 'satnum2', 'tcaUtc', 'tca', 'miss', 'relativeSpeed')
+
+# The cell itself and the 13 neighbouring cells that follow it, so every
+# pair of neighbouring cells is visited once
+NEIGHBOUR_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                              for dz in (-1, 0, 1) if (dx, dy, dz) >= (0, 0, 0)])
+
+
+def orbitGeometry(catalog, duration):
+    # Mean semi-major axis (km), eccentricity, perifocal unit vectors P, Q, W
+    # (n, 3) and the J2 drift (rad) of the node and periapsis over duration
+    # (days) of every element set
+    perigee, apogee = orbitRadii(catalog)
+    a = 0.5 * (perigee + apogee)
+    e = np.asarray(catalog.eccentricity)
+    i, node, w = catalog.inclination, catalog.raan, catalog.argPerigee
+    cosNode, sinNode = np.cos(node), np.sin(node)
+    cosI, sinI = np.cos(i), np.sin(i)
+    cosW, sinW = np.cos(w), np.sin(w)
+    P = np.column_stack((cosNode * cosW - sinNode * sinW * cosI,
+                         sinNode * cosW + cosNode * sinW * cosI, sinW * sinI))
+    Q = np.column_stack((-cosNode * sinW - sinNode * cosW * cosI,
+                         -sinNode * sinW + cosNode * cosW * cosI, cosW * sinI))
+    W = np.column_stack((sinNode * sinI, -cosNode * sinI, cosI))
+    nodeRate, periapsisRate, meanAnomalyRate = j2Rates(
+        a, e, np.asarray(catalog.meanMotion) / 60.0, W)
+    return a, e, P, Q, W, nodeRate * duration * DAY_S, periapsisRate * duration * DAY_S
+
+
+def shellOverlap(perigee, apogee, distance):
+    # True for the objects whose radial shell comes within distance (km) of
+    # the shell of another object.  Sorted by perigee, an object overlaps an
+    # earlier one if the largest earlier apogee reaches its perigee, and a
+    # later one if the next perigee is within reach of its apogee
+    order = np.argsort(perigee, kind='stable')
+    q, Q = perigee[order], apogee[order]
+    overlap = np.zeros(len(q), dtype=bool)
+    if len(q) > 1:
+        overlap[1:] = q[1:] - np.maximum.accumulate(Q)[:-1] <= distance
+        overlap[:-1] |= q[1:] - Q[:-1] <= distance
+    result = np.empty_like(overlap)
+    result[order] = overlap
+    return result
+
+
+def _radiusAt(a, e, P, Q, u):
+    # Radius (km) of the orbit point in direction u (n, 3)
+    return a * (1.0 - e * e) / (1.0 + e * np.sum(P * u, axis=1))
+
+
+def planeFilter(geometry, sat1, sat2, distance):
+    # True for the pairs whose orbits may come within distance (km) of each
+    # other.  Within distance of the other plane, an orbit stays within an
+    # angle of the mutual node line set by the relative inclination, and over
+    # that angle (plus the J2 turn of the node line and apsides) its radius
+    # changes by at most a e (1 + e) / (1 - e) per radian
+    a, e, P, Q, W, nodeDrift, periapsisDrift = geometry
+    K = np.cross(W[sat1], W[sat2])
+    sinRelative = np.linalg.norm(K, axis=1)
+    K /= np.where(sinRelative > 0.0, sinRelative, 1.0)[:, np.newaxis]
+    rMin = np.minimum(a[sat1] * (1.0 - e[sat1]), a[sat2] * (1.0 - e[sat2]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angle = np.arcsin(np.clip(distance / (rMin * sinRelative), 0.0, 1.0)) \
+            + np.arcsin(np.clip(distance / rMin, 0.0, 1.0)) \
+            + np.abs(nodeDrift[sat1] - nodeDrift[sat2]) * (1.0 + 1.0 / sinRelative) \
+            + np.abs(periapsisDrift[sat1]) + np.abs(periapsisDrift[sat2])
+    slope = a * e * (1.0 + e) / (1.0 - e)
+    spread = (slope[sat1] + slope[sat2]) * angle
+    near = ~(angle < 0.5 * np.pi)
+    for u in (K, -K):
+        gap = np.abs(_radiusAt(a[sat1], e[sat1], P[sat1], Q[sat1], u)
+                     - _radiusAt(a[sat2], e[sat2], P[sat2], Q[sat2], u))
+        near |= gap - spread <= distance
+    return near
+
+
+def neighbourPairs(r, cellSize):
+    # Index pairs (each pair once) of the positions (n, 3) that fall in the
+    # same or neighbouring cubic cells.  Positions are sorted by cell and the
+    # neighbours are looked up among the occupied cells, whose keys are
+    # sorted, so every offset costs one pass over the cells
+    cells = np.floor(r / cellSize).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    cellKeys, cellStart, cellCount = np.unique(keys[order], return_index=True,
+                                               return_counts=True)
+    pointCell = np.repeat(np.arange(len(cellKeys)), cellCount)
+    first, second = [], []
+    for offset in NEIGHBOUR_OFFSETS:
+        if offset.any():
+            neighbour = cellKeys + (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+            match = np.minimum(np.searchsorted(cellKeys, neighbour), len(cellKeys) - 1)
+            occupied = cellKeys[match] == neighbour
+            lo = np.where(occupied, cellStart[match], 0)[pointCell]
+            hi = np.where(occupied, cellStart[match] + cellCount[match], 0)[pointCell]
+        else:
+            # Later points of the same cell
+            lo = np.arange(len(keys)) + 1
+            hi = (cellStart + cellCount)[pointCell]
+        counts = np.maximum(hi - lo, 0)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        first.append(order[np.repeat(np.arange(len(keys)), counts)])
+        second.append(order[np.repeat(lo, counts) + within])
+    return np.concatenate(first), np.concatenate(second)
+
+
+def screenSample(r, v, step, threshold, candidates, radial=None):
+    # Pairs of one grid sample (positions and velocities (n, 3) of the
+    # candidate objects) that are approaching and may close within threshold
+    # (km) before the next sample, as rows of candidates.  Relative motion
+    # over the step is taken as linear; the relative acceleration, at most
+    # the gravity gradient times the separation, moves a pair off that line
+    # by at most reach times its largest separation.  radial(sat1, sat2)
+    # drops pairs whose shells are apart
+    finite = np.isfinite(r[:, 0])
+    rows = candidates[finite]
+    r, v = r[finite], v[finite]
+    if len(rows) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # Every time in the step is within half a step of its middle, so the
+    # pairs are hashed at their mid-step positions
+    halfStep = 0.5 * step
+    maxSpeed = np.sqrt(np.max(np.sum(v * v, axis=1)))
+    reach = 0.5 * MAX_GRAVITY_GRADIENT * step ** 2
+    i, j = neighbourPairs(r + halfStep * v, threshold + 2.0 * maxSpeed * halfStep
+                          + reach * (threshold + 2.0 * maxSpeed * step) / (1.0 - reach))
+    dr = r[j] - r[i]
+    dv = v[j] - v[i]
+    rate = np.sum(dr * dv, axis=1)
+    speed2 = np.sum(dv * dv, axis=1)
+    tMin = np.clip(-rate / np.where(speed2 > 0.0, speed2, 1.0), 0.0, step)
+    closest = dr + dv * tMin[:, np.newaxis]
+    # The farthest point of the linear path is one of its ends
+    end = dr + dv * step
+    farthest = np.sqrt(np.maximum(np.sum(dr * dr, axis=1), np.sum(end * end, axis=1)))
+    close = (rate < 0.0) \
+        & (np.sqrt(np.sum(closest * closest, axis=1)) <= threshold + reach * farthest)
+    i, j = i[close], j[close]
+    # Pairs in ascending catalog order
+    sat1 = np.minimum(rows[i], rows[j])
+    sat2 = np.maximum(rows[i], rows[j])
+    if radial is not None:
+        keep = radial(sat1, sat2)
+        sat1, sat2 = sat1[keep], sat2[keep]
+    return sat1, sat2
+
+
+def windowEdgePairs(r, v, threshold, candidates, receding):
+    # Pairs of the sample at the start (receding) or end of the window that
+    # are within threshold (km) and moving apart (start) or still closing
+    # (end), so that their closest approach in the window is the sample
+    finite = np.isfinite(r[:, 0])
+    rows = candidates[finite]
+    r, v = r[finite], v[finite]
+    if len(rows) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    i, j = neighbourPairs(r, threshold)
+    dr = r[j] - r[i]
+    rate = np.sum(dr * (v[j] - v[i]), axis=1)
+    close = (np.sum(dr * dr, axis=1) <= threshold * threshold) \
+        & ((rate >= 0.0) if receding else (rate < 0.0))
+    i, j = i[close], j[close]
+    return np.minimum(rows[i], rows[j]), np.maximum(rows[i], rows[j])
+
+
+def relativeState(satrecs, ts, sat1, sat2, tt):
+    # Relative position (km) and velocity (km/s) of satrecs[sat2[k]] from
+    # satrecs[sat1[k]] at TT Julian date tt[k]
+    times = ts.tt_jd(tt)
+    errors1, r1, v1 = propagatePoints(satrecs, sat1, times)
+    errors2, r2, v2 = propagatePoints(satrecs, sat2, times)
+    return r2 - r1, v2 - v1
+
+
+def refineConjunctions(satrecs, ts, sat1, sat2, lo, hi, threshold,
+                       tolerance=TOLERANCE_S):
+    # Closest approach of each pair within its bracket [lo, hi] (TT Julian
+    # dates), kept if the pair is approaching at lo, receding at hi and
+    # misses by at most threshold (km).  Returns a dict of columns
+    def rangeRate(rows, tt):
+        dr, dv = relativeState(satrecs, ts, sat1[rows], sat2[rows], tt)
+        return np.sum(dr * dv, axis=1)
+
+    rows = np.arange(len(sat1))
+    turning = (rangeRate(rows, lo) < 0.0) & (rangeRate(rows, hi) >= 0.0)
+    rows = rows[turning]
+    tca = bisect(rangeRate, rows, lo[rows], hi[rows], tolerance)
+    dr, dv = relativeState(satrecs, ts, sat1[rows], sat2[rows], tca)
+    miss = np.linalg.norm(dr, axis=1)
+    near = miss <= threshold
+    return {
+        'sat1': sat1[rows][near],
+        'sat2': sat2[rows][near],
+        'tca': tca[near],
+        'miss': miss[near],
+        'relativeSpeed': np.linalg.norm(dv[near], axis=1),
+    }
+
+
+def findConjunctions(catalog, tStart, tEnd, ts=None, threshold=THRESHOLD_KM, step=STEP_S,
+                     prefilter=True, chunkSize=CHUNK_STEPS):
+    # Conjunctions closer than threshold (km) between tStart and tEnd (TT
+    # Julian dates) of every pair of element sets of the catalog, sorted by
+    # TCA.  Columns sat1 < sat2 (catalog rows), tca, miss (km) and
+    # relativeSpeed (km/s).  A pair closest at tStart or tEnd, i.e. within
+    # threshold and moving apart at tStart or still closing at tEnd, has its
+    # TCA there.  prefilter=False compares every pair that the spatial hash
+    # finds, e.g. to check the filters
+    if ts is None:
+        ts = load.timescale()
+    grid = np.append(np.arange(tStart, tEnd, step / DAY_S), tEnd)
+    jd, fraction = sgp4Times(ts.tt_jd(grid))
+    distance = threshold + RADIAL_MARGIN_KM
+    perigee, apogee = orbitRadii(catalog)
+    geometry = orbitGeometry(catalog, tEnd - tStart)
+    if prefilter:
+        candidates = np.flatnonzero(shellOverlap(perigee, apogee, distance))
+        def radial(sat1, sat2):
+            return np.maximum(perigee[sat1], perigee[sat2]) \
+                - np.minimum(apogee[sat1], apogee[sat2]) <= distance
+    else:
+        candidates = np.arange(len(catalog))
+        radial = None
+
+    # Coarse screen: brackets [k, k + 1] of grid samples in which a pair
+    # may pass closest
+    sat1, sat2, bracket = [], [], []
+    edge1, edge2, edgeTime = [], [], []
+    satrecs = satrecArray(catalog.subset(candidates))
+    for timeSlice, errors, r, v in iterPropagation(satrecs, jd, fraction, chunkSize):
+        for k in range(timeSlice.stop - timeSlice.start):
+            first, second = screenSample(r[:, k], v[:, k], step, threshold, candidates, radial)
+            sat1.append(first)
+            sat2.append(second)
+            bracket.append(np.full(len(first), timeSlice.start + k))
+            # Closest at the start or the end of the window
+            for sample, receding in ((0, True), (len(grid) - 1, False)):
+                if timeSlice.start + k == sample:
+                    first, second = windowEdgePairs(r[:, k], v[:, k], threshold, candidates,
+                                                    receding)
+                    edge1.append(first)
+                    edge2.append(second)
+                    edgeTime.append(np.full(len(first), grid[sample]))
+    sat1, sat2, bracket = (np.concatenate(column) for column in (sat1, sat2, bracket))
+    edge1, edge2, edgeTime = (np.concatenate(column) for column in (edge1, edge2, edgeTime))
+    inside = bracket < len(grid) - 1
+    if prefilter:
+        inside &= planeFilter(geometry, sat1, sat2, distance)
+    keys = np.unique(np.column_stack((sat1[inside], sat2[inside], bracket[inside])), axis=0)
+    sat1, sat2, bracket = keys.T.reshape(3, -1)
+
+    satrecs = satrecList(catalog)
+    conjunctions = refineConjunctions(satrecs, ts, sat1, sat2, grid[bracket],
+                                      grid[bracket + 1], threshold)
+    dr, dv = relativeState(satrecs, ts, edge1, edge2, edgeTime)
+    edges = {
+        'sat1': edge1,
+        'sat2': edge2,
+        'tca': edgeTime,
+        'miss': np.linalg.norm(dr, axis=1),
+        'relativeSpeed': np.linalg.norm(dv, axis=1),
+    }
+    conjunctions = {name: np.concatenate((column, edges[name]))
+                    for name, column in conjunctions.items()}
+    order = np.argsort(conjunctions['tca'], kind='stable')
+    return {name: column[order] for name, column in conjunctions.items()}
+
+
+def conjunctionRecords(conjunctions, catalog, ts):
+    # Output columns of a conjunction table
+    return {
+        'satnum1': catalog.satnum[conjunctions['sat1']],
+        'satnum2': catalog.satnum[conjunctions['sat2']],
+        'tcaUtc': np.array(ts.tt_jd(conjunctions['tca']).utc_strftime('%Y-%m-%dT%H:%M:%S.%f'),
+                           dtype=str).reshape(-1),
+        'tca': conjunctions['tca'],
+        'miss': conjunctions['miss'],
+        'relativeSpeed': conjunctions['relativeSpeed'],
+    }
+
+
+def main(argv):
+
+    # Defaults
+    inputFile = 'catalogTest.txt'
+    outputFile = 'conjunctions.csv'
+    fmt = None          # from the output file extension
+    start = '01012020'
+    duration = 1        # one day
+    threshold = THRESHOLD_KM
+    step = STEP_S
+    prefilter = True
+
+    usage = ('conjunctionScreen.py -i <inputFile> -o <outputFile> --format csv|jsonl' +
+             ' --start <mmddyyyy> --duration <days> --threshold <km> --step <seconds>' +
+             ' --nofilter')
+    try:
+        opts, args = getopt.getopt(argv,"hi:o:f:",["ifile=","ofile=","format=","start=",
+                                        "duration=","threshold=","step=","nofilter"])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(usage)
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputFile = arg
+        elif opt in ("-o", "--ofile"):
+            outputFile = arg
+        elif opt in ("-f", "--format"):
+            if arg not in OUTPUT_FORMATS:
+                print('Unknown output format: ', arg)
+                sys.exit(2)
+            fmt = arg
+        elif opt in ['--start']:
+            start = arg
+        elif opt in ['--duration']:
+            duration = float(arg)
+        elif opt in ['--threshold']:
+            threshold = float(arg)
+        elif opt in ['--step']:
+            step = float(arg)
+        elif opt in ['--nofilter']:
+            prefilter = False
+
+    ts = load.timescale()
+    tStart = ts.utc(int(start[4:8]), int(start[0:2]), int(start[2:4])).tt
+    tEnd = tStart + duration
+
+    # One element set per object, the nearest to the middle of the window
+    catalog = loadCatalog(inputFile)
+    print("Read ", len(catalog), "TLEs into catalog")
+    catalog = catalog.subset(ElementSetIndex(catalog).elementSets(tStart + 0.5 * duration))
+    print("Screening", len(catalog), "objects")
+
+    conjunctions = findConjunctions(catalog, tStart, tEnd, ts, threshold, step, prefilter)
+    records = conjunctionRecords(conjunctions, catalog, ts)
+    for k in range(len(records['tca'])):
+        print("Conjunction:", f"{records['satnum1'][k]:6d}", f"{records['satnum2'][k]:6d}",
+              records['tcaUtc'][k], f"{records['miss'][k]:8.3f}",
+              f"{records['relativeSpeed'][k]:7.3f}")
+    with RecordWriter(outputFile, CONJUNCTION_FIELDS, fmt) as writer:
+        writer.writeTable(records)
+    print("Conjunctions:", writer.count)
+    print("Wrote ", outputFile)
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Astronomical-night windows of optical sites
+#
+# An optical or laser site can only observe while the Sun is more than 18
+# degrees below its horizon.  The night intervals of a site are found once
+# per UTC day with skyfield's dark_twilight_day and stored as small .npy files
+# in a directory keyed by the site coordinates and the ephemeris, so later
+# runs read them instead of searching the Sun again.  Pass finding only
+# propagates the grid samples that fall inside a window.
+# Times are TT Julian dates.
+
+import os
+import tempfile
+
+import numpy as np
+
+from skyfield import almanac
+
+DARKNESS_CACHE_DIRNAME = '.darknessCache'
+ASTRONOMICAL_NIGHT = 0    # dark_twilight_day state
+
+
+def siteCachePath(eph, site, cacheDir=None):
+    # Directory holding the night windows of one site
+    if cacheDir is None:
+        cacheDir = DARKNESS_CACHE_DIRNAME
+    ephName = os.path.basename(getattr(eph, 'filename', 'ephemeris'))
+    name = '{:.6f}_{:.6f}_{:.1f}-{}'.format(site.latitude.degrees, site.longitude.degrees,
+                                            site.elevation.m, ephName)
+    return os.path.join(cacheDir, name)
+
+
+def nightIntervals(eph, site, t0, t1):
+    # Astronomical-night intervals (n, 2) of a site between skyfield Times t0
+    # and t1
+    darkness = almanac.dark_twilight_day(eph, site)
+    t, state = almanac.find_discrete(t0, t1, darkness)
+    edges = np.concatenate(([t0.tt], np.atleast_1d(t.tt), [t1.tt]))
+    states = np.concatenate(([darkness(t0)], np.atleast_1d(state)))
+    dark = np.flatnonzero(states == ASTRONOMICAL_NIGHT)
+    return np.column_stack((edges[dark], edges[dark + 1]))
+
+
+def _writeWindows(windows, filename):
+    # Write then rename, so readers never see a partial file
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    handle, tmpFilename = tempfile.mkstemp(dir=directory, suffix='.npy')
+    with os.fdopen(handle, 'wb') as tmpFile:
+        np.save(tmpFile, windows)
+    os.replace(tmpFilename, filename)
+
+
+def dayWindows(eph, site, ts, year, month, day, cacheDir=None):
+    # Night intervals of one UTC day of a site, from the cache if present
+    t0 = ts.utc(year, month, day)
+    filename = os.path.join(siteCachePath(eph, site, cacheDir),
+                            t0.utc_strftime('%Y-%m-%d') + '.npy')
+    if os.path.isfile(filename):
+        return np.load(filename)
+    windows = nightIntervals(eph, site, t0, ts.utc(year, month, day + 1))
+    _writeWindows(windows, filename)
+    return windows
+
+
+def darknessWindows(eph, site, ts, tStart, tEnd, cacheDir=None):
+    # Night intervals (n, 2) of a site between tStart and tEnd, joined across
+    # midnight and clipped to the window
+    year, month, day = ts.tt_jd(tStart).utc[:3]
+    days = []
+    while True:
+        windows = dayWindows(eph, site, ts, year, month, day + len(days), cacheDir)
+        days.append(windows)
+        if ts.utc(year, month, day + len(days)).tt >= tEnd:
+            break
+    windows = np.concatenate(days).reshape(-1, 2)
+    # A night running through midnight is split between two days
+    if len(windows):
+        first = np.flatnonzero(np.append(True, windows[1:, 0] - windows[:-1, 1] > 1e-9))
+        last = np.append(first[1:], len(windows)) - 1
+        windows = np.column_stack((windows[first, 0], windows[last, 1]))
+    windows = np.column_stack((np.maximum(windows[:, 0], tStart),
+                               np.minimum(windows[:, 1], tEnd)))
+    return windows[windows[:, 1] > windows[:, 0]]
+
+
+def darkSamples(windows, tt):
+    # True for the times tt inside one of the windows
+    tt = np.asarray(tt)
+    if not len(windows):
+        return np.zeros(tt.shape, dtype=bool)
+    k = np.searchsorted(windows[:, 0], tt, side='right') - 1
+    return (k >= 0) & (tt <= windows[np.maximum(k, 0), 1])
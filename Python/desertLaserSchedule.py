@@ -6,153 +6,150 @@ import json
 import sys, getopt
 import argparse
 
+import numpy as np
+
 from skyfield import api
 from skyfield.api import EarthSatellite
 from skyfield.api import Topos, load
 from skyfield import almanac
 
-MAXDISTANCE = 1000000000.0
-
-def findVisibility(eph, satellite, site, times, passes, trajectory):
-
-    satellitePasses = []
-    satelliteObservations = []
-    aboveHorizon = False
-    ts = load.timescale()
-    riseTime = 0.
-    setTime = 0.
-    maxEl = 0.
-    maxDistance = 0.
-    minDistance = MAXDISTANCE
-
-    difference = satellite - site
-    topocentric = difference.at(times)
-    geocentric = satellite.at(times)
-
-
-    el, az, distance = topocentric.altaz()
-    
-    illuminated = False
-
-    for i in range(len(el.degrees[:])):
-        time = times[i].tt
-        if el.degrees[i] > 0.0:
-            sunlit = satellite.at(times[i]).is_sunlit(eph)
-            if(sunlit):
-                illuminated = True
-            satelliteObservations.append((satellite.model.satnum, time,
-                                          sunlit,
-                                          distance.km[i], az.degrees[i], el.degrees[i],
-                                          geocentric.position.km[0,i],
-                                          geocentric.position.km[1,i],
-                                          geocentric.position.km[2,i]))
-            if(trajectory):
-                print("Visible: ", f"{satellite.model.satnum:6d}", \
-                    f"{distance.km[i]:10.3f}", f"{az.degrees[i]:7.2f}", f"{el.degrees[i]:7.2f}", \
-                    times[i].tt, 
-                    sunlit,
-                      geocentric.position.km[0,i],
-                      geocentric.position.km[1,i],
-                      geocentric.position.km[2,i])
-            if el.degrees[i] > maxEl:
-                maxEl = el.degrees[i]
-                maxEl_az = az.degrees[i]
-                maxEl_range = distance.km[i]
-            if aboveHorizon == False:
-                # Satellite just rose above horizon
-                riseTime = time
-                riseAz = az.degrees[i]
-            aboveHorizon = True
-            if distance.km[i] < minDistance:
-                minDistance = distance.km[i]
-            if distance.km[i] > maxDistance:
-                maxDistance = distance.km[i]
-        else:
-            if aboveHorizon == True:
-                # Satellite just set
-                setTime = time
-                setAz = az.degrees[i]
-                satellitePasses.append((satellite.model.satnum, \
-                                        riseTime, (setTime-riseTime), \
-                                            illuminated,
-                                        int(maxEl+0.5), int(maxEl_az+0.5),\
-                                        int(maxEl_range), int(riseAz+0.5), \
-                                        int(setAz+0.5), int(minDistance), \
-                                        int(maxDistance)))
-
-
-                if(passes):
-                    print("Pass:    ", f"{satellite.model.satnum:6d}", riseTime, \
-                        f"{1440*(setTime-riseTime):7.2f}", \
-                            illuminated,
-                        int(maxEl+0.5), int(maxEl_az+0.5),\
-                        int(maxEl_range), int(riseAz+0.5), \
-                        int(setAz+0.5), int(minDistance), \
-                        int(maxDistance))
-
-                riseTime = 0.
-                setTime = 0.
-                maxEl = 0.
-                aboveHorizon = False
-                maxDistance = 0.
-                minDistance = MAXDISTANCE
+from catalogCache import loadCatalog
+from illumination import sunPosition, sunlitMask
+from passFinder import concatenatePasses, findPasses, passReduce
+from propagation import propagateCatalog, temeToItrf, temeToGcrs, altAzRange
+from scheduleOutput import OUTPUT_FORMATS, RecordWriter
+from scheduleRecords import concatenateRecords, recordArray, recordDtype
+
+BLOCK_SIZE = 1000    # satellites propagated together
+
+# Output columns of the pass table and of the observation tuples
+PASS_FIELDS = ('satnum', 'riseTime', 'duration', 'illuminated', 'maxEl', 'maxElAz',
+               'maxElRange', 'riseAz', 'setAz', 'minRange', 'maxRange', 'direction')
+OBSERVATION_FIELDS = ('satnum', 'tt', 'sunlit', 'range', 'az', 'el', 'x', 'y', 'z')
+OBSERVATION_DTYPE = recordDtype(dict.fromkeys(OBSERVATION_FIELDS, np.zeros(0)),
+                                OBSERVATION_FIELDS)
+
+def findVisibility(catalog, times, el, az, distance, position, sunlit,
+                   passes, trajectory):
+    # Find passes and observations of a block of catalog entries from their
+    # elevation, azimuth (degrees), range (km) and sunlit mask of shape
+    # (nsat, ntime) and GCRS position (km) of shape (nsat, ntime, 3)
+
+    visible = el > 0.0
+    sat, sample = np.nonzero(visible)
+    tt = times.tt
+    # One compact record per visible sample, ordered by satellite and time
+    observationColumns = {'satnum': catalog.satnum[sat],
+                          'tt': tt[sample],
+                          'sunlit': sunlit[sat, sample],
+                          'range': distance[sat, sample],
+                          'az': az[sat, sample],
+                          'el': el[sat, sample],
+                          'x': position[sat, sample, 0],
+                          'y': position[sat, sample, 1],
+                          'z': position[sat, sample, 2]}
+    satelliteObservations = recordArray(observationColumns, OBSERVATION_FIELDS)
+    if(trajectory):
+        for observation in zip(*[observationColumns[name].tolist()
+                                 for name in OBSERVATION_FIELDS]):
+            print("Visible: ", f"{observation[0]:6d}", \
+                f"{observation[3]:10.3f}", f"{observation[4]:7.2f}", \
+                f"{observation[5]:7.2f}", *observation[1:3], *observation[6:])
+
+    satellitePasses = findPasses(el, az, distance)
+    satellitePasses['satnum'] = catalog.satnum[satellitePasses['sat']]
+    satellitePasses['riseTime'] = tt[satellitePasses['rise']]
+    satellitePasses['duration'] = tt[np.minimum(satellitePasses['set'], len(tt) - 1)] \
+        - satellitePasses['riseTime']
+    # Sunlit at any visible sample of the pass
+    satellitePasses['illuminated'] = passReduce(np.logical_or, sunlit, satellitePasses)
+
+    if(passes):
+        for j in range(len(satellitePasses['sat'])):
+            print("Pass:    ", f"{satellitePasses['satnum'][j]:6d}", \
+                satellitePasses['riseTime'][j], \
+                f"{1440*satellitePasses['duration'][j]:7.2f}", \
+                satellitePasses['illuminated'][j],
+                int(satellitePasses['maxEl'][j]+0.5), \
+                int(satellitePasses['maxElAz'][j]+0.5), \
+                int(satellitePasses['maxElRange'][j]), \
+                int(satellitePasses['riseAz'][j]+0.5), \
+                int(satellitePasses['setAz'][j]+0.5), \
+                int(satellitePasses['minRange'][j]), \
+                int(satellitePasses['maxRange'][j]))
     return satellitePasses, satelliteObservations
 
-def computeSchedule(eph, catalog,groundStation, times, passes, trajectory):
-    passes = []
+def computeSchedule(eph, catalog,groundStation, times, passes, trajectory,
+                    blockSize=BLOCK_SIZE):
+    # Propagate the catalog in blocks of satellites with one batched sgp4
+    # call per time chunk, then extract passes and observations per block.
+    # The Sun is looked up once for the time grid and the Earth shadow is
+    # evaluated for the whole block.  Returns the pass and observation
+    # record arrays and the sunlit mask (nsat, ntime)
+    schedulePasses = []
     observations = []
-    for i in range(len(catalog)):
-        satellitePasses, satelliteObservations = findVisibility(eph, catalog[i],
-            groundStation, times, passes, trajectory)
-        passes.append(satellitePasses)
-        observations.append(satelliteObservations)
-    return passes, observations
-
-def readTLE(tleFilename):
-    # Open TLE filename
-    tleFile = open(tleFilename,'r')
-    print("Opened TLE file: ",tleFilename)
-    # Read TLEs into catalog
-    catalog = []
-
-    line0 = None
-    line1 = None
-    line2 = None
-
-    for line in tleFile:
-        if line[0] == '0':
-            line0 = line
-        elif line[0] == '1':
-            line1 = line
-        elif line[0] == '2':
-            line2 = line
-        else:
-            # Error - TLE lines start with 0, 1 or 2
-            print("Error: line does not start with 0, 1 or 2: ",line)
-
-        if line1 and line2:
-            # Check if object number is same in both line 1 and 2
-            if line1[1:6] == line2[1:6]:
-                catalog.append(EarthSatellite(line1,line2))
-                line1 = None;
-                line2 = None;
-            else:
-                print("Error: Satnumber in line 1 not equal to line 2",line1,line2)
-
-    print("Read ", len(catalog), "TLEs into catalog")
-    return catalog
+    sunlit = np.zeros((len(catalog), len(times)), dtype=bool)
+    for start, blockPasses, blockObservations, blockSunlit in iterSchedule(
+            eph, catalog, groundStation, times, passes, trajectory, blockSize):
+        schedulePasses.append(blockPasses)
+        observations.append(blockObservations)
+        sunlit[start:start + len(blockSunlit)] = blockSunlit
+    passes = recordArray(concatenatePasses(schedulePasses))
+    return passes, concatenateRecords(observations, OBSERVATION_DTYPE), sunlit
+
+def iterSchedule(eph, catalog, groundStation, times, passes, trajectory,
+                 blockSize=BLOCK_SIZE):
+    # Generator of (first catalog row, passes, observations, sunlit mask) of
+    # every block of satellites, so results can be written as they are found
+    sun = sunPosition(eph, times)
+    for start in range(0, len(catalog), blockSize):
+        block = catalog.subset(slice(start, start + blockSize))
+        errors, r, v = propagateCatalog(block, times)
+        rItrf, vItrf = temeToItrf(r, v, times)
+        el, az, distance = altAzRange(rItrf, groundStation)
+        position = temeToGcrs(r, times)
+        blockSunlit = sunlitMask(position, sun)
+        blockPasses, blockObservations = findVisibility(block,
+            times, el, az, distance, position, blockSunlit, passes, trajectory)
+        blockPasses['sat'] += start
+        yield start, blockPasses, blockObservations, blockSunlit
 
 def main(argv):
 
     # Defaults
     inputFile = 'catalogTest.txt'
-    outputFile = 'scheduleTest.txt'
+    outputFile = 'desertLaserSchedule.csv'
     start = "20200601"
     observerLatitude = 0.0
     observerLongitude = 0.0
+    observationsFile = None
+    fmt = None          # from the output file extension
     passes = True
     trajectory = True
 
+    try:
+        opts, args = getopt.getopt(argv,"hi:o:b:f:",["ifile=","ofile=","observations=","format="])
+    except getopt.GetoptError:
+        print('desertLaserSchedule.py -i <inputfile> -o <outputfile>', \
+            ' --observations <observationsFile> --format csv|jsonl')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print('desertLaserSchedule.py -i <inputfile> -o <outputfile>', \
+                ' --observations <observationsFile> --format csv|jsonl')
+            sys.exit()
+        elif opt in ("-i", "--ifile"):
+            inputFile = arg
+        elif opt in ("-o", "--ofile"):
+            outputFile = arg
+        elif opt in ("-b", "--observations"):
+            observationsFile = arg
+        elif opt in ("-f", "--format"):
+            if arg not in OUTPUT_FORMATS:
+                print('Unknown output format: ', arg)
+                sys.exit(2)
+            fmt = arg
+
     ts = api.load.timescale(builtin=True)
     eph = api.load('de421.bsp')
 
@@ -162,13 +159,29 @@ def main(argv):
     times = ts.utc(2020, 6, 1, 18, range(700))
     print("Times: ",times[0], len(times), times[-1])
     
-    catalog = readTLE(inputFile)
-    passes, observations = computeSchedule(eph, catalog, groundStation, times, passes, trajectory)
-    
-    print("Passes:      ",len(passes))
-    print("Observations:",len(passes))
-    # print(json.dumps(passes))
-    # print(json.dumps(observations))
+    catalog = loadCatalog(inputFile)
+    print("Read ", len(catalog), "TLEs into catalog")
+
+    # Passes (and observations) are streamed to the output files block by block
+    passWriter = RecordWriter(outputFile, PASS_FIELDS, fmt)
+    observationWriter = RecordWriter(observationsFile, OBSERVATION_FIELDS, fmt) \
+        if observationsFile else None
+    observationCount = 0
+    try:
+        for start, blockPasses, blockObservations, blockSunlit in iterSchedule(
+                eph, catalog, groundStation, times, passes, trajectory):
+            passWriter.writeTable(blockPasses)
+            observationCount += len(blockObservations)
+            if observationWriter is not None:
+                observationWriter.writeTable(blockObservations)
+    finally:
+        passWriter.close()
+        if observationWriter is not None:
+            observationWriter.close()
+
+    print("Passes:      ",passWriter.count)
+    print("Observations:",observationCount)
+    print("Wrote ", outputFile)
 
 if __name__ == "__main__":
    main(sys.argv[1:])
@@ -1,5 +1,6 @@
 import argparse
-import csv
+
+import numpy as np
 
 from skyfield import api
 from skyfield.api import EarthSatellite
@@ -7,112 +8,90 @@ from skyfield.constants import AU_KM, AU_M
 from skyfield.sgp4lib import TEME_to_ITRF
 from skyfield.api import Topos, load
 
+from catalogCache import loadCatalog
+from catalogExport import exportCSV
+from catalogIndex import ElementSetIndex
+from gridContext import GridContext
+from illumination import sunlitMask
+from propagation import altAzRange, propagatePoints, temeToGcrs, temeToItrf
+from scheduleOutput import RecordWriter
+from scheduleRecords import recordArray
 
-# Read TLE file and write key parameters in CSV format
-def readTLE(tleFilename):
-    # Open TLE filename
-    tleFile = open(tleFilename,'r')
-    # print("Opened TLE file: ",tleFilename)
-    # Read TLEs into catalog
-    catalog = []
-
-    line0 = None
-    line1 = None
-    line2 = None
-
-    for line in tleFile:
-        if line[0] == '0':
-            line0 = line
-        elif line[0] == '1':
-            line1 = line
-        elif line[0] == '2':
-            line2 = line
-        else:
-            # Error - TLE lines start with 0, 1 or 2
-            print("Error: line does not start with 0, 1 or 2: ",line)
-
-        if line1 and line2:
-            # Check if object number is same in both line 1 and 2
-            catalog.append(EarthSatellite(line1,line2))
-            line1 = None;
-            line2 = None;
-    # print("Read ", len(catalog), "TLEs into catalog")
-    return catalog
+EVENT_NAMES = ('rise', 'culminate', 'set')    # skyfield find_events codes
+EVENT_FIELDS = ('satnum', 'event', 'tt', 'range', 'az', 'el', 'sunlit')
 
-def writeSatelliteCSV(catalog, tleCSVFilename):
-    with open(tleCSVFilename, 'w', newline='') as csvfile:
 
-        fieldnames = ['satnum', 'epochyr', 'epochdays', 'jdsatepoch', 'ndot', \
-            'nddot', 'bstar', 'inclination', 'rightascension', 'eccentricity', \
-            'argofperigee', 'meanmotion', 'meananomaly']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for satellite in catalog:
-            writer.writerow({\
-                'satnum':satellite.model.satnum, \
-                'epochyr':satellite.model.epochyr, \
-                'epochdays':satellite.model.epochdays, \
-                'jdsatepoch':satellite.model.jdsatepoch, \
-                'ndot':satellite.model.ndot, \
-                'nddot':satellite.model.nddot, \
-                'bstar':satellite.model.bstar, \
-                'inclination':satellite.model.inclo, \
-                'rightascension':satellite.model.nodeo, \
-                'eccentricity':satellite.model.ecco, \
-                'argofperigee':satellite.model.argpo, \
-                'meananomaly':satellite.model.mo, \
-                'meanmotion':satellite.model.no})
+def getUniqueSats(catalog, tStart, tEnd):
+    # Best element set of every satellite over the window, switching to the
+    # next element set halfway between epochs.  The catalog need not be sorted
+    # (TT vs UTC is irrelevant when choosing element sets)
+    index = ElementSetIndex(catalog)
+    rows, starts, stops = index.windowSegments(tStart.tt, tEnd.tt)
+    ts = tStart.ts
+    return [(catalog.satellite(row), ts.tt_jd(start), ts.tt_jd(stop))
+            for row, start, stop in zip(rows, starts, stops)]
 
-def getUniqueSats(catalog):
-    # Just get the first TLE for each satellite from catalog
-    # Assumes that the TLE are ordered by satellite number
-    uniqueSats = []
-    satnum = 0
-    for sat in catalog:
-        if sat.model.satnum != satnum:
-            uniqueSats.append(sat)
-            satnum = sat.model.satnum
-    return uniqueSats
-
-def computeSchedule(site, catalog, tStart, tEnd):
+def computeSchedule(site, segments):
     tList = []
     eventList = []
-    for sat in catalog:
-        t, events = sat.find_events(desertLaser, tStart, tEnd, altitude_degrees=5)
+    for sat, tStart, tEnd in segments:
+        t, events = sat.find_events(site, tStart, tEnd, altitude_degrees=5)
         tList.append(t)
-        eventList.append(t)
+        eventList.append(events)
     return tList, eventList
 
+def eventTable(segments, site, eph, times, events):
+    # Range (km), azimuth, elevation (degrees) and sunlit flag of every event
+    # of every segment, evaluated together: one sgp4 call per satellite, one
+    # frame rotation and one Sun lookup for all event times.  Returns a record
+    # array ordered like the events (see EVENT_FIELDS)
+    counts = [len(t) for t in times]
+    segment = np.repeat(np.arange(len(segments)), counts)
+    satrecs = [sat.model for sat, start, stop in segments]
+    ts = segments[0][1].ts if segments else load.timescale()
+    tt = np.concatenate([np.atleast_1d(t.tt) for t in times] + [np.zeros(0)])
+    eventTimes = ts.tt_jd(tt)
+    context = GridContext(eventTimes)
+    errors, r, v = propagatePoints(satrecs, segment, eventTimes)
+    rItrf, vItrf = temeToItrf(r, v, eventTimes, context=context)
+    el, az, distance = altAzRange(rItrf, site)
+    position = temeToGcrs(r[np.newaxis], eventTimes, context=context)[0]
+    sunlit = sunlitMask(position, context.bodyPosition(eph, 'sun'))
+    satnum = np.array([satrec.satnum for satrec in satrecs], dtype=np.int64)
+    return recordArray({'satnum': satnum[segment],
+                        'event': np.concatenate([np.asarray(e) for e in events]
+                                                + [np.zeros(0, dtype=np.int8)]),
+                        'tt': tt,
+                        'range': distance,
+                        'az': az,
+                        'el': el,
+                        'sunlit': sunlit}, EVENT_FIELDS)
+
 tleFilename = 'catalogTest.txt'
 tleCSVFilename = 'catalogTest.csv'
 schedFilename = 'catalogSched.csv'
 
-catalog = readTLE(tleFilename)
-writeSatelliteCSV(catalog,tleCSVFilename)
-uniqueSats = getUniqueSats(catalog)
+catalog = loadCatalog(tleFilename)
+exportCSV(catalog,tleCSVFilename)
 
 ts = load.timescale()
 tStart = ts.utc(2020,1,1)
 tEnd = ts.utc(2020,1,4)
 desertLaser = Topos(21.0, 16.5, 100)
+uniqueSats = getUniqueSats(catalog, tStart, tEnd)
 
 eph = load('de421.bsp')
 
-times, events = computeSchedule(desertLaser, uniqueSats, tStart, tEnd)
-for i in range(0,len(times)):
-    satnum = uniqueSats[i].model.satnum
-    difference = uniqueSats[i] - desertLaser
-    t = times[i]
-    sunlit = uniqueSats[i].at(t).is_sunlit(eph)
-    for j in range(0,len(times[i])):
-        topocentric = difference.at(t[j])
-        alt, az, distance = topocentric.altaz()
-        if(sunlit[j]):
-            lit = 1
-        else:
-            lit = 0
-        print(f'{satnum:6}',f'{(t[j]-tStart):8.5f}',
-              f'{distance.km:8.2f}',
-              f'{az.degrees:8.2f}',
-              f'{alt.degrees:8.2f}',
-              lit)
+times, events = computeSchedule(desertLaser, uniqueSats)
+table = eventTable(uniqueSats, desertLaser, eph, times, events)
+for event in table:
+    print(f'{event["satnum"]:6}',f'{(event["tt"]-tStart.tt):8.5f}',
+          f'{event["range"]:8.2f}',
+          f'{event["az"]:8.2f}',
+          f'{event["el"]:8.2f}',
+          int(event["sunlit"]))
+
+with RecordWriter(schedFilename, EVENT_FIELDS) as writer:
+    columns = {name: table[name] for name in EVENT_FIELDS}
+    columns['event'] = np.array(EVENT_NAMES)[table['event']]
+    writer.writeTable(columns)
@@ -1,123 +1,337 @@
 # -*- coding: utf-8 -*-
+import os
 import sys, getopt
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from skyfield import api
 from skyfield.api import EarthSatellite
 from skyfield.api import Topos, load
 
-MAXDISTANCE = 1000000000.0
+from catalogCache import loadCatalog
+from darknessWindows import darkSamples, darknessWindows
+from gridContext import GRID_ARRAYS, GridContext, SiteFrame, gridContext, siteFrame
+from groundSites import readSiteFlags, readSites
+from passFinder import concatenatePasses, findPasses, stitchPasses, takePasses
+from passSearch import searchSites
+from propagation import propagateCatalog, altAzRange
+from scheduleOutput import OUTPUT_FORMATS, PASS_OUTPUT_FIELDS, RecordWriter
+from sharedArrays import attachArray, releaseArray, shareArray
+from visibilityScreen import (ALWAYS_VISIBLE, SOMETIMES_VISIBLE, printScreenSummary,
+                              screenSites)
 
-def findVisibility(satellite, site, times, passes, trajectory):
+BLOCK_SIZE = 1000    # satellites propagated together
+CHUNK_MINUTES = 1440 # grid samples (minutes) propagated together
 
-    satellitePasses = []
-    aboveHorizon = False
-    ts = load.timescale()
-    riseTime = 0.
-    setTime = 0.
-    maxEl = 0.
-    maxDistance = 0.
-    minDistance = MAXDISTANCE
-
-    difference = satellite - site
-    topocentric = difference.at(times)
-    geocentric = satellite.at(times)
-
-    el, az, distance = topocentric.altaz()
-
-    for i in range(len(el.degrees[:])):
-        if el.degrees[i] > 0.0:
-            if(trajectory):
-                print("Visible: ", f"{satellite.model.satnum:6d}", times[i].utc_iso(), \
-                    f"{distance.km[i]:10.3f}", f"{az.degrees[i]:7.2f}", f"{el.degrees[i]:7.2f}", \
-                    times[i], geocentric.position.km[:,i])
-            if el.degrees[i] > maxEl:
-                maxEl = el.degrees[i]
-                maxEl_az = az.degrees[i]
-                maxEl_range = distance.km[i]
-            if aboveHorizon == False:
-                # Satellite just rose above horizon
-                riseTime = times[i]
-                riseAz = az.degrees[i]
-            aboveHorizon = True
-            if distance.km[i] < minDistance:
-                minDistance = distance.km[i]
-            if distance.km[i] > maxDistance:
-                maxDistance = distance.km[i]
-        else:
-            if aboveHorizon == True:
-                # Satellite just set
-                setTime = times[i]
-                setAz = az.degrees[i]
-                if riseAz > 90 and riseAz < 270 and (setAz < 90 or setAz > 270):
-                    direction = 'NB'
-                elif setAz > 90 and setAz < 270 and (riseAz < 90 or riseAz > 270):
-                    direction = 'SB'
-                else:
-                    direction = 'NA'
-                satellitePasses.append((satellite.model.satnum, \
-                                        riseTime, (setTime-riseTime), \
-                                        direction, \
-                                        int(maxEl+0.5), int(maxEl_az+0.5),\
-                                        int(maxEl_range), int(riseAz+0.5), \
-                                        int(setAz+0.5), int(minDistance), \
-                                        int(maxDistance)))
-
-                if(passes):
-                    print("Pass:    ", f"{satellite.model.satnum:6d}", riseTime.utc_iso(), \
-                        f"{1440*(setTime-riseTime):7.2f}", \
-                        direction, \
-                        int(maxEl+0.5), int(maxEl_az+0.5),\
-                        int(maxEl_range), int(riseAz+0.5), \
-                        int(setAz+0.5), int(minDistance), \
-                        int(maxDistance))
-
-                riseTime = 0.
-                setTime = 0.
-                maxEl = 0.
-                aboveHorizon = False
-                maxDistance = 0.
-                minDistance = MAXDISTANCE
+def findVisibility(catalog, times, el, az, distance, passes, trajectory, siteName=None,
+                   keepOpen=False):
+    # Find the passes of a block of catalog entries from their precomputed
+    # elevation, azimuth (degrees) and range (km) of shape (nsat, ntime).
+    # keepOpen: the grid is a chunk of a longer window whose next chunk
+    # starts at its last sample, so passes still up at the end are kept open
+    # and the trajectory of that sample is left to the next chunk
+    site = [] if siteName is None else [siteName]
+
+    if(trajectory):
+        visibleSats, visibleTimes = np.nonzero(el[:, :el.shape[1] - 1] > 0.0 if keepOpen
+                                               else el > 0.0)
+        geocentric = {}
+        for i, j in zip(visibleSats, visibleTimes):
+            if i not in geocentric:
+                geocentric[i] = catalog.satellite(i).at(times)
+            print("Visible: ", *site, f"{catalog.satnum[i]:6d}", times[j].utc_iso(), \
+                f"{distance[i,j]:10.3f}", f"{az[i,j]:7.2f}", f"{el[i,j]:7.2f}", \
+                times[j], geocentric[i].position.km[:,j])
+
+    satellitePasses = passTable(catalog, np.atleast_1d(times.tt), el, az, distance, keepOpen)
+
+    if(passes):
+        printGridPasses(satellitePasses, times, siteName)
+
+    return satellitePasses
+
+def passTable(catalog, tt, el, az, distance, keepOpen=False):
+    # Pass table of a block of catalog entries with satnum, rise time (TT)
+    # and duration (days) from the TT Julian dates of the grid
+    satellitePasses = findPasses(el, az, distance, keepOpen=keepOpen)
+    satellitePasses['satnum'] = catalog.satnum[satellitePasses['sat']]
+    satellitePasses['riseTime'] = tt[satellitePasses['rise']]
+    satellitePasses['duration'] = tt[np.minimum(satellitePasses['set'], len(tt) - 1)] \
+        - satellitePasses['riseTime']
     return satellitePasses
 
-def computeSchedule(catalog,groundStation, times, passes, trajectory):
-    passes = []
-    for i in range(len(catalog)):
-        passes.append(findVisibility(catalog[i],groundStation, times, passes, trajectory))
-    return passes
-
-def readTLE(tleFilename):
-    # Open TLE filename
-    tleFile = open(tleFilename,'r')
-    print("Opened TLE file: ",tleFilename)
-    # Read TLEs into catalog
-    catalog = []
-
-    line0 = None
-    line1 = None
-    line2 = None
-
-    for line in tleFile:
-        if line[0] == '0':
-            line0 = line
-        elif line[0] == '1':
-            line1 = line
-        elif line[0] == '2':
-            line2 = line
+def printGridPasses(satellitePasses, times, siteName=None):
+    riseIso = times[satellitePasses['rise']].utc_iso() if len(satellitePasses['rise']) else []
+    printPasses(satellitePasses, riseIso, None if siteName is None else [siteName] * len(riseIso))
+
+def printPasses(satellitePasses, riseIso, siteNames=None):
+    # siteNames, if given, holds the site name of every pass
+    for k in range(len(riseIso)):
+        site = [] if siteNames is None else [siteNames[k]]
+        print("Pass:    ", *site, f"{satellitePasses['satnum'][k]:6d}", riseIso[k], \
+            f"{1440*satellitePasses['duration'][k]:7.2f}", \
+            satellitePasses['direction'][k], \
+            int(satellitePasses['maxEl'][k]+0.5), int(satellitePasses['maxElAz'][k]+0.5),\
+            int(satellitePasses['maxElRange'][k]), int(satellitePasses['riseAz'][k]+0.5), \
+            int(satellitePasses['setAz'][k]+0.5), int(satellitePasses['minRange'][k]), \
+            int(satellitePasses['maxRange'][k]))
+
+def iterSitesSchedule(catalog, sites, times, passes, trajectory,
+                      blockSize=BLOCK_SIZE, siteNames=None, screen=None, keepOpen=False,
+                      dark=None):
+    # Generator of the pass table of every block of satellites at every site,
+    # in catalog order, so passes can be consumed as they are found.  The
+    # catalog is propagated in blocks with one batched sgp4 call per time
+    # chunk into the Earth-fixed frame and every site uses the same positions.
+    # screen (nsite, nsat) from screenSites drops pairs that cannot have passes.
+    # dark (nsite, ntime) restricts each site to its dark samples; only the
+    # samples dark at some site are propagated
+    search, candidates = searchPairs(catalog, sites, screen)
+    columns = darkColumns(dark)
+
+    for start in range(0, len(candidates), blockSize):
+        rows = candidates[start:start + blockSize]
+        block = catalog.subset(rows)
+        if columns is None:
+            errors, r, v = propagateCatalog(block, times, frame='itrf')
+        elif len(columns):
+            errors, r, v = propagateCatalog(block, times[columns], frame='itrf')
         else:
-            # Error - TLE lines start with 0, 1 or 2
-            print("Error: line does not start with 0, 1 or 2: ",line)
-
-        if line1 and line2:
-            # Check if object number is same in both line 1 and 2
-            if line1[1:6] == line2[1:6]:
-                catalog.append(EarthSatellite(line1,line2))
-                line1 = None;
-                line2 = None;
-            else:
-                print("Error: Satnumber in line 1 not equal to line 2",line1,line2)
-    print("Read ", len(catalog), "TLEs into catalog")
-    return catalog
+            r = np.zeros((len(block), 0, 3))
+        for s, site in enumerate(sites):
+            siteRows = np.flatnonzero(search[s, rows])
+            el, az, distance = gatedGeometry(r[siteRows], site, columns,
+                                             None if dark is None else dark[s])
+            blockPasses = findVisibility(block.subset(siteRows), times, el, az, distance,
+                                         passes, trajectory,
+                                         None if siteNames is None else siteNames[s],
+                                         keepOpen)
+            blockPasses['sat'] = rows[siteRows[blockPasses['sat']]]
+            blockPasses['site'] = np.full(len(blockPasses['sat']), s)
+            yield blockPasses
+
+def darkColumns(dark):
+    # Grid samples dark at one site at least and the samples just after, where
+    # passes cut short by dawn set; None without darkness gating
+    if dark is None:
+        return None
+    anyDark = np.any(dark, axis=0)
+    needed = anyDark.copy()
+    needed[1:] |= anyDark[:-1]
+    return np.flatnonzero(needed)
+
+def gatedGeometry(r, site, columns=None, dark=None):
+    # Elevation, azimuth (degrees) and range (km) over the whole grid from
+    # Earth-fixed positions propagated at the grid samples `columns` only.
+    # The elevation is NaN, never above the horizon, where the site is not
+    # dark, so passes of an optical site begin at dusk and end at dawn
+    if columns is None:
+        return altAzRange(r, site)
+    gated = []
+    for values in altAzRange(r, site):
+        full = np.full((len(r), len(dark)), np.nan)
+        full[:, columns] = values
+        gated.append(full)
+    gated[0][:, ~dark] = np.nan
+    return gated
+
+def searchPairs(catalog, sites, screen=None):
+    # Site/satellite pairs to search (nsite, nsat) and the satellites needed
+    # by at least one site
+    if screen is None:
+        search = np.ones((len(sites), len(catalog)), dtype=bool)
+    else:
+        search = np.asarray(screen) == SOMETIMES_VISIBLE
+    return search, np.flatnonzero(search.any(axis=0))
+
+def releasePasses(pending, carried, horizon, field='rise'):
+    # Closed passes of the tables in pending that rise before horizon and
+    # before every pass still carried open, ordered by rise, site and
+    # satellite, and the passes to hold back for a later chunk.  Passes found
+    # later rise no earlier, so the released tables follow each other in
+    # the order of one table of the whole window
+    pending = [table for table in pending if len(table['sat'])]
+    if not pending:
+        return None, []
+    table = concatenatePasses(pending)
+    for openPasses in carried.values():
+        if len(openPasses[field]):
+            horizon = min(horizon, openPasses[field].min())
+    order = np.lexsort((table['sat'], table['site'], table[field]))
+    ready = table[field][order] < horizon
+    return takePasses(table, order[ready]), [takePasses(table, order[~ready])]
+
+# Shared grid and site frames of a worker process, see _attachWorker
+_worker = {}
+
+def _attachWorker(gridDescriptor, sitesDescriptor):
+    gridBlock, grid = attachArray(gridDescriptor)
+    sitesBlock, axes = attachArray(sitesDescriptor)
+    _worker['blocks'] = (gridBlock, sitesBlock)
+    _worker['context'] = GridContext(None, grid)
+    _worker['frames'] = [SiteFrame(None, siteAxes) for siteAxes in axes]
+
+def _scheduleBlock(block, rows, search, keepOpen=False, dark=None, tt=None):
+    # Pass tables, one per site, of one block of satellites in a worker.  With
+    # darkness gating the shared grid holds the dark samples only and tt is
+    # the whole grid
+    context = _worker['context']
+    columns = darkColumns(dark)
+    if tt is None:
+        tt = context.tt
+    if len(context):
+        errors, r, v = propagateCatalog(block, None, frame='itrf', context=context)
+    else:
+        r = np.zeros((len(block), 0, 3))
+    tables = []
+    for s, frame in enumerate(_worker['frames']):
+        siteRows = np.flatnonzero(search[s])
+        el, az, distance = gatedGeometry(r[siteRows], frame, columns,
+                                         None if dark is None else dark[s])
+        blockPasses = passTable(block.subset(siteRows), tt, el, az, distance,
+                                keepOpen)
+        blockPasses['sat'] = rows[siteRows[blockPasses['sat']]]
+        blockPasses['site'] = np.full(len(blockPasses['sat']), s)
+        tables.append(blockPasses)
+    return tables
+
+def iterParallelSchedule(catalog, sites, times, passes, workers=None,
+                         blockSize=BLOCK_SIZE, siteNames=None, screen=None, keepOpen=False,
+                         dark=None):
+    # Generator of the pass tables of iterSitesSchedule in catalog order, with
+    # the blocks of satellites spread over a pool of worker processes.  The
+    # time grid and site frames are placed in shared memory once instead of
+    # being pickled with every block.  At most two blocks per worker are in
+    # flight, so finished results do not pile up ahead of the consumer
+    search, candidates = searchPairs(catalog, sites, screen)
+    maxInFlight = 2 * (workers or os.cpu_count() or 1)
+    columns = darkColumns(dark)
+    tt = None if dark is None else np.atleast_1d(times.tt)
+    if columns is None:
+        grid = gridContext(times).arrays()
+    elif len(columns):
+        grid = gridContext(times[columns]).arrays()
+    else:
+        grid = np.zeros((len(GRID_ARRAYS), 0))
+    gridBlock, gridDescriptor = shareArray(grid)
+    sitesBlock, sitesDescriptor = shareArray(
+        np.array([siteFrame(site).axes() for site in sites]).reshape(-1, 4, 3))
+    try:
+        with ProcessPoolExecutor(workers, initializer=_attachWorker,
+                                 initargs=(gridDescriptor, sitesDescriptor)) as executor:
+            pending = deque()
+            for start in range(0, len(candidates) + blockSize, blockSize):
+                if start < len(candidates):
+                    rows = candidates[start:start + blockSize]
+                    pending.append(executor.submit(_scheduleBlock, catalog.subset(rows),
+                                                   rows, search[:, rows], keepOpen, dark,
+                                                   tt))
+                while pending and (len(pending) >= maxInFlight or start >= len(candidates)):
+                    for s, blockPasses in enumerate(pending.popleft().result()):
+                        if(passes):
+                            printGridPasses(blockPasses, times,
+                                            None if siteNames is None else siteNames[s])
+                        yield blockPasses
+    finally:
+        releaseArray(gridBlock)
+        releaseArray(sitesBlock)
+
+def iterChunkedSchedule(catalog, sites, ts, date, samples, passes, trajectory, workers=0,
+                        chunkSize=CHUNK_MINUTES, blockSize=BLOCK_SIZE, siteNames=None,
+                        screen=None, darkness=None):
+    # Passes over a grid of `samples` minutes from date (year, month, day)
+    # 0h UTC, computed chunkSize minutes at a time so memory does not grow
+    # with the window.  Consecutive chunks share their boundary sample, so a
+    # pass up at a boundary is found in both and stitched into one.  Rise and
+    # set samples are counted from the start of the window.  Passes come out
+    # ordered by rise, site and satellite whatever the chunk size.  darkness
+    # holds the night windows of every optical site (None for other sites)
+    carried = {}
+    pending = []
+    for offset in range(0, max(samples - 1, 1), chunkSize):
+        stop = min(offset + chunkSize, samples - 1)
+        last = stop >= samples - 1
+        times = ts.utc(*date, 0, range(offset, stop + 1))
+        dark = None
+        if darkness is not None and any(windows is not None for windows in darkness):
+            dark = np.array([np.ones(len(times), dtype=bool) if windows is None
+                             else darkSamples(windows, times.tt) for windows in darkness])
+        if workers and not trajectory:
+            tables = iterParallelSchedule(catalog, sites, times, False, workers, blockSize,
+                                          siteNames, screen, keepOpen=not last, dark=dark)
+        else:
+            tables = iterSitesSchedule(catalog, sites, times, False, trajectory, blockSize,
+                                       siteNames, screen, keepOpen=not last, dark=dark)
+        # Blocks and sites come in the same order in every chunk
+        for i, blockPasses in enumerate(tables):
+            blockPasses['rise'] += offset
+            blockPasses['set'] += offset
+            blockPasses, carried[i] = stitchPasses(carried.get(i), blockPasses, offset,
+                                                   offset + len(times))
+            pending.append(blockPasses)
+        released, pending = releasePasses(pending, carried, np.inf if last else stop)
+        if released is None:
+            continue
+        if(passes):
+            riseIso = ts.tt_jd(released['riseTime']).utc_iso() \
+                if len(released['sat']) else []
+            printPasses(released, riseIso,
+                        None if siteNames is None else
+                        [siteNames[s] for s in released['site']])
+        yield released
+
+def iterRefinedSchedule(catalog, sites, tStart, tEnd, passes, ts=None, siteNames=None,
+                        screen=None, blockSize=BLOCK_SIZE, chunkDays=CHUNK_MINUTES / 1440.0,
+                        darkness=None):
+    # Generator of refined pass tables, one per block of satellites and chunk
+    # of chunkDays of the window: coarse screening with a step sized to each
+    # orbit, shared by all sites, then rise, culmination and set refined to
+    # sub-second accuracy.  Passes up at a chunk boundary are kept open
+    # and stitched to their continuation in the next chunk.  Passes come out
+    # ordered by rise time, site and satellite.  darkness holds the night
+    # windows of every optical site (None for other sites)
+    if ts is None:
+        ts = load.timescale()
+    carried = {}
+    pending = []
+    chunkStart = tStart
+    while chunkStart < tEnd:
+        chunkEnd = min(chunkStart + chunkDays, tEnd)
+        for b, start in enumerate(range(0, len(catalog), blockSize)):
+            rows = np.arange(start, min(start + blockSize, len(catalog)))
+            blockPasses = searchSites(catalog.subset(rows), sites, chunkStart, chunkEnd,
+                                      keepOpen=chunkEnd < tEnd, ts=ts,
+                                      screen=None if screen is None
+                                      else np.asarray(screen)[:, rows], darkness=darkness)
+            blockPasses['sat'] = rows[blockPasses['sat']]
+            blockPasses['satnum'] = catalog.satnum[blockPasses['sat']]
+            blockPasses, carried[b] = stitchPasses(carried.get(b), blockPasses, chunkStart,
+                                                   chunkEnd, ('riseTime', 'setTime'))
+            pending.append(blockPasses)
+        released, pending = releasePasses(pending, carried,
+                                          chunkEnd if chunkEnd < tEnd else np.inf, 'riseTime')
+        if released is not None:
+            if(passes):
+                printRefinedPasses(released, ts, siteNames)
+            yield released
+        chunkStart = chunkEnd
+
+def printRefinedPasses(schedule, ts, siteNames=None):
+    riseIso = ts.tt_jd(schedule['riseTime']).utc_iso(places=1) if len(schedule['sat']) else []
+    printPasses(schedule, riseIso,
+                None if siteNames is None else [siteNames[s] for s in schedule['site']])
+
+def passRecords(schedule, ts, siteNames=None):
+    # Pass table with the UTC rise time and site name added for output
+    records = dict(schedule)
+    records['riseUtc'] = ts.tt_jd(schedule['riseTime']).utc_iso(places=1) \
+        if len(schedule['sat']) else []
+    if siteNames is not None:
+        records['site'] = [siteNames[s] for s in schedule['site']]
+    return records
 
 def main(argv):
 
@@ -130,48 +344,116 @@ def main(argv):
     observerLongitude = 0.0
     passes = True
     trajectory = False
+    refine = False
+    sitesFile = None
+    workers = 0         # serial
+    fmt = None          # from the output file extension
+    chunkSize = CHUNK_MINUTES
+    dark = False        # optical sites from the sites file only
 
     try:
-        opts, args = getopt.getopt(argv,"hi:o:",["ifile=","ofile="])
+        opts, args = getopt.getopt(argv,"hdri:o:s:w:f:c:",["ifile=","ofile=","refine","sites=","workers=","format=",
+                                        "start=","duration=","chunk=","obslat=","obslon=",
+                                        "passes","trajectory","dark"])
     except getopt.GetoptError:
         print('generateSchedule.py -i <inputFile> -o <outputFile>', \
-            ' -start <data> -duration <days>', \
-            ' -obslat <observerLatitude> -obslon <observerLongitude>',\
-            ' -passes -trajectory')
+            ' --start <mmddyyyy> --duration <days> --chunk <minutes>', \
+            ' --obslat <observerLatitude> --obslon <observerLongitude>',\
+            ' --passes --trajectory --refine --sites <sitesFile> --workers <n>', \
+            ' --format csv|jsonl --dark')
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
             print('generateSchedule.py -i <inputFile> -o <outputFile>', \
-                ' -start <mmddyyyy> -duration <hours>', \
-                ' -obslat <observerLatitude> -obslon <observerLongitude>',\
-                ' -passes -trajectory')
+                ' --start <mmddyyyy> --duration <days> --chunk <minutes>', \
+                ' --obslat <observerLatitude> --obslon <observerLongitude>',\
+                ' --passes --trajectory --refine --sites <sitesFile> --workers <n>', \
+                ' --format csv|jsonl --dark')
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputFile = arg
         elif opt in ("-o", "--ofile"):
             outputFile = arg
-        elif opt in ['-start']:
+        elif opt in ['--start']:
             start = arg
-        elif opt in ['-duration']:
-            duration = arg
-        elif opt in ['-obslat']:
-            observerLatitude = arg
-        elif opt in ['-obslon']:
-            observerLongitude = arg
-        elif opt in ['-passes']:
+        elif opt in ['--duration']:
+            duration = float(arg)
+        elif opt in ("-c", "--chunk"):
+            chunkSize = int(arg)
+        elif opt in ['--obslat']:
+            observerLatitude = float(arg)
+        elif opt in ['--obslon']:
+            observerLongitude = float(arg)
+        elif opt in ['--passes']:
             passes = True
-        elif opt in ['-trajectory']:
+        elif opt in ['--trajectory']:
             trajectory = True
+        elif opt in ("-d", "--dark"):
+            dark = True
+        elif opt in ("-r", "--refine"):
+            refine = True
+        elif opt in ("-s", "--sites"):
+            sitesFile = arg
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt in ("-f", "--format"):
+            if arg not in OUTPUT_FORMATS:
+                print('Unknown output format: ', arg)
+                sys.exit(2)
+            fmt = arg
 
-    groundStation = Topos(observerLatitude, observerLongitude)
+    # One propagation serves every site of a sites file
+    if sitesFile:
+        siteNames, sites = readSites(sitesFile)
+        optical = readSiteFlags(sitesFile, 'optical') | dark
+    else:
+        siteNames, sites = None, [Topos(observerLatitude, observerLongitude)]
+        optical = np.array([dark])
 
+    # One sample per minute, propagated chunkSize minutes at a time
     ts = load.timescale()
-    times = ts.utc(int(start[4:8]), int(start[0:2]), int(start[2:4]), 0, range(0,1440*duration))
+    date = (int(start[4:8]), int(start[0:2]), int(start[2:4]))
+    samples = int(round(1440*duration))
+    tStart = ts.utc(*date).tt
+
+    # Optical sites only observe during astronomical night
+    darkness = None
+    if optical.any():
+        eph = load('de421.bsp')
+        darkness = [darknessWindows(eph, site, ts, tStart, tStart + duration)
+                    if isOptical else None for site, isOptical in zip(sites, optical)]
+        for s, windows in enumerate(darkness):
+            if windows is not None:
+                print("Darkness:", s if siteNames is None else siteNames[s], len(windows),
+                      "night windows,", f"{np.sum(windows[:, 1] - windows[:, 0]) / duration:.2f}",
+                      "of the window")
+
+    catalog = loadCatalog(inputFile)
+    print("Read ", len(catalog), "TLEs into catalog")
+
+    # Geometric screening: only pairs that may rise and set are propagated
+    screen = screenSites(catalog, sites, tStart, tStart + duration, ts)
+    printScreenSummary(screen, siteNames)
+    if(passes):
+        for s, i in zip(*np.nonzero(screen == ALWAYS_VISIBLE)):
+            site = [] if siteNames is None else [siteNames[s]]
+            print("Always:  ", *site, f"{catalog.satnum[i]:6d}")
 
-    catalog = readTLE(inputFile)
-    schedule = computeSchedule(catalog, groundStation, times, passes, trajectory)
+    # Pass tables are streamed to the output file block by block
+    if refine:
+        schedule = iterRefinedSchedule(catalog, sites, tStart, tStart + duration, passes, ts,
+                                       siteNames, screen, chunkDays=chunkSize / 1440.0,
+                                       darkness=darkness)
+    else:
+        schedule = iterChunkedSchedule(catalog, sites, ts, date, samples, passes, trajectory,
+                                       workers, chunkSize, siteNames=siteNames, screen=screen,
+                                       darkness=darkness)
+    with RecordWriter(outputFile, PASS_OUTPUT_FIELDS, fmt) as writer:
+        for blockPasses in schedule:
+            writer.writeTable(passRecords(blockPasses, ts, siteNames))
 
-    print("Schedule length:",len(schedule))
+    print("Schedule length:",writer.count)
+    print("Wrote ", outputFile)
 
 if __name__ == "__main__":
    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# Time grid and site contexts shared by every satellite
+#
+# The sgp4 time split, the Earth rotation taking TEME into the Earth-fixed
+# frame, the TEME to GCRS and GCRS to ITRS rotation matrices and the Sun/Moon
+# positions only depend on the time grid, and the topocentric frame only on
+# the site.  They are computed once and kept in small LRU caches keyed by the
+# grid contents and the site coordinates, so every block of satellites, every
+# site and every script step evaluated on the same grid reuses them.
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from sgp4.api import jday
+from skyfield.constants import DAY_S
+from skyfield.framelib import itrs
+from skyfield.sgp4lib import TEME, theta_GMST1982
+
+GRID_CACHE_SIZE = 8     # time grids kept
+SITE_CACHE_SIZE = 64    # site frames kept
+
+# Arrays of a grid context, e.g. to place them in shared memory
+GRID_ARRAYS = ('tt', 'jd', 'fraction', 'cosTheta', 'sinTheta', 'omega')
+SITE_AXES = ('xyz', 'east', 'north', 'up')
+
+_gridCache = OrderedDict()
+_siteCache = OrderedDict()
+
+
+def sgp4Times(times):
+    # Split a skyfield Time into the UTC (jd, fraction) pair sgp4 expects,
+    # from its UTC calendar date so leap seconds are handled by skyfield
+    year, month, day, hour, minute, second = times.utc
+    jd, fraction = jday(year, month, day, hour, minute, second)
+    return np.atleast_1d(jd), np.atleast_1d(fraction)
+
+
+class GridContext:
+
+    def __init__(self, times, arrays=None):
+        # arrays, if given, holds the GRID_ARRAYS of the grid computed
+        # elsewhere (times may then be None)
+        self.times = times
+        self._temeToGcrs = None
+        self._gcrsToItrf = None
+        self._bodies = {}
+        if arrays is not None:
+            for name, array in zip(GRID_ARRAYS, arrays):
+                setattr(self, name, array)
+            return
+        self.tt = np.atleast_1d(times.tt)
+        self.jd, self.fraction = sgp4Times(times)
+        theta, thetaDot = theta_GMST1982(np.atleast_1d(times.whole),
+                                         np.atleast_1d(times.ut1_fraction))
+        self.cosTheta = np.cos(theta)
+        self.sinTheta = np.sin(theta)
+        self.omega = thetaDot / DAY_S
+
+    def arrays(self):
+        # GRID_ARRAYS stacked, shape (len(GRID_ARRAYS), ntime)
+        return np.stack([getattr(self, name) for name in GRID_ARRAYS])
+
+    def __len__(self):
+        return len(self.jd)
+
+    def temeToGcrs(self):
+        # TEME to GCRS rotation matrices, shape (3, 3, ntime)
+        if self._temeToGcrs is None:
+            self._temeToGcrs = TEME.rotation_at(self.times)
+        return self._temeToGcrs
+
+    def gcrsToItrf(self):
+        # GCRS to ITRS rotation matrices (polar motion neglected), shape
+        # (3, 3, ntime)
+        if self._gcrsToItrf is None:
+            self._gcrsToItrf = itrs.rotation_at(self.times)
+        return self._gcrsToItrf
+
+    def bodyPosition(self, eph, name):
+        # Geocentric GCRS position (km) of an ephemeris body such as 'sun' or
+        # 'moon', shape (ntime, 3)
+        key = (getattr(eph, 'filename', id(eph)), name)
+        if key not in self._bodies:
+            position = (eph[name] - eph['earth']).at(self.times).position.km
+            self._bodies[key] = position.T.reshape(-1, 3)
+        return self._bodies[key]
+
+
+class SiteFrame:
+
+    def __init__(self, site, axes=None):
+        # axes, if given, holds the SITE_AXES of the site computed elsewhere
+        if axes is not None:
+            for name, axis in zip(SITE_AXES, axes):
+                setattr(self, name, axis)
+            return
+        lat = site.latitude.radians
+        lon = site.longitude.radians
+        sinLat, cosLat = np.sin(lat), np.cos(lat)
+        sinLon, cosLon = np.sin(lon), np.cos(lon)
+        self.xyz = site.itrs_xyz.km
+        self.east = np.array([-sinLon, cosLon, 0.0])
+        self.north = np.array([-sinLat * cosLon, -sinLat * sinLon, cosLat])
+        self.up = np.array([cosLat * cosLon, cosLat * sinLon, sinLat])
+
+    def axes(self):
+        # SITE_AXES stacked, shape (4, 3)
+        return np.stack([getattr(self, name) for name in SITE_AXES])
+
+
+def _cached(cache, key, size, build):
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = build()
+        if len(cache) > size:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return value
+
+
+def gridContext(times):
+    # Shared context of a time grid, built on first use
+    tt = np.ascontiguousarray(np.atleast_1d(times.tt))
+    key = hashlib.sha1(tt.tobytes()).hexdigest()
+    return _cached(_gridCache, key, GRID_CACHE_SIZE, lambda: GridContext(times))
+
+
+def siteFrame(site):
+    # Shared topocentric frame of a skyfield Topos, built on first use
+    if isinstance(site, SiteFrame):
+        return site
+    key = (site.latitude.radians, site.longitude.radians, site.elevation.m)
+    return _cached(_siteCache, key, SITE_CACHE_SIZE, lambda: SiteFrame(site))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Ground sites for multi-sensor schedules
+#
+# A sites file is CSV with the header name,latitude,longitude,elevation
+# (degrees north, degrees east, metres) and one sensor per row.  Optional
+# columns flag sites, e.g. optical=1 for sensors that only observe at night.
+
+import csv
+
+import numpy as np
+
+from skyfield.api import Topos
+
+
+def readSites(sitesFilename):
+    # Names and skyfield Topos of the sites of a sites file
+    names = []
+    sites = []
+    with open(sitesFilename, newline='') as sitesFile:
+        for row in csv.DictReader(sitesFile, skipinitialspace=True):
+            names.append(row['name'])
+            sites.append(Topos(latitude_degrees=float(row['latitude']),
+                               longitude_degrees=float(row['longitude']),
+                               elevation_m=float(row.get('elevation') or 0.0)))
+    return names, sites
+
+
+def readSiteFlags(sitesFilename, column):
+    # True for the sites of a sites file with a true value (1, yes, true) in
+    # an optional column such as 'optical', False if the column is absent
+    flags = []
+    with open(sitesFilename, newline='') as sitesFile:
+        for row in csv.DictReader(sitesFile, skipinitialspace=True):
+            flags.append((row.get(column) or '').strip().lower() in ('1', 'yes', 'true'))
+    return np.array(flags, dtype=bool)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Batched Earth-shadow evaluation
+#
+# The Sun position is computed once per sample of the time grid and the
+# shadow test is evaluated for every satellite and sample at once from the
+# GCRS positions (nsat, ntime, 3), instead of one is_sunlit call (with its
+# own propagation and Sun lookup) per visible sample.
+
+import numpy as np
+
+from skyfield.constants import ERAD
+
+from gridContext import gridContext
+
+SUNLIT, PENUMBRA, UMBRA = 0, 1, 2
+
+EARTH_RADIUS_KM = ERAD / 1000.0
+SUN_RADIUS_KM = 696000.0
+
+
+def sunPosition(eph, times):
+    # Geocentric GCRS position of the Sun (km), shape (ntime, 3), computed
+    # once per time grid
+    return gridContext(times).bodyPosition(eph, 'sun')
+
+
+def shadowState(position, sun):
+    # SUNLIT, PENUMBRA or UMBRA from the conical shadow model: the apparent
+    # discs of the Sun and the Earth seen from the satellite
+    toSun = sun - position
+    sunDistance = np.linalg.norm(toSun, axis=-1)
+    earthDistance = np.linalg.norm(position, axis=-1)
+    sunRadius = np.arcsin(SUN_RADIUS_KM / sunDistance)
+    earthRadius = np.arcsin(np.minimum(EARTH_RADIUS_KM / earthDistance, 1.0))
+    separation = np.arccos(np.clip(np.sum(toSun * -position, axis=-1)
+                                   / (sunDistance * earthDistance), -1.0, 1.0))
+    return np.where(separation < earthRadius - sunRadius, UMBRA,
+                    np.where(separation < earthRadius + sunRadius, PENUMBRA, SUNLIT)).astype(np.uint8)
+
+
+def sunlitMask(position, sun):
+    # True where any part of the Sun is visible from the satellite (sunlit or
+    # penumbra), shape (..., ntime)
+    return shadowState(position, sun) != UMBRA
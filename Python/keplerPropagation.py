@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Vectorized two-body propagation of state vectors
+#
+# Inertial state vectors (n, 6) in km and km/s are reduced to perifocal
+# elements once and propagated together over a whole time grid by solving
+# Kepler's equation for every object and time at once.  The orbit is kept as
+# its perifocal unit vectors P (periapsis), Q and W (angular momentum), so
+# circular and equatorial orbits need no special cases.  Optionally the
+# secular J2 drift of the node, periapsis and mean anomaly is added.
+# Only bound orbits are propagated; escaping objects give NaN.
+
+import numpy as np
+
+MU_KM3_S2 = 398600.4418        # Earth GM, as used by poliastro
+EARTH_RADIUS_KM = 6378.1366
+J2 = 1.08262668e-3
+
+KEPLER_TOLERANCE = 1e-12       # rad
+KEPLER_ITERATIONS = 30
+CIRCULAR_ECCENTRICITY = 1e-10  # below this periapsis is the initial position
+DEFAULT_CHUNK_SIZE = 360       # time samples evaluated together
+
+
+def perifocalElements(states, mu=MU_KM3_S2):
+    # Semi-major axis (km), eccentricity, mean motion (rad/s), mean anomaly
+    # (rad) and perifocal unit vectors P, Q, W (n, 3) of state vectors (n, 6)
+    states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+    r, v = states[:, :3], states[:, 3:]
+    rNorm = np.linalg.norm(r, axis=1)
+    h = np.cross(r, v)
+    W = h / np.linalg.norm(h, axis=1)[:, np.newaxis]
+    a = 1.0 / (2.0 / rNorm - np.sum(v * v, axis=1) / mu)
+    eVector = np.cross(v, h) / mu - r / rNorm[:, np.newaxis]
+    e = np.linalg.norm(eVector, axis=1)
+    circular = e < CIRCULAR_ECCENTRICITY
+    P = np.where(circular[:, np.newaxis], r / rNorm[:, np.newaxis],
+                 eVector / np.where(circular, 1.0, e)[:, np.newaxis])
+    Q = np.cross(W, P)
+    a = np.where((a > 0.0) & (e < 1.0), a, np.nan)
+    n = np.sqrt(mu / a ** 3)
+    # Eccentric anomaly from e cos E = 1 - r/a and e sin E = r.v / sqrt(mu a)
+    E = np.where(circular, 0.0,
+                 np.arctan2(np.sum(r * v, axis=1) / np.sqrt(mu * a), 1.0 - rNorm / a))
+    return a, e, n, E - e * np.sin(E), P, Q, W
+
+
+def solveKepler(M, e):
+    # Eccentric anomaly from mean anomaly and eccentricity (broadcast),
+    # Newton iterations on all values at once
+    M = np.remainder(M + np.pi, 2.0 * np.pi) - np.pi
+    E = np.where(e < 0.8, M, np.pi * np.sign(M))
+    for iteration in range(KEPLER_ITERATIONS):
+        step = (E - e * np.sin(E) - M) / (1.0 - e * np.cos(E))
+        E = E - step
+        if not np.nanmax(np.abs(step), initial=0.0) > KEPLER_TOLERANCE:
+            break
+    return E
+
+
+def j2Rates(a, e, n, W, mu=MU_KM3_S2):
+    # Secular rates (rad/s) of the node, argument of periapsis and mean
+    # anomaly under J2
+    cosI = W[:, 2]
+    sinI2 = 1.0 - cosI * cosI
+    p = a * (1.0 - e * e)
+    factor = 1.5 * J2 * (EARTH_RADIUS_KM / p) ** 2 * n
+    nodeRate = -factor * cosI
+    periapsisRate = factor * (2.0 - 2.5 * sinI2)
+    meanAnomalyRate = n + factor * np.sqrt(1.0 - e * e) * (1.0 - 1.5 * sinI2)
+    return nodeRate, periapsisRate, meanAnomalyRate
+
+
+def meanSemiMajorAxis(states, a, e, W, mu=MU_KM3_S2):
+    # Semi-major axis (km) of the mean orbit under J2: the osculating value
+    # swings by several km around the orbit, which would make the mean motion
+    # and the along-track position drift.  The mean orbit has the energy of
+    # the state including the J2 potential, less the orbit-averaged J2 term
+    r = states[:, :3]
+    rNorm = np.linalg.norm(r, axis=1)
+    sinLatitude2 = (r[:, 2] / rNorm) ** 2
+    cosI = W[:, 2]
+    j2Term = mu * J2 * EARTH_RADIUS_KM ** 2
+    energy = -mu / (2.0 * a) + j2Term * (1.5 * sinLatitude2 - 0.5) / rNorm ** 3
+    meanA = a
+    for iteration in range(3):
+        average = j2Term * (1.0 - 1.5 * (1.0 - cosI * cosI)) \
+            / (2.0 * meanA ** 3 * (1.0 - e * e) ** 1.5)
+        meanA = -mu / (2.0 * (energy + average))
+    return meanA
+
+
+def _rotateZ(vectors, angle):
+    # Rotate vectors (..., 3) about the z axis by angle (...)
+    cosA, sinA = np.cos(angle), np.sin(angle)
+    x, y = vectors[..., 0], vectors[..., 1]
+    return np.stack((x * cosA - y * sinA, x * sinA + y * cosA, vectors[..., 2]), axis=-1)
+
+
+def propagateStates(states, dt, j2=False, mu=MU_KM3_S2, chunkSize=DEFAULT_CHUNK_SIZE):
+    # Propagate state vectors (n, 6) by every time offset dt (ntime,) in
+    # seconds.  Returns states (n, ntime, 6) in the same inertial frame,
+    # whose z axis is taken as the Earth's pole when j2
+    with np.errstate(invalid='ignore'):
+        return _propagateStates(states, dt, j2, mu, chunkSize)
+
+
+def _propagateStates(states, dt, j2, mu, chunkSize):
+    a, e, n, M0, P, Q, W = perifocalElements(states, mu)
+    dt = np.atleast_1d(np.asarray(dt, dtype=np.float64))
+    if j2:
+        a = meanSemiMajorAxis(np.atleast_2d(states), a, e, W, mu)
+        n = np.sqrt(mu / a ** 3)
+        nodeRate, periapsisRate, meanAnomalyRate = j2Rates(a, e, n, W, mu)
+    else:
+        nodeRate = periapsisRate = np.zeros(len(a))
+        meanAnomalyRate = n
+    b = a * np.sqrt(1.0 - e * e)
+
+    result = np.empty((len(a), len(dt), 6))
+    for start in range(0, len(dt), chunkSize):
+        t = dt[np.newaxis, start:start + chunkSize]
+        E = solveKepler(M0[:, np.newaxis] + meanAnomalyRate[:, np.newaxis] * t,
+                        e[:, np.newaxis])
+        cosE, sinE = np.cos(E), np.sin(E)
+        Edot = meanAnomalyRate[:, np.newaxis] / (1.0 - e[:, np.newaxis] * cosE)
+        x = (a[:, np.newaxis] * (cosE - e[:, np.newaxis]))[..., np.newaxis]
+        y = (b[:, np.newaxis] * sinE)[..., np.newaxis]
+        xDot = (-a[:, np.newaxis] * sinE * Edot)[..., np.newaxis]
+        yDot = (b[:, np.newaxis] * cosE * Edot)[..., np.newaxis]
+        if j2:
+            # Apsides turn in the orbit plane, the plane turns about the pole
+            periapsis = periapsisRate[:, np.newaxis] * t
+            cosW = np.cos(periapsis)[..., np.newaxis]
+            sinW = np.sin(periapsis)[..., np.newaxis]
+            node = nodeRate[:, np.newaxis] * t
+            p = _rotateZ(cosW * P[:, np.newaxis] + sinW * Q[:, np.newaxis], node)
+            q = _rotateZ(cosW * Q[:, np.newaxis] - sinW * P[:, np.newaxis], node)
+            w = _rotateZ(np.broadcast_to(W[:, np.newaxis], p.shape), node)
+            r = x * p + y * q
+            v = xDot * p + yDot * q + periapsisRate[:, np.newaxis, np.newaxis] * np.cross(w, r) \
+                + nodeRate[:, np.newaxis, np.newaxis] * np.cross([0.0, 0.0, 1.0], r)
+        else:
+            r = x * P[:, np.newaxis] + y * Q[:, np.newaxis]
+            v = xDot * P[:, np.newaxis] + yDot * Q[:, np.newaxis]
+        result[:, start:start + chunkSize, :3] = r
+        result[:, start:start + chunkSize, 3:] = v
+    return result
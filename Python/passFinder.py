@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Vectorized pass extraction
+#
+# Passes are found for a whole block of satellites at once from elevation,
+# azimuth and range arrays of shape (nsat, ntime).  Rise and set samples come
+# from edge detection on the above-horizon mask, and the per-pass maxima,
+# minima and directions are computed with ufunc.reduceat over the flattened
+# samples instead of walking every sample in Python.
+
+import numpy as np
+
+PASS_FIELDS = ('sat', 'rise', 'set', 'maxEl', 'maxElAz', 'maxElRange',
+               'riseAz', 'setAz', 'minRange', 'maxRange', 'direction')
+
+
+def passDirection(riseAz, setAz):
+    # 'NB' northbound, 'SB' southbound or 'NA' from rise and set azimuths
+    riseSouth = (riseAz > 90) & (riseAz < 270)
+    setSouth = (setAz > 90) & (setAz < 270)
+    riseNorth = (riseAz < 90) | (riseAz > 270)
+    setNorth = (setAz < 90) | (setAz > 270)
+    return np.where(riseSouth & setNorth, 'NB',
+                    np.where(setSouth & riseNorth, 'SB', 'NA'))
+
+
+def passEdges(visible, keepOpen=False):
+    # Satellite row, first visible sample and first sample after the pass
+    # (ntime if the pass is still in progress at the end of the grid)
+    nsat, ntime = visible.shape
+    padded = np.zeros((nsat, ntime + 2), dtype=bool)
+    padded[:, 1:-1] = visible
+    riseSat, rise = np.nonzero(~padded[:, :-2] & padded[:, 1:-1])
+    setSat, set_ = np.nonzero(padded[:, :-1] & ~padded[:, 1:])
+    if not keepOpen:
+        closed = set_ < ntime
+        riseSat, rise, set_ = riseSat[closed], rise[closed], set_[closed]
+    return riseSat, rise, set_
+
+
+def findPasses(el, az, distance, horizon=0.0, keepOpen=False):
+    # Pass table (dict of equal-length arrays, see PASS_FIELDS) for
+    # elevation/azimuth in degrees and range in km of shape (nsat, ntime).
+    # Passes still above the horizon at the end of the grid are dropped unless
+    # keepOpen, in which case their set azimuth is NaN
+    el = np.atleast_2d(el)
+    az = np.atleast_2d(az)
+    distance = np.atleast_2d(distance)
+    nsat, ntime = el.shape
+
+    sat, rise, set_ = passEdges(el > horizon, keepOpen)
+    if not len(sat):
+        return emptyPasses()
+
+    table = {'sat': sat, 'rise': rise, 'set': set_}
+    maxEl = passReduce(np.maximum, el, table)
+    minRange = passReduce(np.minimum, distance, table)
+    maxRange = passReduce(np.maximum, distance, table)
+
+    # First sample of each pass that reaches the maximum elevation
+    first = sat * ntime + rise
+    last = sat * ntime + set_
+    elFlat = el.ravel()
+    lengths = last - first
+    offsets = np.cumsum(lengths) - lengths
+    passOf = np.repeat(np.arange(len(first)), lengths)
+    samples = first[passOf] + np.arange(len(passOf)) - offsets[passOf]
+    atMax = np.where(elFlat[samples] == maxEl[passOf], samples, len(elFlat))
+    culmination = np.minimum.reduceat(atMax, offsets)
+
+    azFlat = az.ravel()
+    riseAz = azFlat[first]
+    setAz = np.where(set_ < ntime, azFlat[np.minimum(last, azFlat.size - 1)], np.nan)
+
+    return {
+        'sat': sat,
+        'rise': rise,
+        'set': set_,
+        'maxEl': maxEl,
+        'maxElAz': azFlat[culmination],
+        'maxElRange': distance.ravel()[culmination],
+        'riseAz': riseAz,
+        'setAz': setAz,
+        'minRange': minRange,
+        'maxRange': maxRange,
+        'direction': passDirection(riseAz, setAz),
+    }
+
+
+def passReduce(ufunc, values, table):
+    # Reduce per-sample values of shape (nsat, ntime) over the samples of each
+    # pass of the table, e.g. passReduce(np.logical_or, sunlit, passes)
+    values = np.atleast_2d(values)
+    ntime = values.shape[1]
+    if not len(table['sat']):
+        return np.zeros(0, dtype=values.dtype)
+    # Flattened sample ranges [first, last) of each pass.  A sentinel sample
+    # is appended so reduceat never indexes past the end
+    first = table['sat'] * ntime + table['rise']
+    last = table['sat'] * ntime + table['set']
+    flat = np.append(values.ravel(), np.zeros(1, dtype=values.dtype))
+    return ufunc.reduceat(flat, np.column_stack((first, last)).ravel())[::2]
+
+
+def emptyPasses():
+    passes = {name: np.zeros(0, dtype=np.int64) for name in ('sat', 'rise', 'set')}
+    passes.update({name: np.zeros(0) for name in PASS_FIELDS[3:-1]})
+    passes['direction'] = np.zeros(0, dtype='<U2')
+    return passes
+
+
+def takePasses(table, rows):
+    # Rows (indices or mask) of a pass table
+    return {name: column[rows] for name, column in table.items()}
+
+
+def joinPasses(head, tail):
+    # Passes continuing from one chunk of a time window into the next: row i
+    # of head is still up at the end of its chunk and row i of tail is the
+    # same pass in progress at the start of the next chunk.  Works on grid
+    # (rise/set samples) and refined (riseTime/setTime) pass tables
+    joined = {name: np.array(column, copy=True) for name, column in tail.items()}
+    for name in ('rise', 'riseTime', 'riseAz'):
+        if name in head:
+            joined[name] = head[name]
+    # The culmination is the higher of the two halves, the earlier on ties
+    earlier = head['maxEl'] >= tail['maxEl']
+    for name in ('maxEl', 'maxElAz', 'maxElRange', 'culminationTime'):
+        if name in head:
+            joined[name] = np.where(earlier, head[name], tail[name])
+    joined['minRange'] = np.fmin(head['minRange'], tail['minRange'])
+    joined['maxRange'] = np.fmax(head['maxRange'], tail['maxRange'])
+    if 'illuminated' in head:
+        joined['illuminated'] = head['illuminated'] | tail['illuminated']
+    if 'setTime' in tail:
+        joined['duration'] = tail['setTime'] - head['riseTime']
+    elif 'duration' in tail:
+        joined['duration'] = tail['riseTime'] + tail['duration'] - head['riseTime']
+    joined['direction'] = passDirection(joined['riseAz'], joined['setAz'])
+    return joined
+
+
+def _passKeys(table):
+    # One integer per site/satellite pair of the passes
+    key = np.asarray(table['sat'], dtype=np.int64)
+    if 'site' in table:
+        key = key + (np.asarray(table['site'], dtype=np.int64) << 32)
+    return key
+
+
+def stitchPasses(carried, table, start, end, fields=('rise', 'set')):
+    # Stitch the passes of one chunk of a time window to those carried over
+    # open from the previous chunk.  Consecutive chunks share their boundary
+    # sample (or time), so a pass up at the boundary ends at `start` in the
+    # previous chunk and rises at `start` in this one.  Returns the closed
+    # passes and the passes still up at `end`, to be carried to the next
+    # chunk, both ordered by site, satellite and rise
+    riseField, setField = fields
+    if carried is not None and len(carried['sat']):
+        continuing = np.flatnonzero(table[riseField] == start)
+        continuingKeys = _passKeys(table)[continuing]
+        carriedKeys = _passKeys(carried)
+        match = np.minimum(np.searchsorted(continuingKeys, carriedKeys),
+                           max(len(continuing) - 1, 0))
+        matched = np.zeros(len(carriedKeys), dtype=bool)
+        if len(continuing):
+            matched = continuingKeys[match] == carriedKeys
+        rows = continuing[match[matched]]
+        rest = np.ones(len(table['sat']), dtype=bool)
+        rest[rows] = False
+        # Carried passes without a continuation (e.g. a failed propagation)
+        # end at the boundary
+        table = concatenatePasses([takePasses(carried, ~matched),
+                                   joinPasses(takePasses(carried, matched),
+                                              takePasses(table, rows)),
+                                   takePasses(table, rest)])
+        order = np.lexsort((table[riseField], _passKeys(table)))
+        table = takePasses(table, order)
+    isOpen = table[setField] >= end
+    return takePasses(table, ~isOpen), takePasses(table, isOpen)
+
+
+def concatenatePasses(tables):
+    # Join pass tables, e.g. of successive blocks of satellites
+    tables = list(tables)
+    if not tables:
+        return emptyPasses()
+    return {name: np.concatenate([table[name] for table in tables]) for name in tables[0]}
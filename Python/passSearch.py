@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# Adaptive coarse-to-fine pass search
+#
+# Element sets are grouped by a coarse time step sized to their orbital period
+# and each group is screened with one batched propagation over its own coarse
+# grid.  Culminations are bracketed by sign changes of the elevation rate,
+# range extremes by sign changes of the range rate and rise/set by sign
+# changes of the elevation above the horizon; only those brackets are refined,
+# by vectorized bisection, to sub-second accuracy.  Sites with darkness
+# windows only see passes inside them: dusk and dawn are exact rise and set
+# times and only crossings of the horizon in the dark are bisected.
+# Times are TT Julian dates.
+
+import numpy as np
+
+from skyfield.api import load
+from skyfield.constants import DAY_S
+
+from darknessWindows import darkSamples
+from gridContext import GridContext, siteFrame
+from passFinder import passDirection
+from propagation import (altAzRange, elevationRate, propagateCatalog,
+                         propagatePoints, satrecList, temeToItrf)
+from visibilityScreen import SOMETIMES_VISIBLE
+
+STEPS_PER_ORBIT = 20    # coarse samples per revolution
+BASE_STEP_S = 30.0      # coarse steps are BASE_STEP_S * 2**level
+MAX_STEP_LEVEL = 5      # longest coarse step 960 s
+TOLERANCE_S = 0.1       # rise, culmination and set accuracy
+
+REFINED_PASS_FIELDS = ('sat', 'riseTime', 'culminationTime', 'setTime', 'duration',
+                       'maxEl', 'maxElAz', 'maxElRange', 'riseAz', 'setAz',
+                       'minRange', 'maxRange', 'direction')
+
+
+def coarseSteps(catalog, stepsPerOrbit=STEPS_PER_ORBIT):
+    # Coarse step (s) of every element set, a power of two multiple of
+    # BASE_STEP_S of at most 1/stepsPerOrbit of the orbital period
+    period = 2.0 * np.pi / np.asarray(catalog.meanMotion) * 60.0
+    level = np.floor(np.log2(np.maximum(period / stepsPerOrbit / BASE_STEP_S, 1.0)))
+    return BASE_STEP_S * 2.0 ** np.minimum(level, MAX_STEP_LEVEL)
+
+
+def rangeRate(rItrf, vItrf, site):
+    # Rate of change of the range (km/s) from the site
+    d = rItrf - siteFrame(site).xyz
+    return np.sum(d * vItrf, axis=-1) / np.sqrt(np.sum(d * d, axis=-1))
+
+
+def pointGeometry(satrecs, site, ts, rows, tt):
+    # Elevation, azimuth (degrees), range (km), elevation rate (degrees/s) and
+    # range rate (km/s) of satrecs[rows[k]] at TT Julian date tt[k]
+    if not len(rows):
+        empty = np.zeros(0)
+        return empty, empty, empty, empty, empty
+    # Scattered refinement times are used once, so they bypass the grid cache
+    times = ts.tt_jd(tt)
+    errors, r, v = propagatePoints(satrecs, rows, times)
+    rItrf, vItrf = temeToItrf(r, v, times, context=GridContext(times))
+    el, az, distance = altAzRange(rItrf, site)
+    return el, az, distance, elevationRate(rItrf, vItrf, site), rangeRate(rItrf, vItrf, site)
+
+
+def bisect(function, rows, lo, hi, tolerance=TOLERANCE_S, positiveLo=None):
+    # Vectorized bisection of brackets [lo, hi] (TT Julian dates) in which
+    # function(rows, tt) > 0 changes between lo and hi.  positiveLo, the
+    # sign at lo, is evaluated unless already known (e.g. from the coarse
+    # grid).  Each iteration only evaluates the brackets still wider than
+    # tolerance (s)
+    if not len(rows):
+        return lo
+    rows = np.asarray(rows)
+    lo = np.array(lo, dtype=np.float64)
+    hi = np.array(hi, dtype=np.float64)
+    if positiveLo is None:
+        positiveLo = function(rows, lo) > 0
+    active = np.flatnonzero((hi - lo) * DAY_S > tolerance)
+    while len(active):
+        mid = 0.5 * (lo[active] + hi[active])
+        sameSide = (function(rows[active], mid) > 0) == positiveLo[active]
+        lo[active[sameSide]] = mid[sameSide]
+        hi[active[~sameSide]] = mid[~sameSide]
+        active = active[(hi[active] - lo[active]) * DAY_S > tolerance]
+    return 0.5 * (lo + hi)
+
+
+def _sequenceBrackets(sat, tt, above):
+    # Brackets between consecutive points of the same satellite (points sorted
+    # by satellite and time) where the above-horizon state changes
+    change = (sat[1:] == sat[:-1]) & (above[1:] != above[:-1])
+    k = np.flatnonzero(change)
+    return k, above[k + 1]
+
+
+def _bestInPass(riseSat, riseTime, setTime, pointSat, pointTime, pointValue, span):
+    # Index of the point with the largest value inside each pass (rows sorted
+    # by satellite and rise time), -1 for passes without such a point
+    passKey = riseSat * span + riseTime
+    owner = np.searchsorted(passKey, pointSat * span + pointTime, side='right') - 1
+    inside = owner >= 0
+    inside[inside] &= (riseSat[owner[inside]] == pointSat[inside]) \
+        & (pointTime[inside] <= setTime[owner[inside]])
+    candidates = np.flatnonzero(inside)
+    candidates = candidates[np.lexsort((pointValue[candidates], owner[candidates]))]
+    ranked = owner[candidates]
+    last = np.ones(len(candidates), dtype=bool)
+    last[:-1] = ranked[1:] != ranked[:-1]
+    best = np.full(len(riseSat), -1)
+    best[owner[candidates[last]]] = candidates[last]
+    return best
+
+
+def _searchGroup(catalog, sites, search, ts, tStart, tEnd, step, horizon, keepOpen,
+                 tolerance, darkness):
+    # Pass tables, one per site, of element sets sharing one coarse step.  The
+    # coarse grid is propagated once and shared by every site, which only
+    # searches the element sets selected by search (nsite, nsat)
+    satrecs = satrecList(catalog)
+    grid = np.append(np.arange(tStart, tEnd, step / DAY_S), tEnd)
+    errors, r, v = propagateCatalog(catalog, ts.tt_jd(grid), frame='itrf')
+    tables = []
+    for site, siteSearch, windows in zip(sites, search, darkness):
+        rows = np.flatnonzero(siteSearch)
+        table = _sitePasses([satrecs[row] for row in rows], site, ts, grid, r[rows], v[rows],
+                            horizon, keepOpen, tolerance, windows)
+        table['sat'] = rows[table['sat']]
+        tables.append(table)
+    return tables
+
+
+def _sitePasses(satrecs, site, ts, grid, r, v, horizon, keepOpen, tolerance, windows=None):
+    # Pass search at one site from the Earth-fixed coarse positions and
+    # velocities r, v (nsat, ngrid, 3), restricted to the darkness windows
+    # (n, 2) if given
+    nsat = len(satrecs)
+    tStart, tEnd = grid[0], grid[-1]
+    site = siteFrame(site)
+
+    def elevationAbove(rows, tt):
+        return pointGeometry(satrecs, site, ts, rows, tt)[0] - horizon
+
+    # Coarse screening
+    el, az, distance = altAzRange(r, site)
+    rate = elevationRate(r, v, site)
+    rangeRateGrid = rangeRate(r, v, site)
+
+    # Culminations (elevation rate turns from positive to negative) and the
+    # closest and farthest approaches (range rate changes sign) are refined
+    # together, so every bisection step propagates each satellite once
+    culmSat, culmK = np.nonzero((rate[:, :-1] > 0) & (rate[:, 1:] <= 0))
+    nearSat, nearK = np.nonzero((rangeRateGrid[:, :-1] < 0) & (rangeRateGrid[:, 1:] >= 0))
+    farSat, farK = np.nonzero((rangeRateGrid[:, :-1] > 0) & (rangeRateGrid[:, 1:] <= 0))
+    extremeSat = np.concatenate((culmSat, nearSat, farSat))
+    extremeK = np.concatenate((culmK, nearK, farK))
+    byRange = np.arange(len(extremeSat)) >= len(culmSat)
+
+    def extremeRate(points, tt):
+        geometry = pointGeometry(satrecs, site, ts, extremeSat[points], tt)
+        return np.where(byRange[points], geometry[4], geometry[3])
+
+    # Elevation rate and far range rate are positive at the start of their
+    # brackets, near range rate negative
+    positiveLo = np.concatenate((np.ones(len(culmSat), dtype=bool),
+                                 np.zeros(len(nearSat), dtype=bool),
+                                 np.ones(len(farSat), dtype=bool)))
+    extremeTime = bisect(extremeRate, np.arange(len(extremeSat)), grid[extremeK],
+                         grid[extremeK + 1], tolerance, positiveLo)
+    extremeEl, extremeAz, extremeRange = pointGeometry(satrecs, site, ts, extremeSat,
+                                                       extremeTime)[:3]
+    culmTime, nearTime, farTime = np.split(extremeTime, [len(culmSat),
+                                                         len(culmSat) + len(nearSat)])
+    culmEl = extremeEl[:len(culmSat)]
+    nearRange, farRange = np.split(extremeRange[len(culmSat):], [len(nearSat)])
+
+    # Horizon crossings of the coarse samples merged with the culminations, so
+    # short passes that fall between coarse samples are not missed
+    sat = np.concatenate((np.repeat(np.arange(nsat), len(grid)), culmSat))
+    tt = np.concatenate((np.tile(grid, nsat), culmTime))
+    above = np.concatenate(((el > horizon).ravel(), culmEl > horizon))
+    upAtStart = el[:, 0] > horizon
+    if windows is not None:
+        # Dusk and dawn are points of every satellite, and so is the middle of
+        # every daylight gap between windows; only dark points can be above
+        edges = np.concatenate((windows.ravel(), 0.5 * (windows[1:, 0] + windows[:-1, 1])))
+        edges = edges[(edges > tStart) & (edges < tEnd)]
+        edgeSat = np.repeat(np.arange(nsat), len(edges))
+        edgeTime = np.tile(edges, nsat)
+        edgeEl = pointGeometry(satrecs, site, ts, edgeSat, edgeTime)[0]
+        sat = np.concatenate((sat, edgeSat))
+        tt = np.concatenate((tt, edgeTime))
+        above = np.concatenate((above, edgeEl > horizon)) & darkSamples(windows, tt)
+        upAtStart &= darkSamples(windows, tStart)
+    order = np.lexsort((tt, sat))
+    sat, tt, above = sat[order], tt[order], above[order]
+    k, rising = _sequenceBrackets(sat, tt, above)
+    if windows is None:
+        crossing = bisect(elevationAbove, sat[k], tt[k], tt[k + 1], tolerance, above[k])
+    else:
+        # Brackets leaving or entering the dark end at dawn or start at dusk
+        dark = darkSamples(windows, tt)
+        crossing = np.where(rising, tt[k + 1], tt[k])
+        inside = dark[k] & dark[k + 1]
+        crossing[inside] = bisect(elevationAbove, sat[k][inside], tt[k][inside],
+                                  tt[k + 1][inside], tolerance, above[k][inside])
+
+    # Passes already in progress at the start of the window rise at tStart
+    upAtStart = np.flatnonzero(upAtStart)
+    riseSat = np.concatenate((upAtStart, sat[k][rising]))
+    riseTime = np.concatenate((np.full(len(upAtStart), tStart), crossing[rising]))
+    order = np.lexsort((riseTime, riseSat))
+    riseSat, riseTime = riseSat[order], riseTime[order]
+    setSat, setTime = sat[k][~rising], crossing[~rising]
+
+    # Rises and sets alternate per satellite, so the n-th rise of a satellite
+    # pairs with its n-th set; the last rise may have no set (still up at tEnd)
+    riseCount = np.bincount(riseSat, minlength=nsat)
+    setCount = np.bincount(setSat, minlength=nsat)
+    riseNumber = np.arange(len(riseSat)) - np.repeat(np.cumsum(riseCount) - riseCount, riseCount)
+    closed = riseNumber < setCount[riseSat]
+    if not keepOpen:
+        riseSat, riseTime, riseNumber, closed = \
+            riseSat[closed], riseTime[closed], riseNumber[closed], closed[closed]
+    passSetTime = np.full(len(riseSat), tEnd)
+    passSetTime[closed] = setTime[(np.cumsum(setCount) - setCount)[riseSat[closed]]
+                                  + riseNumber[closed]]
+
+    # Highest culmination inside each pass, else the higher end of the pass
+    span = tEnd - tStart + 1.0
+    riseEl, riseAz, riseRange = pointGeometry(satrecs, site, ts, riseSat, riseTime)[:3]
+    setEl, setAz, setRange = pointGeometry(satrecs, site, ts, riseSat, passSetTime)[:3]
+    best = _bestInPass(riseSat, riseTime, passSetTime, culmSat, culmTime, culmEl, span)
+    culminationTime = np.where(best >= 0, np.append(culmTime, np.nan)[best],
+                               np.where(setEl > riseEl, passSetTime, riseTime))
+    maxEl, maxElAz, maxElRange = pointGeometry(satrecs, site, ts, riseSat, culminationTime)[:3]
+    setAz = np.where(closed, setAz, np.nan)
+
+    # Range extremes inside the pass, else at its ends
+    nearest = _bestInPass(riseSat, riseTime, passSetTime, nearSat, nearTime, -nearRange, span)
+    farthest = _bestInPass(riseSat, riseTime, passSetTime, farSat, farTime, farRange, span)
+    minRange = np.fmin(np.minimum(riseRange, setRange), np.append(nearRange, np.nan)[nearest])
+    maxRange = np.fmax(np.maximum(riseRange, setRange), np.append(farRange, np.nan)[farthest])
+    return {
+        'sat': riseSat,
+        'riseTime': riseTime,
+        'culminationTime': culminationTime,
+        'setTime': passSetTime,
+        'duration': passSetTime - riseTime,
+        'maxEl': maxEl,
+        'maxElAz': maxElAz,
+        'maxElRange': maxElRange,
+        'riseAz': riseAz,
+        'setAz': setAz,
+        'minRange': minRange,
+        'maxRange': maxRange,
+        'direction': passDirection(riseAz, setAz),
+    }
+
+
+def searchPasses(catalog, site, tStart, tEnd, horizon=0.0, keepOpen=False,
+                 tolerance=TOLERANCE_S, ts=None):
+    # Pass table (dict of equal-length arrays, see REFINED_PASS_FIELDS) of
+    # every element set of the catalog between TT Julian dates tStart and
+    # tEnd, ordered by catalog row and rise time.  Passes still above the
+    # horizon at tEnd are dropped unless keepOpen (setTime tEnd, setAz NaN)
+    passes = searchSites(catalog, [site], tStart, tEnd, horizon, keepOpen, tolerance, ts)
+    del passes['site']
+    return passes
+
+
+def searchSites(catalog, sites, tStart, tEnd, horizon=0.0, keepOpen=False,
+                tolerance=TOLERANCE_S, ts=None, screen=None, darkness=None):
+    # Pass table of every element set of the catalog seen from each of a list
+    # of sites, with a 'site' column indexing sites, ordered by site, catalog
+    # row and rise time.  Each element set is propagated once for all sites.
+    # screen (nsite, nsat) from visibilityScreen.screenSites restricts the
+    # search to SOMETIMES_VISIBLE pairs.  darkness holds the night windows of
+    # every optical site (None for other sites, see darknessWindows)
+    if ts is None:
+        ts = load.timescale()
+    if darkness is None:
+        darkness = [None] * len(sites)
+    if screen is None:
+        search = np.ones((len(sites), len(catalog)), dtype=bool)
+    else:
+        search = np.asarray(screen) == SOMETIMES_VISIBLE
+    steps = coarseSteps(catalog)
+    tables = []
+    for step in np.unique(steps):
+        rows = np.flatnonzero((steps == step) & search.any(axis=0))
+        if not len(rows):
+            continue
+        siteTables = _searchGroup(catalog.subset(rows), sites, search[:, rows], ts,
+                                  tStart, tEnd, step, horizon, keepOpen, tolerance,
+                                  darkness)
+        for s, table in enumerate(siteTables):
+            table['sat'] = rows[table['sat']]
+            table['site'] = np.full(len(table['sat']), s)
+            tables.append(table)
+    if not tables:
+        passes = {name: np.zeros(0) for name in REFINED_PASS_FIELDS}
+        passes['sat'] = np.zeros(0, dtype=np.int64)
+        passes['direction'] = np.zeros(0, dtype='<U2')
+        passes['site'] = np.zeros(0, dtype=np.int64)
+        return passes
+    passes = {name: np.concatenate([table[name] for table in tables])
+              for name in REFINED_PASS_FIELDS + ('site',)}
+    order = np.lexsort((passes['riseTime'], passes['sat'], passes['site']))
+    return {name: column[order] for name, column in passes.items()}
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Whole-catalog batched SGP4 propagation
+#
+# The catalog is propagated over a time grid with the sgp4 array interface
+# (SatrecArray), one C call per time chunk instead of one skyfield call per
+# satellite.  Chunking the time axis bounds the size of the sgp4 work arrays.
+
+import numpy as np
+
+from sgp4.api import Satrec, SatrecArray
+
+from gridContext import gridContext, sgp4Times, siteFrame
+
+DEFAULT_CHUNK_SIZE = 360    # time samples per sgp4 call
+
+
+def satrecList(catalog):
+    # One sgp4 satellite per element set of the catalog
+    return [Satrec.twoline2rv(line1.decode('ascii'), line2.decode('ascii'))
+            for line1, line2 in zip(catalog.line1, catalog.line2)]
+
+
+def satrecArray(catalog):
+    # Build the sgp4 satellite array for every element set of the catalog
+    return SatrecArray(satrecList(catalog))
+
+
+def iterPropagation(satrecs, jd, fraction, chunkSize=DEFAULT_CHUNK_SIZE):
+    # Yield (timeSlice, errors, r, v) for successive chunks of the time grid
+    # r and v are TEME km and km/s with shape (nsat, nchunk, 3)
+    for start in range(0, len(jd), chunkSize):
+        timeSlice = slice(start, min(start + chunkSize, len(jd)))
+        errors, r, v = satrecs.sgp4(jd[timeSlice], fraction[timeSlice])
+        yield timeSlice, errors, r, v
+
+
+def propagatePoints(satrecs, rows, times):
+    # Propagate satrecs[rows[k]] to times[k] for scattered (satellite, time)
+    # points, one sgp4 call per distinct satellite
+    # Returns errors (n,) and r, v (n, 3) in km and km/s
+    jd, fraction = sgp4Times(times)
+    rows = np.asarray(rows)
+    # Points sorted by satellite, so each satellite is one contiguous run
+    order = np.argsort(rows, kind='stable')
+    sortedRows = rows[order]
+    jd, fraction = jd[order], fraction[order]
+    errors = np.zeros(len(rows), dtype=np.uint8)
+    r = np.empty((len(rows), 3))
+    v = np.empty((len(rows), 3))
+    starts = np.flatnonzero(np.diff(sortedRows)) + 1
+    for start, stop in zip(np.append(0, starts).tolist(), np.append(starts, len(rows)).tolist()):
+        errors[start:stop], r[start:stop], v[start:stop] = \
+            satrecs[sortedRows[start]].sgp4_array(jd[start:stop], fraction[start:stop])
+    unsort = np.argsort(order)
+    return errors[unsort], r[unsort], v[unsort]
+
+
+def temeToItrf(r, v, times, timeSlice=slice(None), context=None):
+    # Rotate TEME vectors (nsat, ntime, 3) into the Earth-fixed frame
+    # (polar motion neglected, as skyfield does by default).  The rotation
+    # comes from the shared grid context unless one is given
+    if context is None:
+        context = gridContext(times)
+    cosTheta = context.cosTheta[timeSlice]
+    sinTheta = context.sinTheta[timeSlice]
+    omega = context.omega[timeSlice]
+
+    rItrf = np.empty_like(r)
+    rItrf[..., 0] = cosTheta * r[..., 0] + sinTheta * r[..., 1]
+    rItrf[..., 1] = -sinTheta * r[..., 0] + cosTheta * r[..., 1]
+    rItrf[..., 2] = r[..., 2]
+
+    vItrf = np.empty_like(v)
+    vItrf[..., 0] = cosTheta * v[..., 0] + sinTheta * v[..., 1] + omega * rItrf[..., 1]
+    vItrf[..., 1] = -sinTheta * v[..., 0] + cosTheta * v[..., 1] - omega * rItrf[..., 0]
+    vItrf[..., 2] = v[..., 2]
+    return rItrf, vItrf
+
+
+def temeToGcrs(r, times, timeSlice=slice(None), context=None):
+    # Rotate TEME positions (nsat, ntime, 3) into GCRS with the frame
+    # rotation of each time sample, shared by every satellite
+    if context is None:
+        context = gridContext(times)
+    R = context.temeToGcrs()[..., timeSlice]
+    return np.einsum('jin,snj->sni', R, r)
+
+
+def gcrsToItrf(r, times, timeSlice=slice(None), context=None):
+    # Rotate GCRS positions (nsat, ntime, 3), e.g. of fragments propagated in
+    # an inertial frame, into the Earth-fixed frame
+    if context is None:
+        context = gridContext(times)
+    R = context.gcrsToItrf()[..., timeSlice]
+    return np.einsum('ijn,snj->sni', R, r)
+
+
+def propagateCatalog(catalog, times, chunkSize=DEFAULT_CHUNK_SIZE, frame='teme',
+                     context=None):
+    # Propagate every element set of the catalog over the time grid (or the
+    # grid of the given context, times may then be None)
+    # Returns errors (nsat, ntime) and r, v (nsat, ntime, 3) in km and km/s
+    satrecs = satrecArray(catalog)
+    if context is None:
+        context = gridContext(times)
+    jd, fraction = context.jd, context.fraction
+
+    errors = np.empty((len(catalog), len(jd)), dtype=np.uint8)
+    r = np.empty((len(catalog), len(jd), 3))
+    v = np.empty((len(catalog), len(jd), 3))
+
+    for timeSlice, e, rChunk, vChunk in iterPropagation(satrecs, jd, fraction, chunkSize):
+        if frame == 'itrf':
+            rChunk, vChunk = temeToItrf(rChunk, vChunk, times, timeSlice, context)
+        errors[:, timeSlice] = e
+        r[:, timeSlice] = rChunk
+        v[:, timeSlice] = vChunk
+    return errors, r, v
+
+
+def altAzRange(rItrf, site):
+    # Topocentric elevation, azimuth (degrees) and range (km) of Earth-fixed
+    # positions (..., 3) seen from a skyfield Topos (or its SiteFrame)
+    frame = siteFrame(site)
+    d = rItrf - frame.xyz
+    east = d @ frame.east
+    north = d @ frame.north
+    up = d @ frame.up
+
+    el = np.degrees(np.arctan2(up, np.hypot(east, north)))
+    az = np.degrees(np.arctan2(east, north)) % 360.0
+    distance = np.sqrt(east * east + north * north + up * up)
+    return el, az, distance
+
+
+def elevationRate(rItrf, vItrf, site):
+    # Rate of change of topocentric elevation (degrees/s) of Earth-fixed
+    # positions and velocities (..., 3) seen from a skyfield Topos
+    frame = siteFrame(site)
+    up = frame.up
+
+    d = rItrf - frame.xyz
+    rangeSquared = np.sum(d * d, axis=-1)
+    u = d @ up
+    horizontal = np.sqrt(np.maximum(rangeSquared - u * u, 0.0))
+    rate = (vItrf @ up * rangeSquared - u * np.sum(d * vItrf, axis=-1)) \
+        / (rangeSquared * horizontal)
+    return np.degrees(rate)
@@ -1,88 +1,183 @@
 # -*- coding: utf-8 -*-
 import sys, getopt
 import argparse
-from skyfield import api
-from skyfield.api import EarthSatellite
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from catalogDelta import catalogChanges, latestEpochs, printChangeSummary, writeChangeSummary
+from tleCatalog import iterCatalogBatches, readCatalog
+
+BATCH_SIZE = 1000       # element sets per bulk_write
+MAX_IN_FLIGHT = 4       # bulk writes outstanding while the next batch is parsed
+
+def tleCollection(client=None):
+    if client is None:
+        client = MongoClient()
+    gemini2db = client['Gemini2']
+    return gemini2db['tle_collection']
+
+def ensureIndexes(tle_collection):
+    # One document per element set: re-loading a file updates in place
+    tle_collection.create_index([('satnum', pymongo.ASCENDING),
+                                 ('jdsatepoch', pymongo.ASCENDING)],
+                                unique=True, name='satnum_jdsatepoch')
 
-def importCatalog(filename):
+def tleDocuments(catalog):
+    # MongoDB documents for every element set of a columnar catalog
+    columns = zip([str(satnum) for satnum in catalog.satnum.tolist()],
+                  catalog.epochyr.tolist(), catalog.epochdays.tolist(),
+                  catalog.epoch.tolist(), catalog.ndot.tolist(),
+                  catalog.nddot.tolist(), catalog.bstar.tolist(),
+                  catalog.inclination.tolist(), catalog.raan.tolist(),
+                  catalog.eccentricity.tolist(), catalog.argPerigee.tolist(),
+                  catalog.meanAnomaly.tolist(), catalog.meanMotion.tolist(),
+                  [line.decode('ascii') for line in catalog.line1.tolist()],
+                  [line.decode('ascii') for line in catalog.line2.tolist()])
+    keys = ('satnum', 'epochyr', 'epochdays', 'jdsatepoch', 'ndot', 'nddot',
+            'bstar', 'inclo', 'nodeo', 'ecco', 'argpo', 'mo', 'no',
+            'line1', 'line2')
+    return [dict(zip(keys, values)) for values in columns]
+
+def upsertOperations(tleDocs):
+    # Upserts keyed on (satnum, jdsatepoch); a repeated key within the batch
+    # keeps the last element set so unordered writes cannot collide
+    latest = {}
+    for tleData in tleDocs:
+        latest[(tleData['satnum'], tleData['jdsatepoch'])] = tleData
+    return [UpdateOne({'satnum': satnum, 'jdsatepoch': jdsatepoch},
+                      {'$set': tleData}, upsert=True)
+            for (satnum, jdsatepoch), tleData in latest.items()]
+
+def writeBatch(tle_collection, operations):
+    try:
+        return tle_collection.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as bwe:
+        # Unordered writes carry on past failures and report them all here
+        return bwe.details
+
+def writeCatalogBatches(catalogs, tle_collection, maxInFlight=MAX_IN_FLIGHT):
+    # Upsert a sequence of catalogs, one bulk_write per catalog
 
     tleInserts = 0
+    tleUpdates = 0
     writeConcernError = 0
     writeError = 0
-    print('Open ',filename)
-    fp = open(filename,"r")
-    if not fp:
-        print('Error opening TLE file')
-        exit()
+    documents = 0
 
-    client = MongoClient()
-    gemini2db = client['Gemini2']
-    tle_collection = gemini2db['tle_collection']
+    def collect(details):
+        nonlocal tleInserts, tleUpdates, writeConcernError, writeError
+        tleInserts += details['nUpserted']
+        tleUpdates += details['nMatched']
+        writeConcernError += len(details['writeConcernErrors'])
+        writeError += len(details['writeErrors'])
+        for we in details['writeErrors']:
+            print(we)
+
+    startTime = time.time()
+    # Parsing of the next batch overlaps the bulk writes still in flight
+    with ThreadPoolExecutor(maxInFlight) as executor:
+        inFlight = deque()
+        for catalog in catalogs:
+            operations = upsertOperations(tleDocuments(catalog))
+            documents += len(operations)
+            if len(inFlight) == maxInFlight:
+                collect(inFlight.popleft().result())
+            inFlight.append(executor.submit(writeBatch, tle_collection, operations))
+        while inFlight:
+            collect(inFlight.popleft().result())
+
+    elapsed = time.time() - startTime
+    if elapsed > 0:
+        print('Wrote ', documents, ' documents in ', f'{elapsed:.2f}', ' s (',
+              f'{documents/elapsed:.0f}', ' documents/sec)')
+    return tleInserts, tleUpdates, writeConcernError, writeError
+
+def importCatalog(filename, tle_collection=None, batchSize=BATCH_SIZE,
+                  maxInFlight=MAX_IN_FLIGHT):
+
+    if tle_collection is None:
+        tle_collection = tleCollection()
+    ensureIndexes(tle_collection)
 
     print('Read TLEs from',filename)
-    while True:
-        line1 = fp.readline()
-        if line1:
-            line2 = fp.readline()
-            if line2:
-                satellite = EarthSatellite(line1,line2)
-                tleData = {"satnum":str(satellite.model.satnum),\
-                "epochyr":satellite.model.epochyr,\
-                "epochdays":satellite.model.epochdays,\
-                "jdsatepoch":satellite.model.jdsatepoch,\
-                "ndot":satellite.model.ndot,\
-                "nddot":satellite.model.nddot,\
-                "bstar":satellite.model.bstar,\
-                "inclo":satellite.model.inclo,\
-                "nodeo":satellite.model.nodeo,\
-                "ecco":satellite.model.ecco,\
-                "argpo":satellite.model.argpo,\
-                "mo":satellite.model.mo,\
-                "no":satellite.model.no, \
-                "line1":line1, \
-                "line2":line2}
-                try:
-                    tle_id = tle_collection.insert_one(tleData).inserted_id
-                    tleInserts += 1
-                except WriteConcernError as wce:
-                    writeConcernError += 1
-                    print(wce)
-                except WriteError as we:
-                    writeError += 1
-                    print(we)
-            else:
-                break
-        else:
-            break
-
-    return tleInserts, writeConcernError, writeError
+    with open(filename, 'r') as fp:
+        return writeCatalogBatches(iterCatalogBatches(fp, batchSize),
+                                   tle_collection, maxInFlight)
+
+def storedLatestEpochs(tle_collection):
+    # Latest stored epoch of every object, computed by the server
+    latest = list(tle_collection.aggregate([
+        {'$group': {'_id': '$satnum', 'jdsatepoch': {'$max': '$jdsatepoch'}}}]))
+    satnums = np.array([int(doc['_id']) for doc in latest], dtype=np.int64)
+    epochs = np.array([doc['jdsatepoch'] for doc in latest], dtype=np.float64)
+    return latestEpochs(satnums, epochs)
+
+def importChanges(filename, tle_collection=None, batchSize=BATCH_SIZE,
+                  maxInFlight=MAX_IN_FLIGHT, summaryFilename=None):
+    # Incremental ingest: write only element sets newer than the stored ones
+
+    if tle_collection is None:
+        tle_collection = tleCollection()
+    ensureIndexes(tle_collection)
+
+    print('Read TLE feed from',filename)
+    feed = readCatalog(filename)
+    changes = catalogChanges(feed, *storedLatestEpochs(tle_collection))
+    printChangeSummary(changes)
+    if summaryFilename:
+        writeChangeSummary(changes, summaryFilename)
+
+    rows = changes['rows']
+    catalogs = (feed.subset(rows[start:start + batchSize])
+                for start in range(0, len(rows), batchSize))
+    return writeCatalogBatches(catalogs, tle_collection, maxInFlight)
 
 
 def main(argv):
 
     # Defaults
     inputFile = 'C:\\Users\\17816\\Documents\\GitHub\\Gemini2\\Python\\catalogTest.txt' 
+    batchSize = BATCH_SIZE
+    incremental = False
+    summaryFile = None
     try:
-        opts, args = getopt.getopt(argv,"hi:o:",["ifile=","ofile="])
+        opts, args = getopt.getopt(argv,"hi:o:b:ns:",
+            ["ifile=","ofile=","batch=","incremental","summary="])
     except getopt.GetoptError:
-        print('pymongoLoadTLEs.py -i <inputFile>')
+        print('pymongoLoadTLEs.py -i <inputFile> -b <batchSize> -n -s <summaryFile>')
         sys.exit(2)
 
     for opt, arg in opts:
         if opt == '-h':
-            print('pymongoLoadTLEs.py -i <inputFile>')
+            print('pymongoLoadTLEs.py -i <inputFile> -b <batchSize> -n -s <summaryFile>')
             sys.exit()
         elif opt in ("-i", "--ifile"):
             inputFile = arg
-    
+        elif opt in ("-b", "--batch"):
+            batchSize = int(arg)
+        elif opt in ("-n", "--incremental"):
+            incremental = True
+        elif opt in ("-s", "--summary"):
+            summaryFile = arg
+
     print('Insert TLEs from ',inputFile,' into MongoDB')
-    
-    tleInserts, writeConcernError, writeError = importCatalog(inputFile)
+
+    if incremental:
+        tleInserts, tleUpdates, writeConcernError, writeError = importChanges(inputFile,
+            batchSize=batchSize, summaryFilename=summaryFile)
+    else:
+        tleInserts, tleUpdates, writeConcernError, writeError = importCatalog(inputFile,
+            batchSize=batchSize)
     print('Inserted ',tleInserts,' TLEs')
+    print('Matched  ',tleUpdates,' TLEs already in the catalog')
     print('Got ',writeConcernError,' write concern errors')
     print('Got ',writeError,' write errors')
 
 if __name__ == "__main__":
-   main(sys.argv[1:])
\ No newline at end of file
+   main(sys.argv[1:])
@@ -1,5 +1,7 @@
 import argparse
-import csv
+import os
+
+import numpy as np
 
 from skyfield import api
 from skyfield.api import EarthSatellite
@@ -7,64 +9,27 @@ from skyfield.constants import AU_KM, AU_M
 from skyfield.sgp4lib import TEME_to_ITRF
 from skyfield.api import Topos, load
 
+from catalogCache import loadCatalog
+from catalogExport import exportColumns, exportCSV
+from catalogDelta import catalogChanges, latestEpochs, printChangeSummary, writeChangeSummary
 
-# Read TLE file and write key parameters in CSV format
-def readTLE(tleFilename):
-    # Open TLE filename
-    tleFile = open(tleFilename,'r')
-    # print("Opened TLE file: ",tleFilename)
-    # Read TLEs into catalog
-    catalog = []
-
-    line0 = None
-    line1 = None
-    line2 = None
-
-    for line in tleFile:
-        if line[0] == '0':
-            line0 = line
-        elif line[0] == '1':
-            line1 = line
-        elif line[0] == '2':
-            line2 = line
-        else:
-            # Error - TLE lines start with 0, 1 or 2
-            print("Error: line does not start with 0, 1 or 2: ",line)
 
-        if line1 and line2:
-            # Check if object number is same in both line 1 and 2
-            catalog.append(EarthSatellite(line1,line2))
-            line1 = None;
-            line2 = None;
-    # print("Read ", len(catalog), "TLEs into catalog")
-    return catalog
-
-def writeSatelliteCSV(catalog, tleDefaultCSVFilename):
-    with open(tleDefaultCSVFilename, 'w', newline='') as csvfile:
-
-        fieldnames = ['satnum', 'epochyr', 'epochdays', 'jdsatepoch', 'ndot', \
-            'nddot', 'bstar', 'inclination', 'rightascension', 'eccentricity', \
-            'argofperigee', 'meanmotion', 'meananomaly']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for satellite in catalog:
-            writer.writerow({\
-                'satnum':satellite.model.satnum, \
-                'epochyr':satellite.model.epochyr, \
-                'epochdays':satellite.model.epochdays, \
-                'jdsatepoch':satellite.model.jdsatepoch, \
-                'ndot':satellite.model.ndot, \
-                'nddot':satellite.model.nddot, \
-                'bstar':satellite.model.bstar, \
-                'inclination':satellite.model.inclo, \
-                'rightascension':satellite.model.nodeo, \
-                'eccentricity':satellite.model.ecco, \
-                'argofperigee':satellite.model.argpo, \
-                'meananomaly':satellite.model.mo, \
-                'meanmotion':satellite.model.no})
+# Latest epoch per object already written to the CSV file
+def readStoredEpochs(tleCSVFilename):
+    stored = np.genfromtxt(tleCSVFilename, delimiter=',', names=True,
+                           usecols=('satnum', 'jdsatepoch'), ndmin=1)
+    return latestEpochs(stored['satnum'].astype(np.int64), stored['jdsatepoch'])
 
 parser = argparse.ArgumentParser(description='Read TLE files')
 parser.add_argument("--tleFilename")
+parser.add_argument("--incremental", action='store_true',
+                    help='append only new or superseded element sets')
+parser.add_argument("--summaryFilename",
+                    help='JSON file for the incremental change summary')
+parser.add_argument("--outputFilename")
+parser.add_argument("--format", choices=['csv', 'npz'], default='csv')
+parser.add_argument("--fields", help='comma separated fields to export')
+parser.add_argument("--gzip", action='store_true', help='compress the output')
 args = parser.parse_args()
 
 
@@ -74,6 +39,24 @@ if args.tleFilename:
     tleFilename = args.tleFilename
 else:
     tleFilename = tleDefaultFilename
+if args.outputFilename:
+    tleDefaultCSVFilename = args.outputFilename
+elif args.format == 'npz':
+    tleDefaultCSVFilename = 'catalogTest.npz'
+if args.gzip and args.format == 'csv' and not tleDefaultCSVFilename.endswith('.gz'):
+    tleDefaultCSVFilename += '.gz'
+fields = args.fields.split(',') if args.fields else None
+
+catalog = loadCatalog(tleFilename)
+if args.format == 'npz':
+    exportColumns(catalog, tleDefaultCSVFilename, fields, compress=args.gzip)
+elif args.incremental and os.path.exists(tleDefaultCSVFilename):
+    storedSatnums, storedEpochs = readStoredEpochs(tleDefaultCSVFilename)
+    changes = catalogChanges(catalog, storedSatnums, storedEpochs)
+    printChangeSummary(changes)
+    if args.summaryFilename:
+        writeChangeSummary(changes, args.summaryFilename)
+    exportCSV(catalog.subset(changes['rows']), tleDefaultCSVFilename, fields, append=True)
+else:
+    exportCSV(catalog, tleDefaultCSVFilename, fields)
 
-catalog = readTLE(tleFilename)
-writeSatelliteCSV(catalog,tleDefaultCSVFilename)
@@ -2,19 +2,14 @@
 # a large object in a polar orbit that is struck by a
 # smaller debris object
 
-from random import uniform
-from numpy.linalg import norm
-
-from astropy import time
-from astropy import units as u
-from astropy.time import Time
-from astropy.coordinates import SkyCoord, EarthLocation, AltAz
+import numpy as np
 
 from skyfield.api import EarthSatellite, Topos, load
 
-from poliastro.bodies import Earth
-from poliastro.twobody import Orbit
-from poliastro.spheroid_location import SpheroidLocation
+from breakupModel import ejectFragments
+from keplerPropagation import perifocalElements, propagateStates
+from sensorView import sensorGeometry, sensorPasses
+from tleFromStates import statesToTLE, writeTLE
 
 line1 = '1  5398U 71067E   20004.97039155 +.00000142 +00000-0 +43247-4 0  9992'
 line2 = '2  5398 087.6227 269.5184 0065476 094.7647 266.1031 14.33848082536070'
@@ -46,6 +41,10 @@ nPieces = 4
 nTimeSteps = 10
 timeStep = 100
 ejectionVelocity = 0.4 # km/sec
+useJ2 = False          # secular J2 drift on top of two-body motion
+pieceSatnum = 90000    # catalog number of the first piece
+piecesFile = 'breakupPieces.txt'
+seed = None            # random unless set; printed so a run can be repeated
 
 geocentric = satellite.at(tBreakup)
 r = geocentric.position
@@ -65,64 +64,54 @@ print('Arg of perigee:  ',satellite.model.argpo) # Argument of perigee in radian
 print('Mean anomaly:    ',satellite.model.mo) # Mean anomaly in radians.
 print('Mean motion:     ',satellite.model.no) # Mean motion in radians per minute.
 
-# Poliastro r and v vectors for the main body
-rVector = [r.km[0], r.km[1], r.km[2]] * u.km
-# vVector = [v.km_per_s[0], v.km_per_s[1], v.km_per_s[2]] * u.km/u.s
-
-pieces = []
-tB = Time(tBreakup.tt,format='jd',scale='utc')
+# All fragment state vectors (nPieces, 6) in GCRS, km and km/s
+if seed is None:
+    seed = np.random.SeedSequence().entropy
+print('Seed:', seed)
+pieces = ejectFragments(r.km, v.km_per_s, nPieces, ejectionVelocity,
+                        np.random.default_rng(seed))
 
-for i in range(0,nPieces):
-    # Get 3 random values
-    randomVelocityDelta = [uniform(-1.,1.), uniform(-1.,1.), uniform(-1.,1.)]
-    # Compute length and scale factor
-    scale = ejectionVelocity/norm(randomVelocityDelta)
-    scaledVelocityDelta = [scale*randomVelocityDelta[0], \
-        scale*randomVelocityDelta[1], scale*randomVelocityDelta[2]]
-    # Add the 3 random values to the velocity vector of the main body
-    vVector = [(v.km_per_s[0]+scaledVelocityDelta[0]),\
-        (v.km_per_s[1]+scaledVelocityDelta[1]), \
-        (v.km_per_s[2]+scaledVelocityDelta[2])] * u.km/u.s
-    pieces.append(Orbit.from_vectors(Earth, rVector, vVector, epoch=tB))
-
-# Generate orbital element sets for the pieces
+# Orbits of the pieces
 print('Pieces')
-for piece in pieces:
-    print('Piece:',piece)
-
-pieceOrbits = []
-for piece in pieces:
-    rVector = []
-    for i in range(0,nTimeSteps):
-        rVector.append(piece.propagate(time.TimeDelta(timeStep * i * u.min)))
-    print('rVector:',rVector)
-    pieceOrbits.append(rVector)
-
-# Find when pieces are visible to the sensor
-#observing_time = Time(jd=tBreakup.tt)
-#sensor_coordinates = [0.0 * u.deg, 0.0 * u.deg, 0 * u.m]
-#sensorLocation = SpheroidLocation(*sensor_coordinates, Earth)
-sensorLocation = EarthLocation(lat=45.0, lon=72.0, height=100.0)
-angles = []
+a, e, n, M0, P, Q, W = perifocalElements(pieces)
+for i in range(0,nPieces):
+    print('Piece:', f'{a[i]*(1-e[i]):.0f} x {a[i]*(1+e[i]):.0f} km x',
+          f'{np.degrees(np.arccos(W[i,2])):.1f} deg (GCRS) orbit around Earth at epoch', tBreakup.utc_jpl())
+
+# Generate orbital element sets for the pieces, written as TLEs that
+# readTLE and the schedule generator can read
+pieceLines1, pieceLines2, fitted, miss = statesToTLE(pieces, tBreakup, pieceSatnum,
+                                                     designator=line1[9:17].strip())
+for line1Piece, line2Piece in zip(pieceLines1, pieceLines2):
+    print(line1Piece)
+    print(line2Piece)
+writeTLE(piecesFile, pieceLines1, pieceLines2)
+print('Wrote', len(fitted), 'of', nPieces, 'element sets to', piecesFile)
+
+# Propagate every piece over the whole time grid at once (nPieces, nTimeSteps, 6)
+offsets = np.arange(nTimeSteps) * timeStep * 60.0
+pieceStates = propagateStates(pieces, offsets, j2=useJ2)
+for i in range(0,nPieces):
+    print('rVector:',pieceStates[i,:,:3])
+
+# Find when pieces are visible to the sensors: the geometry of all pieces,
+# times and sensors is computed at once
+times = ts.tt_jd(tBreakup.tt + offsets / 86400.0)
+sensorNames = ['sensorLocation', 'sensor']
+sensors = [Topos(latitude_degrees=45.0, longitude_degrees=72.0, elevation_m=100.0), sensor]
+alt, az, distance, visible = sensorGeometry(pieceStates[:,:,:3], times, sensors)
 for i in range(0,nPieces):
     for j in range(0,nTimeSteps):
-        r,v = pieceOrbits[i][j].rv()
-        tVal = pieceOrbits[i][j].epoch
-        # sat_angles = pieceOrbits[i][j].transform_to(\
-        #     AltAz(\
-        #     representation_type='cartesian',
-        #     x=r[0], y=r[1], z=r[2],
-        #     frame='gcrs',
-        #     obstime=tVal,
-        #     location=sensorLocation))
-        sky_gcrs=SkyCoord(
-            representation_type='cartesian',
-            x=r[0], y=r[1], z=r[2],
-            frame='gcrs')
-        print('sky:',sky_gcrs)
-        viewAngle = sky_gcrs.transform_to(AltAz(obstime=tVal,location=sensorLocation))
-        angles.append(viewAngle)
-        # pos_ecef = sky_gcrs.transform_to('itrs')
-        print('Angles:',i,j,int(viewAngle.alt.value),int(viewAngle.az.value),r[0],r[1],r[2])
-        # if sat_angles.alt > 0.0:
-        #     print('Visible at ',i,j,tVal,sat_angles)
+        r = pieceStates[i,j,:3]
+        print('Angles:',i,j,int(alt[0,i,j]),int(az[0,i,j]),r[0],r[1],r[2])
+
+# Passes of the pieces over every sensor (in time steps)
+piecePasses = sensorPasses(alt, az, distance)
+for k in range(len(piecePasses['sat'])):
+    print('Pass:', sensorNames[piecePasses['site'][k]], piecePasses['sat'][k],
+          piecePasses['rise'][k], piecePasses['set'][k],
+          int(piecePasses['maxEl'][k]+0.5), int(piecePasses['maxElAz'][k]+0.5),
+          int(piecePasses['minRange'][k]))
+for s in range(len(sensors)):
+    print('Sensor:', sensorNames[s], np.count_nonzero(visible[s].any(axis=1)),
+          'of', nPieces, 'pieces visible')
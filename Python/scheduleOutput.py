@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Streaming schedule output
+#
+# Pass tables and observation rows are written as CSV or JSON lines as they
+# are produced and flushed after every block, so memory stays bounded and
+# downstream tasking can read the file while the schedule is still running.
+# Times are TT Julian dates unless noted, durations days, angles degrees and
+# ranges km.
+
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+OUTPUT_FORMATS = ('csv', 'jsonl')
+
+PASS_OUTPUT_FIELDS = ('site', 'satnum', 'riseUtc', 'riseTime', 'duration', 'direction',
+                      'maxEl', 'maxElAz', 'maxElRange', 'riseAz', 'setAz',
+                      'minRange', 'maxRange')
+
+
+def outputFormat(filename, fmt=None):
+    # Explicit format, else JSON lines for .jsonl/.json files and CSV otherwise
+    if fmt is None:
+        extension = os.path.splitext(filename)[1].lower()
+        fmt = 'jsonl' if extension in ('.jsonl', '.json') else 'csv'
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError('format must be one of ' + ', '.join(OUTPUT_FORMATS))
+    return fmt
+
+
+def _jsonValue(value):
+    # NaN (e.g. the set azimuth of an open pass) is not valid JSON
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _columnValues(column):
+    # Python values of a column; float32 values are written with their
+    # shortest representation and byte strings as text
+    column = np.asarray(column)
+    if column.dtype == np.float32:
+        return [float(str(value)) for value in column]
+    if column.dtype.kind == 'S':
+        return column.astype('U').tolist()
+    return column.tolist()
+
+
+class RecordWriter:
+
+    def __init__(self, filename, fields, fmt=None):
+        self.fields = list(fields)
+        self.format = outputFormat(filename, fmt)
+        self.count = 0
+        self.file = open(filename, 'w', newline='')
+        if self.format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.fields)
+
+    def writeRows(self, rows):
+        # Write tuples of values in field order and flush
+        for row in rows:
+            if self.format == 'csv':
+                self.writer.writerow(row)
+            else:
+                record = {name: _jsonValue(value) for name, value in zip(self.fields, row)}
+                self.file.write(json.dumps(record) + '\n')
+            self.count += 1
+        self.file.flush()
+
+    def writeTable(self, table):
+        # Write a dict of equal-length arrays or a structured array, one
+        # record per row
+        self.writeRows(zip(*[_columnValues(table[name]) for name in self.fields]))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Compact record arrays of passes and observations
+#
+# Pass tables are built as dicts of columns while passes are being found and
+# are collected into NumPy structured arrays: one fixed-size record per pass
+# or observation with float64 TT times, int32 catalog rows and numbers,
+# float32 angles and ranges and two-byte direction codes.  Records sorted by
+# satellite (and time) are sliced with binary searches, which return views
+# rather than copies.
+
+import numpy as np
+
+# Storage type of every known column, other columns keep their own type
+COMPACT_DTYPES = {
+    'site': np.int16,
+    'sat': np.int32,
+    'satnum': np.int32,
+    'rise': np.int32,
+    'set': np.int32,
+    'riseTime': np.float64,
+    'culminationTime': np.float64,
+    'setTime': np.float64,
+    'tt': np.float64,
+    'event': np.int8,
+    'duration': np.float32,
+    'maxEl': np.float32,
+    'maxElAz': np.float32,
+    'maxElRange': np.float32,
+    'riseAz': np.float32,
+    'setAz': np.float32,
+    'minRange': np.float32,
+    'maxRange': np.float32,
+    'az': np.float32,
+    'el': np.float32,
+    'range': np.float32,
+    'direction': 'S2',
+    'illuminated': np.bool_,
+    'sunlit': np.bool_,
+    'x': np.float64,
+    'y': np.float64,
+    'z': np.float64,
+}
+
+
+def recordDtype(table, fields=None):
+    # Structured dtype for the given columns (default all) of a dict table
+    if fields is None:
+        fields = list(table)
+    return np.dtype([(name, COMPACT_DTYPES.get(name, np.asarray(table[name]).dtype))
+                     for name in fields])
+
+
+def recordArray(table, fields=None):
+    # Structured array with one compact record per row of a dict of
+    # equal-length columns
+    dtype = recordDtype(table, fields)
+    records = np.empty(len(table[dtype.names[0]]) if dtype.names else 0, dtype=dtype)
+    for name in dtype.names:
+        records[name] = table[name]
+    return records
+
+
+def concatenateRecords(arrays, dtype):
+    # Join record arrays, e.g. of successive blocks of satellites
+    arrays = list(arrays)
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays)
+
+
+def recordRange(records, field, lo, hi=None):
+    # View of the records with lo <= field < hi (field == lo if hi is None),
+    # records being sorted on field
+    column = records[field]
+    if hi is None:
+        start = np.searchsorted(column, lo, side='left')
+        stop = np.searchsorted(column, lo, side='right')
+    else:
+        start, stop = np.searchsorted(column, [lo, hi], side='left')
+    return records[start:stop]
+
+
+def satelliteRecords(records, sat, field='sat'):
+    # View of the records of one catalog row (or satnum with field='satnum')
+    # from records sorted by satellite
+    return recordRange(records, field, sat)
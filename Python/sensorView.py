@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Sensor views of objects propagated in an inertial frame
+#
+# Positions of a whole cloud of objects (nobj, ntime, 3) in GCRS, such as
+# breakup fragments, are rotated into the Earth-fixed frame once per time
+# sample for all objects, then projected onto the topocentric frame of every
+# sensor with array operations.  Results are stacked per sensor, shape
+# (nsensor, nobj, ntime), and pass summaries come from passFinder.
+
+import numpy as np
+
+from gridContext import gridContext
+from passFinder import concatenatePasses, findPasses
+from propagation import altAzRange, gcrsToItrf
+
+
+def sensorGeometry(rGcrs, times, sensors, horizon=0.0):
+    # Elevation, azimuth (degrees), range (km) and visibility mask (elevation
+    # above horizon degrees) of GCRS positions (nobj, ntime, 3) from every
+    # sensor (skyfield Topos), each of shape (nsensor, nobj, ntime)
+    rItrf = gcrsToItrf(np.asarray(rGcrs), times, context=gridContext(times))
+    shape = (len(sensors),) + rItrf.shape[:-1]
+    el, az, distance = np.empty(shape), np.empty(shape), np.empty(shape)
+    for s, sensor in enumerate(sensors):
+        el[s], az[s], distance[s] = altAzRange(rItrf, sensor)
+    return el, az, distance, el > horizon
+
+
+def sensorPasses(el, az, distance, horizon=0.0, keepOpen=True):
+    # Pass table of every object at every sensor from sensorGeometry arrays,
+    # with a 'site' column indexing sensors.  Passes in progress at the end of
+    # the grid are kept by default, the cloud being followed from its creation
+    tables = []
+    for s in range(len(el)):
+        table = findPasses(el[s], az[s], distance[s], horizon, keepOpen)
+        table['site'] = np.full(len(table['sat']), s)
+        tables.append(table)
+    passes = concatenatePasses(tables)
+    if 'site' not in passes:
+        passes['site'] = np.zeros(0, dtype=np.int64)
+    return passes
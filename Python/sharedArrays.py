@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# NumPy arrays in shared memory for process pools
+#
+# The parent copies an array into a named shared memory block once; workers
+# attach to it by name, so large read-only inputs are not pickled with every
+# task.  The parent owns the block and unlinks it when the pool is done (pool
+# workers share the parent's resource tracker, so attaching does not leak).
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+def shareArray(array):
+    # Copy an array into a new shared memory block.  Returns the block (to
+    # close and unlink) and the descriptor workers attach with
+    array = np.ascontiguousarray(array)
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attachArray(descriptor):
+    # Read-only view of a shared array from its descriptor.  Returns the
+    # block, which must stay referenced while the view is used
+    name, shape, dtype = descriptor
+    block = SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def releaseArray(block):
+    block.close()
+    block.unlink()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# A seeded ensemble gives the same tables serially and on a process pool
+
+import numpy as np
+
+from skyfield.api import EarthSatellite, Topos, load
+
+from breakupEnsemble import ENSEMBLE_FIELDS, LINE1, LINE2, iterEnsemble
+from breakupModel import collisionMass
+
+
+def runEnsemble(workers):
+    ts = load.timescale()
+    satellite = EarthSatellite(LINE1, LINE2, ts=ts)
+    tBreakup = ts.tt_jd(satellite.epoch.tt + 0.125)
+    geocentric = satellite.at(tBreakup)
+    dt = np.arange(0.0, 180.0, 2.0) * 60.0
+    tt = tBreakup.tt + dt / 86400.0
+    sensors = [Topos(latitude_degrees=45.0, longitude_degrees=72.0, elevation_m=100.0),
+               Topos(latitude_degrees=0.0, longitude_degrees=0.0)]
+    breakup = {'breakupType': 'collision', 'scale': 1.0, 'lMin': 0.3, 'lMax': 1.0,
+               'mass': collisionMass(1000.0, 1.0, 10.0)}
+    return list(iterEnsemble(geocentric.position.km, geocentric.velocity.km_per_s, tt, dt,
+                             sensors, breakup, 4, seed=12345, workers=workers))
+
+
+def test_workersDoNotChangeResults():
+    serial = runEnsemble(0)
+    pooled = runEnsemble(2)
+    assert len(serial) == len(pooled) == 4
+    for k, (a, b) in enumerate(zip(serial, pooled)):
+        np.testing.assert_array_equal(a['realization'], k)
+        for field in ENSEMBLE_FIELDS:
+            np.testing.assert_array_equal(a[field], b[field], err_msg=field)
+    # Realizations draw different clouds
+    assert len({table['fragments'][0] for table in serial}) > 1
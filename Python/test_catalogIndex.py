@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Element set lookups against a brute-force search over the epochs
+
+import os
+
+import numpy as np
+import pytest
+
+from catalogIndex import ElementSetIndex
+from tleCatalog import readCatalog
+
+TLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogTest.txt')
+
+
+def bruteForce(catalog, satnum, jd, mode):
+    rows = np.flatnonzero(catalog.satnum == satnum)
+    if not len(rows):
+        return -1
+    epochs = catalog.epoch[rows]
+    if mode == 'nearest':
+        return rows[np.argmin(np.abs(epochs - jd))]
+    before = rows[epochs <= jd]
+    if not len(before):
+        return rows[np.argmin(epochs)]
+    return before[np.argmax(catalog.epoch[before])]
+
+
+@pytest.mark.parametrize('mode', ['nearest', 'previous'])
+def test_lookupMatchesBruteForce(mode):
+    catalog = readCatalog(TLE_FILE)
+    index = ElementSetIndex(catalog)
+    jd = np.linspace(catalog.epoch.min() - 2.0, catalog.epoch.max() + 2.0, 301)
+    for satnum in np.append(np.unique(catalog.satnum), 12345):
+        expected = [bruteForce(catalog, satnum, t, mode) for t in jd]
+        np.testing.assert_array_equal(index.lookup(satnum, jd, mode), expected)
+
+
+def test_elementSetsPickNearestEpoch():
+    catalog = readCatalog(TLE_FILE)
+    index = ElementSetIndex(catalog)
+    assert len(index) == 3
+    # Just after the newer of the two element sets of object 5
+    newer = np.flatnonzero(catalog.satnum == 5)[1]
+    rows = index.elementSets(catalog.epoch[newer] + 0.01)
+    np.testing.assert_array_equal(catalog.satnum[rows], index.objectSatnums)
+    assert newer in rows
+    for row in rows:
+        same = catalog.epoch[catalog.satnum == catalog.satnum[row]]
+        assert abs(catalog.epoch[row] - catalog.epoch[newer] - 0.01) == \
+            np.min(np.abs(same - catalog.epoch[newer] - 0.01))
+
+
+def test_unknownMode():
+    index = ElementSetIndex(readCatalog(TLE_FILE))
+    with pytest.raises(ValueError):
+        index.lookup(5, 2458850.0, 'latest')
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Conjunction screening against a brute-force search of every pair
+
+import numpy as np
+
+from skyfield.api import load
+from skyfield.constants import DAY_S
+
+from conjunctionScreen import findConjunctions
+from gridContext import sgp4Times
+from propagation import satrecArray
+from tleCatalog import parseTLE
+from tleFromStates import tleChecksum
+
+THRESHOLD_KM = 20.0
+BRUTE_STEP_S = 5.0
+
+
+def clusterCatalog(nObjects=12, seed=1):
+    # Near-polar orbits of one epoch with slightly different nodes and
+    # phases, crossing every half revolution near the poles
+    rng = np.random.default_rng(seed)
+    lines1 = []
+    lines2 = []
+    for k in range(nObjects):
+        line1 = '1 {:05d}U 71067E   20004.97039155 +.00000142 +00000-0 +43247-4 0  999'.format(
+            90000 + k)
+        line2 = '2 {:05d} 087.6227 {:8.4f} 0065476 094.7647 {:8.4f} 14.33848082536070'.format(
+            90000 + k, 269.5184 + 0.1 * k, 266.1031 + rng.uniform(0.0, 0.3))
+        lines1.append(line1 + str(tleChecksum(line1)))
+        lines2.append(line2 + str(tleChecksum(line2)))
+    return parseTLE(lines1, lines2)
+
+
+def bruteForce(catalog, ts, tStart, tEnd):
+    # Sampled distance of every pair, shape (npair, ntime)
+    tt = np.append(np.arange(tStart, tEnd, BRUTE_STEP_S / DAY_S), tEnd)
+    jd, fraction = sgp4Times(ts.tt_jd(tt))
+    errors, r, v = satrecArray(catalog).sgp4(jd, fraction)
+    sat1, sat2 = np.triu_indices(len(catalog), 1)
+    return sat1, sat2, np.linalg.norm(r[sat2] - r[sat1], axis=2)
+
+
+def checkAgainstBruteForce(catalog, ts, tStart, tEnd):
+    conjunctions = findConjunctions(catalog, tStart, tEnd, ts, THRESHOLD_KM, 60.0)
+    assert np.all(conjunctions['sat1'] < conjunctions['sat2'])
+    assert np.all(conjunctions['miss'] <= THRESHOLD_KM)
+    assert np.all((conjunctions['tca'] >= tStart) & (conjunctions['tca'] <= tEnd))
+    assert np.all(np.diff(conjunctions['tca']) >= 0.0)
+    sat1, sat2, distance = bruteForce(catalog, ts, tStart, tEnd)
+    closest = distance.min(axis=1)
+    for a, b, sampled in zip(sat1, sat2, closest):
+        pair = (conjunctions['sat1'] == a) & (conjunctions['sat2'] == b)
+        if sampled < 0.99 * THRESHOLD_KM:
+            assert pair.any()
+        if pair.any():
+            # The refined miss is at most the closest sample, and not much less
+            miss = conjunctions['miss'][pair].min()
+            assert sampled - 0.5 <= miss <= sampled + 1e-3
+    return conjunctions, sat1, sat2, distance
+
+
+def test_matchesBruteForce():
+    ts = load.timescale()
+    catalog = clusterCatalog()
+    tStart = ts.utc(2020, 1, 5).tt
+    conjunctions = checkAgainstBruteForce(catalog, ts, tStart, tStart + 0.1)[0]
+    assert len(conjunctions['tca']) > 0
+
+
+def test_windowStartEncounter():
+    # A window starting just after a TCA reports the receding pair at tStart
+    ts = load.timescale()
+    catalog = clusterCatalog()
+    tStart = ts.utc(2020, 1, 5).tt
+    conjunctions = findConjunctions(catalog, tStart, tStart + 0.1, ts, THRESHOLD_KM, 60.0)
+    inside = np.flatnonzero(conjunctions['tca'] > tStart)[0]
+    a, b = conjunctions['sat1'][inside], conjunctions['sat2'][inside]
+    shifted = conjunctions['tca'][inside] + 30.0 / DAY_S
+
+    conjunctions, sat1, sat2, distance = checkAgainstBruteForce(catalog, ts, shifted,
+                                                                shifted + 0.05)
+    assert distance[(sat1 == a) & (sat2 == b), 0] < THRESHOLD_KM
+    atStart = (conjunctions['sat1'] == a) & (conjunctions['sat2'] == b) \
+        & (conjunctions['tca'] == shifted)
+    assert atStart.sum() == 1
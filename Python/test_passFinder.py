@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Grid passes of a fixed TLE against skyfield's find_events
+
+import numpy as np
+
+from skyfield.api import EarthSatellite, Topos, load
+
+from passFinder import findPasses
+
+LINE1 = '1  5398U 71067E   20004.97039155 +.00000142 +00000-0 +43247-4 0  9992'
+LINE2 = '2  5398 087.6227 269.5184 0065476 094.7647 266.1031 14.33848082536070'
+STEP_S = 10.0
+
+
+def test_passesMatchFindEvents():
+    ts = load.timescale()
+    satellite = EarthSatellite(LINE1, LINE2, ts=ts)
+    site = Topos(latitude_degrees=45.0, longitude_degrees=72.0, elevation_m=100.0)
+    tt = ts.utc(2020, 1, 5).tt + np.arange(0.0, 86400.0, STEP_S) / 86400.0
+    times = ts.tt_jd(tt)
+    el, az, distance = (satellite - site).at(times).altaz()
+    passes = findPasses(el.degrees, az.degrees, distance.km)
+
+    events, kinds = satellite.find_events(site, times[0], times[-1], altitude_degrees=0.0)
+    rises = events.tt[kinds == 0]
+    sets = events.tt[kinds == 2]
+    # Complete passes only, as findPasses drops the ones open at either end
+    sets = sets[sets > rises[0]]
+    rises = rises[rises < sets[-1]]
+
+    assert len(passes['sat']) == len(rises) == len(sets) > 0
+    np.testing.assert_array_equal(passes['sat'], 0)
+    # The first sample above the horizon follows the rise by under a step,
+    # as does the first sample below it the set
+    riseDelay = (tt[passes['rise']] - rises) * 86400.0
+    setDelay = (tt[passes['set']] - sets) * 86400.0
+    assert np.all((riseDelay >= -1e-3) & (riseDelay <= STEP_S))
+    assert np.all((setDelay >= -1e-3) & (setDelay <= STEP_S))
+
+    culminations = events[kinds == 1]
+    culminations = culminations[(culminations.tt > rises[0]) & (culminations.tt < sets[-1])]
+    maxEl = (satellite - site).at(culminations).altaz()[0].degrees
+    assert np.all(passes['maxEl'] <= maxEl + 1e-6)
+    assert np.all(passes['maxEl'] > maxEl - 0.5)
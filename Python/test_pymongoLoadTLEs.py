@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Bulk TLE loads into an in-memory MongoDB (mongomock) are idempotent
+
+import os
+
+import pytest
+
+from pymongoLoadTLEs import importCatalog
+from tleCatalog import readCatalog
+
+mongomock = pytest.importorskip('mongomock')
+
+TLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogTest.txt')
+
+
+def test_repeatedLoadUpdatesInPlace():
+    collection = mongomock.MongoClient()['Gemini2']['tle_collection']
+    catalog = readCatalog(TLE_FILE)
+
+    inserts, updates, writeConcernErrors, writeErrors = importCatalog(TLE_FILE, collection,
+                                                                      batchSize=2)
+    assert (inserts, updates, writeConcernErrors, writeErrors) == (len(catalog), 0, 0, 0)
+    first = sorted((doc['satnum'], doc['jdsatepoch'], doc['line1'])
+                   for doc in collection.find({}, {'_id': 0}))
+
+    inserts, updates, writeConcernErrors, writeErrors = importCatalog(TLE_FILE, collection,
+                                                                      batchSize=3)
+    assert (inserts, updates, writeConcernErrors, writeErrors) == (0, len(catalog), 0, 0)
+    assert collection.count_documents({}) == len(catalog)
+    assert sorted((doc['satnum'], doc['jdsatepoch'], doc['line1'])
+                  for doc in collection.find({}, {'_id': 0})) == first
+
+
+def test_documentsKeepCatalogValues():
+    collection = mongomock.MongoClient()['Gemini2']['tle_collection']
+    catalog = readCatalog(TLE_FILE)
+    importCatalog(TLE_FILE, collection)
+    doc = collection.find_one({'satnum': str(catalog.satnum[0]),
+                               'jdsatepoch': float(catalog.epoch[0])})
+    assert doc['line2'] == catalog.line2[0].decode('ascii')
+    assert doc['no'] == catalog.meanMotion[0]
+    assert doc['epochyr'] == catalog.epochyr[0]
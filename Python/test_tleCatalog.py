@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Columnar catalog columns against the sgp4 parser of the same element sets
+
+import os
+
+import numpy as np
+
+from sgp4.api import Satrec
+
+from tleCatalog import iterCatalogBatches, iterTLE, readCatalog
+
+TLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalogTest.txt')
+
+# Catalog column and the Satrec attribute it mirrors
+SATREC_COLUMNS = [
+    ('satnum', 'satnum'),
+    ('epochyr', 'epochyr'),
+    ('epochdays', 'epochdays'),
+    ('ndot', 'ndot'),
+    ('nddot', 'nddot'),
+    ('bstar', 'bstar'),
+    ('inclination', 'inclo'),
+    ('raan', 'nodeo'),
+    ('eccentricity', 'ecco'),
+    ('argPerigee', 'argpo'),
+    ('meanAnomaly', 'mo'),
+    ('meanMotion', 'no_kozai'),
+]
+
+
+def readSatrecs():
+    with open(TLE_FILE) as tleFile:
+        return [Satrec.twoline2rv(line1, line2) for line1, line2 in iterTLE(tleFile)]
+
+
+def test_columnsMatchSatrec():
+    catalog = readCatalog(TLE_FILE)
+    satrecs = readSatrecs()
+    assert len(catalog) == len(satrecs) == 5
+    for column, attribute in SATREC_COLUMNS:
+        expected = np.array([getattr(satrec, attribute) for satrec in satrecs])
+        np.testing.assert_allclose(getattr(catalog, column), expected, rtol=1e-12, atol=0.0,
+                                   err_msg=column)
+    epoch = np.array([satrec.jdsatepoch + satrec.jdsatepochF for satrec in satrecs])
+    np.testing.assert_allclose(catalog.epoch, epoch, rtol=0.0, atol=1e-8)
+
+
+def test_linesRoundTrip():
+    catalog = readCatalog(TLE_FILE)
+    with open(TLE_FILE) as tleFile:
+        lines = list(iterTLE(tleFile))
+    for column, lineNumber in ((catalog.line1, 0), (catalog.line2, 1)):
+        assert [line.decode('ascii') for line in column] == \
+            [pair[lineNumber].rstrip() for pair in lines]
+    assert catalog.satellite(2).model.satnum == catalog.satnum[2]
+
+
+def test_batchesMatchCatalog():
+    catalog = readCatalog(TLE_FILE)
+    with open(TLE_FILE) as tleFile:
+        batches = list(iterCatalogBatches(tleFile, 2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    for name, column in catalog.columns().items():
+        np.testing.assert_array_equal(np.concatenate([getattr(batch, name) for batch in batches]),
+                                      column)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Columnar TLE catalog shared by the catalog, schedule and observation scripts
+#
+# The TLE file is streamed once and the element sets are parsed with array
+# operations into a structure of NumPy columns.  Skyfield EarthSatellite
+# objects are only built when a caller asks for them.
+
+from math import pi
+
+import numpy as np
+
+from skyfield.api import EarthSatellite
+
+DEG2RAD = pi / 180.0
+XPDOTP = 1440.0 / (2.0 * pi)    # rev/day -> rad/min
+TLE_LINE_LENGTH = 69
+
+# Catalog columns and their on-disk/in-memory types.  Angles are in radians
+# and mean motion in radians per minute, the same units as satellite.model
+CATALOG_COLUMNS = [
+    ('satnum', np.int32),
+    ('epochyr', np.int16),          # Two-digit TLE year of the epoch, as satellite.model
+    ('epochdays', np.float64),      # Fractional days into the year
+    ('epoch', np.float64),          # Julian date (UTC) of the epoch
+    ('ndot', np.float64),
+    ('nddot', np.float64),
+    ('bstar', np.float64),
+    ('inclination', np.float64),
+    ('raan', np.float64),
+    ('eccentricity', np.float64),
+    ('argPerigee', np.float64),
+    ('meanAnomaly', np.float64),
+    ('meanMotion', np.float64),
+    ('line1', 'S%d' % TLE_LINE_LENGTH),
+    ('line2', 'S%d' % TLE_LINE_LENGTH),
+]
+COLUMN_NAMES = [name for name, dtype in CATALOG_COLUMNS]
+
+
+class TleCatalog:
+    # Structure of arrays, one NumPy column per element set field
+
+    def __init__(self, columns):
+        for name in COLUMN_NAMES:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.satnum)
+
+    def columns(self):
+        return {name: getattr(self, name) for name in COLUMN_NAMES}
+
+    def subset(self, indices):
+        # New catalog holding only the selected rows (index array or mask)
+        return TleCatalog({name: column[indices]
+                           for name, column in self.columns().items()})
+
+    def satellite(self, i, ts=None):
+        # Build the skyfield object for a single element set on demand
+        return EarthSatellite(self.line1[i].decode('ascii'),
+                              self.line2[i].decode('ascii'), ts=ts)
+
+    def satellites(self, indices=None, ts=None):
+        if indices is None:
+            indices = range(len(self))
+        return [self.satellite(i, ts) for i in indices]
+
+
+def iterTLE(tleFile):
+    # Yield (line1, line2) pairs from an open TLE file, skipping name lines
+    line1 = None
+    line2 = None
+
+    for line in tleFile:
+        if not line.strip():
+            continue
+        if line[0] == '0':
+            pass
+        elif line[0] == '1':
+            line1 = line
+        elif line[0] == '2':
+            line2 = line
+        else:
+            # Error - TLE lines start with 0, 1 or 2
+            print("Error: line does not start with 0, 1 or 2: ", line)
+
+        if line1 and line2:
+            # Check if object number is same in both line 1 and 2
+            if line1[2:7] == line2[2:7]:
+                yield line1, line2
+            else:
+                print("Error: Satnumber in line 1 not equal to line 2", line1, line2)
+            line1 = None
+            line2 = None
+
+
+def _lineArray(lines):
+    # Fixed width (n, 69) byte matrix of TLE lines
+    text = b''.join(line.rstrip().ljust(TLE_LINE_LENGTH)[:TLE_LINE_LENGTH].encode('ascii')
+                    for line in lines)
+    return np.frombuffer(text, dtype=np.uint8).reshape(-1, TLE_LINE_LENGTH)
+
+
+def _field(chars, start, stop, dtype=np.float64):
+    # Parse a fixed-width column of the byte matrix
+    width = stop - start
+    text = np.ascontiguousarray(chars[:, start:stop]).view('S%d' % width).ravel()
+    return text.astype(dtype)
+
+
+def _exponential(chars, start):
+    # TLE implied-decimal notation, e.g. ' 25697-3' or '-11606-4'
+    mantissa = _field(chars, start + 1, start + 6) / 1e5
+    mantissa[chars[:, start] == ord('-')] *= -1.0
+    exponent = _field(chars, start + 6, start + 8, np.int64)
+    return mantissa * 10.0 ** exponent
+
+
+def _eccentricity(chars):
+    digits = chars[:, 26:33].copy()
+    digits[digits == ord(' ')] = ord('0')
+    return digits.view('S7').ravel().astype(np.float64) / 1e7
+
+
+def _julianDateJan0(year):
+    # Julian date of 0 January (i.e. 31 December of the previous year)
+    return 367.0 * year - (7 * year) // 4 + 30 + 1721013.5
+
+
+def parseTLE(lines1, lines2):
+    # Parse sequences of line 1 and line 2 strings into a TleCatalog
+    chars1 = _lineArray(lines1)
+    chars2 = _lineArray(lines2)
+
+    twoDigitYear = _field(chars1, 18, 20, np.int64)
+    year = np.where(twoDigitYear < 57, twoDigitYear + 2000, twoDigitYear + 1900)
+    epochdays = _field(chars1, 20, 32)
+
+    columns = {
+        'satnum': _field(chars1, 2, 7, np.int64),
+        'epochyr': twoDigitYear,
+        'epochdays': epochdays,
+        'epoch': _julianDateJan0(year) + epochdays,
+        'ndot': _field(chars1, 33, 43) / (XPDOTP * 1440.0),
+        'nddot': _exponential(chars1, 44) / (XPDOTP * 1440.0 * 1440.0),
+        'bstar': _exponential(chars1, 53),
+        'inclination': _field(chars2, 8, 16) * DEG2RAD,
+        'raan': _field(chars2, 17, 25) * DEG2RAD,
+        'eccentricity': _eccentricity(chars2),
+        'argPerigee': _field(chars2, 34, 42) * DEG2RAD,
+        'meanAnomaly': _field(chars2, 43, 51) * DEG2RAD,
+        'meanMotion': _field(chars2, 52, 63) / XPDOTP,
+        'line1': chars1.copy().view('S%d' % TLE_LINE_LENGTH).ravel(),
+        'line2': chars2.copy().view('S%d' % TLE_LINE_LENGTH).ravel(),
+    }
+    return TleCatalog({name: columns[name].astype(dtype, copy=False)
+                       for name, dtype in CATALOG_COLUMNS})
+
+
+def readCatalog(tleFilename):
+    # Stream a TLE file once into a columnar catalog
+    lines1 = []
+    lines2 = []
+    with open(tleFilename, 'r') as tleFile:
+        for line1, line2 in iterTLE(tleFile):
+            lines1.append(line1)
+            lines2.append(line2)
+    return parseTLE(lines1, lines2)
+
+
+def iterCatalogBatches(tleFile, batchSize):
+    # Stream an open TLE file as a sequence of catalogs of batchSize entries
+    lines1 = []
+    lines2 = []
+    for line1, line2 in iterTLE(tleFile):
+        lines1.append(line1)
+        lines2.append(line2)
+        if len(lines1) == batchSize:
+            yield parseTLE(lines1, lines2)
+            lines1 = []
+            lines2 = []
+    if lines1:
+        yield parseTLE(lines1, lines2)
+
+
+def readTLE(tleFilename):
+    # Read TLE file into a list of EarthSatellite objects
+    return readCatalog(tleFilename).satellites()
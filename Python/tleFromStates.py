@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# TLE element sets from state vectors
+#
+# State vectors (n, 6) in km and km/s, e.g. breakup fragments, are turned
+# into SGP4 mean elements and written as TLE lines, so simulated objects can
+# be read back with readTLE/readCatalog, loaded into MongoDB or scheduled
+# like any catalog.  The states are rotated into TEME at their epochs (each
+# epoch rounded to the 1e-8 day a TLE can hold) and the mean elements are
+# found by fixed-point iteration: the osculating elements of the SGP4 state
+# at epoch are compared with those of the target state and the difference
+# is added to the mean elements until the positions agree.  The elements
+# are iterated in a nonsingular set (mean motion, e cos w, e sin w,
+# inclination, node, mean argument of latitude) so near-circular orbits
+# converge too.  All element arithmetic is done on arrays; sgp4 is called
+# once per object and iteration.
+
+from math import pi
+
+import numpy as np
+
+from sgp4.api import WGS72, Satrec
+from sgp4.earth_gravity import wgs72
+from skyfield.sgp4lib import TEME
+
+from gridContext import sgp4Times
+from tleCatalog import XPDOTP, _julianDateJan0
+
+FIT_ITERATIONS = 20
+FIT_TOLERANCE = 1e-6            # km, position agreement at epoch
+SGP4_EPOCH_JD = 2433281.5       # sgp4init epochs are days from 1949 Dec 31 0h
+EPOCH_DECIMALS = 8              # day fraction digits of a TLE epoch
+MAX_SATNUM = 99999              # readCatalog parses five digit numbers
+DRAG_DENSITY = 0.15696615       # kg/m^2/Earth radius, reference density of B*
+NOT_CONVERGED = 7               # fit error code, after the sgp4 codes 1-6
+
+TWO_PI = 2.0 * pi
+
+
+def ballisticBstar(areaToMass, dragCoefficient=2.2):
+    # SGP4 drag term B* (1/Earth radii) of objects with area-to-mass ratios
+    # in m^2/kg, e.g. from breakupModel.breakupFragments
+    return 0.5 * dragCoefficient * np.asarray(areaToMass) * DRAG_DENSITY
+
+
+def gcrsToTeme(states, times):
+    # Rotate GCRS state vectors (n, 6) into TEME at their epochs (a skyfield
+    # Time, scalar or one per state).  The slow turn of the TEME axes is
+    # neglected for the velocity
+    R = TEME.rotation_at(times)
+    if R.ndim == 2:
+        R = R[:, :, np.newaxis]
+    M = np.moveaxis(R, -1, 0)           # GCRS -> TEME, (n or 1, 3, 3)
+    teme = np.empty_like(states)
+    teme[:, :3] = np.matmul(M, states[:, :3, np.newaxis])[..., 0]
+    teme[:, 3:] = np.matmul(M, states[:, 3:, np.newaxis])[..., 0]
+    return teme
+
+
+def _wrap(angle):
+    # Angles into [-pi, pi)
+    return np.remainder(angle + pi, TWO_PI) - pi
+
+
+def nonsingularElements(states, mu=wgs72.mu):
+    # Osculating mean motion (rad/min), e cos w, e sin w, inclination, node
+    # and mean argument of latitude (rad) of TEME states (n, 6), columns of
+    # an (n, 6) array
+    r, v = states[:, :3], states[:, 3:]
+    rNorm = np.linalg.norm(r, axis=1)
+    h = np.cross(r, v)
+    hNorm = np.linalg.norm(h, axis=1)
+    a = 1.0 / (2.0 / rNorm - np.sum(v * v, axis=1) / mu)
+    inclination = np.arccos(np.clip(h[:, 2] / hNorm, -1.0, 1.0))
+    node = np.arctan2(h[:, 0], -h[:, 1])
+    # Node line and its normal in the orbit plane
+    N = np.column_stack((np.cos(node), np.sin(node), np.zeros(len(node))))
+    m = np.cross(h / hNorm[:, np.newaxis], N)
+    eVector = np.cross(v, h) / mu - r / rNorm[:, np.newaxis]
+    ex = np.sum(eVector * N, axis=1)
+    ey = np.sum(eVector * m, axis=1)
+    e = np.hypot(ex, ey)
+    latitude = np.arctan2(np.sum(r * m, axis=1), np.sum(r * N, axis=1))
+    periapsis = np.arctan2(ey, ex)
+    trueAnomaly = latitude - periapsis
+    E = 2.0 * np.arctan2(np.sqrt(np.maximum(1.0 - e, 0.0)) * np.sin(trueAnomaly / 2.0),
+                         np.sqrt(1.0 + e) * np.cos(trueAnomaly / 2.0))
+    meanLatitude = periapsis + E - e * np.sin(E)
+    n = np.sqrt(mu / np.abs(a) ** 3) * 60.0
+    return np.column_stack((n, ex, ey, inclination, node, _wrap(meanLatitude)))
+
+
+def _satrecs(elements, satnum, epoch, bstar):
+    # sgp4 satellites of nonsingular mean elements
+    n, ex, ey, inclination, node, meanLatitude = elements.T
+    e = np.hypot(ex, ey)
+    periapsis = np.arctan2(ey, ex)
+    satrecs = []
+    for k in range(len(elements)):
+        satrec = Satrec()
+        satrec.sgp4init(WGS72, 'i', int(satnum[k]), epoch[k], bstar[k], 0.0, 0.0, e[k],
+                        periapsis[k] % TWO_PI, inclination[k],
+                        (meanLatitude[k] - periapsis[k]) % TWO_PI, n[k], node[k] % TWO_PI)
+        satrecs.append(satrec)
+    return satrecs
+
+
+def _epochStates(satrecs):
+    # Errors (n,) and TEME states (n, 6) of sgp4 satellites at their epochs
+    errors = np.zeros(len(satrecs), dtype=np.uint8)
+    states = np.empty((len(satrecs), 6))
+    for k, satrec in enumerate(satrecs):
+        errors[k], r, v = satrec.sgp4_tsince(0.0)
+        states[k, :3] = r
+        states[k, 3:] = v
+    return errors, states
+
+
+def fitMeanElements(states, satnum, epoch, bstar, iterations=FIT_ITERATIONS,
+                    tolerance=FIT_TOLERANCE):
+    # SGP4 mean elements (n, 6), nonsingular set, reproducing TEME states
+    # (n, 6) at sgp4init epochs.  Returns the elements, the position error
+    # (km) left at epoch and the sgp4 error codes, NaN elements and a
+    # nonzero code marking objects that could not be fitted (e.g. escaping
+    # or decayed, or NOT_CONVERGED within the iterations)
+    target = nonsingularElements(states)
+    elements = target.copy()
+    active = np.all(np.isfinite(elements), axis=1) \
+        & (np.hypot(target[:, 1], target[:, 2]) < 1.0)
+    errors = np.where(active, 0, 1).astype(np.uint8)
+    miss = np.full(len(states), np.inf)
+    for iteration in range(iterations):
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+        rowErrors, fitted = _epochStates(_satrecs(elements[rows], satnum[rows], epoch[rows],
+                                                  bstar[rows]))
+        miss[rows] = np.linalg.norm(fitted[:, :3] - states[rows, :3], axis=1)
+        errors[rows] = rowErrors
+        correction = target[rows] - nonsingularElements(fitted)
+        correction[:, 4:] = _wrap(correction[:, 4:])
+        elements[rows] += correction
+        # Keep the last elements of objects that are done or failing
+        done = (miss[rows] < tolerance) | (rowErrors != 0)
+        elements[rows[done]] -= correction[done]
+        active[rows[done]] = False
+    errors[(errors == 0) & ~(miss < tolerance)] = NOT_CONVERGED
+    elements[errors != 0] = np.nan
+    return elements, miss, errors
+
+
+def _exponentialText(values):
+    # TLE implied-decimal notation, e.g. ' 43247-4' for 4.3247e-5
+    texts = []
+    for value in np.asarray(values, dtype=np.float64).tolist():
+        if value == 0.0:
+            texts.append(' 00000-0')
+            continue
+        exponent = int(np.floor(np.log10(abs(value)))) + 1
+        mantissa = int(round(abs(value) / 10.0 ** exponent * 1e5))
+        if mantissa == 100000:
+            mantissa, exponent = 10000, exponent + 1
+        texts.append('{}{:05d}{:+d}'.format('-' if value < 0 else ' ', mantissa, exponent))
+    return texts
+
+
+def tleChecksum(line):
+    # Modulo 10 sum of the digits of the first 68 columns, minus signs counting 1
+    return sum(int(c) if c.isdigit() else c == '-' for c in line[:68]) % 10
+
+
+def tleLines(satnum, epochyr, epochdays, bstar, elements, designator='', revolution=0,
+             elementNumber=999):
+    # Line 1 and line 2 strings of nonsingular mean elements
+    n, ex, ey, inclination, node, meanLatitude = elements.T
+    e = np.hypot(ex, ey)
+    periapsis = np.degrees(np.arctan2(ey, ex))
+    meanAnomaly = np.round(np.degrees(meanLatitude) - periapsis, 4) % 360.0
+    periapsis = np.round(periapsis, 4) % 360.0
+    node = np.round(np.degrees(node), 4) % 360.0
+    eccentricity = np.minimum(np.round(e * 1e7), 9999999).astype(np.int64)
+    bstarText = _exponentialText(bstar)
+    lines1 = []
+    lines2 = []
+    for k in range(len(elements)):
+        line1 = '1 {:05d}U {:<8s} {:02d}{:012.8f}  .00000000  00000-0 {} 0 {:4d}'.format(
+            int(satnum[k]), designator[:8], int(epochyr[k]) % 100, epochdays[k],
+            bstarText[k], elementNumber % 10000)
+        line2 = '2 {:05d} {:8.4f} {:8.4f} {:07d} {:8.4f} {:8.4f} {:11.8f}{:5d}'.format(
+            int(satnum[k]), np.degrees(inclination[k]), node[k], eccentricity[k],
+            periapsis[k], meanAnomaly[k], n[k] * XPDOTP, revolution % 100000)
+        lines1.append(line1 + str(tleChecksum(line1)))
+        lines2.append(line2 + str(tleChecksum(line2)))
+    return lines1, lines2
+
+
+def statesToTLE(states, times, satnum, bstar=0.0, frame='gcrs', designator='',
+                iterations=FIT_ITERATIONS, tolerance=FIT_TOLERANCE):
+    # TLE lines of state vectors (n, 6) in km and km/s at times (skyfield
+    # Time, scalar or one per state) in GCRS (or TEME with frame='teme').
+    # satnum is the first catalog number (numbered on from it) or one per
+    # state.  Returns lines1, lines2 of the fitted objects, their rows and
+    # the position error (km) of each at its epoch.  Objects whose mean
+    # elements are not fitted within tolerance (km) are left out; the error
+    # returned is that of the written lines, whose rounded elements move the
+    # positions by metres
+    states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+    count = len(states)
+    satnum = np.asarray(satnum, dtype=np.int64)
+    if satnum.ndim == 0:
+        satnum = satnum + np.arange(count)
+    if count and satnum.max() > MAX_SATNUM:
+        raise ValueError('catalog numbers above %d do not fit a TLE' % MAX_SATNUM)
+    bstar = np.broadcast_to(np.asarray(bstar, dtype=np.float64), (count,))
+    if frame == 'gcrs':
+        states = gcrsToTeme(states, times)
+    elif frame != 'teme':
+        raise ValueError('frame must be gcrs or teme')
+
+    # Round the epochs to what a TLE holds and move the states to them
+    epochyr = np.broadcast_to(np.atleast_1d(times.utc[0]), (count,)).astype(np.int64)
+    jd, fraction = sgp4Times(times)
+    jan0 = _julianDateJan0(epochyr)
+    days = np.broadcast_to(jd - jan0 + fraction, (count,))
+    epochdays = np.round(days, EPOCH_DECIMALS)
+    states = states.copy()
+    states[:, :3] += states[:, 3:] * ((epochdays - days) * 86400.0)[:, np.newaxis]
+
+    elements, miss, errors = fitMeanElements(states, satnum, jan0 - SGP4_EPOCH_JD + epochdays,
+                                             bstar, iterations, tolerance)
+    rows = np.flatnonzero(errors == 0)
+    lines1, lines2 = tleLines(satnum[rows], epochyr[rows], epochdays[rows], bstar[rows],
+                              elements[rows], designator)
+    written = _epochStates([Satrec.twoline2rv(line1, line2)
+                            for line1, line2 in zip(lines1, lines2)])[1]
+    miss = np.linalg.norm(written[:, :3] - states[rows, :3], axis=1)
+    return lines1, lines2, rows, miss
+
+
+def writeTLE(tleFilename, lines1, lines2):
+    # Write TLE line pairs, readable by readTLE/readCatalog
+    with open(tleFilename, 'w') as tleFile:
+        for line1, line2 in zip(lines1, lines2):
+            tleFile.write(line1 + '\n' + line2 + '\n')
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Geometric visibility screening of site/object pairs
+#
+# Cheap bounds from the catalog elements rule out site/object pairs before
+# the expensive propagation.  An object at radius r is above elevation e from
+# a site at radius rho only within the Earth-central angle
+# arccos(rho cos(e) / r) - e of the site, and its ground track never leaves
+# the latitude band of its inclination.  Near-synchronous objects hardly move
+# over the ground, so they are screened from a coarse hourly propagation and
+# flagged as always or never visible over the window.
+
+import numpy as np
+
+from skyfield.constants import DAY_S
+
+from gridContext import siteFrame
+from propagation import propagateCatalog
+
+NEVER_VISIBLE, SOMETIMES_VISIBLE, ALWAYS_VISIBLE = 0, 1, 2
+
+MU_KM3_S2 = 398600.8           # WGS72, as used by sgp4
+EARTH_ROTATION = 7.292115e-5   # rad/s
+SCREEN_MARGIN_DEG = 1.0        # angle margin for perturbations and geodetic vs geocentric
+SYNCHRONOUS_REV_PER_DAY = (0.9, 1.1)
+SYNCHRONOUS_MAX_ECCENTRICITY = 0.2
+SYNCHRONOUS_STEP_S = 3600.0
+
+
+def orbitRadii(catalog):
+    # Perigee and apogee radius (km) from the mean motion (rad/min) and
+    # eccentricity of every element set
+    n = np.asarray(catalog.meanMotion) / 60.0
+    a = (MU_KM3_S2 / (n * n)) ** (1.0 / 3.0)
+    e = np.asarray(catalog.eccentricity)
+    return a * (1.0 - e), a * (1.0 + e)
+
+
+def visibilityAngle(radius, siteRadius, minElevation=0.0):
+    # Largest Earth-central angle (rad) between a site and an object at the
+    # given radius with the object above minElevation (degrees); negative if
+    # the object can never reach that elevation
+    elevation = np.radians(minElevation)
+    cosAngle = siteRadius * np.cos(elevation) / np.asarray(radius, dtype=np.float64)
+    return np.where(cosAngle < 1.0, np.arccos(np.minimum(cosAngle, 1.0)) - elevation, -1.0)
+
+
+def synchronous(catalog):
+    # Near-synchronous objects whose ground track barely moves
+    revPerDay = np.asarray(catalog.meanMotion) * 1440.0 / (2.0 * np.pi)
+    return (revPerDay > SYNCHRONOUS_REV_PER_DAY[0]) & (revPerDay < SYNCHRONOUS_REV_PER_DAY[1]) \
+        & (np.asarray(catalog.eccentricity) < SYNCHRONOUS_MAX_ECCENTRICITY)
+
+
+def screenSites(catalog, sites, tStart, tEnd, ts, minElevation=0.0):
+    # Visibility code (NEVER_VISIBLE, SOMETIMES_VISIBLE or ALWAYS_VISIBLE) of
+    # every element set from every site between TT Julian dates tStart and
+    # tEnd, shape (nsite, nsat).  Only SOMETIMES_VISIBLE pairs can have passes
+    margin = np.radians(SCREEN_MARGIN_DEG)
+    siteXyz = np.array([siteFrame(site).xyz for site in sites]).reshape(-1, 3)
+    siteRadius = np.linalg.norm(siteXyz, axis=1)
+    siteLatitude = np.arcsin(siteXyz[:, 2] / siteRadius)
+
+    # Latitude band: the ground track stays within the inclination
+    perigee, apogee = orbitRadii(catalog)
+    inclination = np.asarray(catalog.inclination)
+    band = np.minimum(inclination, np.pi - inclination)
+    reach = visibilityAngle(apogee[np.newaxis, :], siteRadius[:, np.newaxis], minElevation)
+    screen = np.where(np.abs(siteLatitude)[:, np.newaxis] > band + reach + margin,
+                      NEVER_VISIBLE, SOMETIMES_VISIBLE)
+
+    # Near-synchronous objects: central angle to the site on an hourly grid,
+    # with a margin for the ground track motion between samples
+    sync = np.flatnonzero(synchronous(catalog))
+    if not len(sync):
+        return screen
+    grid = np.append(np.arange(tStart, tEnd, SYNCHRONOUS_STEP_S / DAY_S), tEnd)
+    errors, r, v = propagateCatalog(catalog.subset(sync), ts.tt_jd(grid), frame='itrf')
+    radius = np.linalg.norm(r, axis=-1)
+    n = np.asarray(catalog.meanMotion)[sync] / 60.0
+    groundRate = np.abs(n - EARTH_ROTATION) + 2.0 * n * np.sin(band[sync] / 2.0) \
+        + 2.0 * n * np.asarray(catalog.eccentricity)[sync]
+    syncMargin = (groundRate * SYNCHRONOUS_STEP_S / 2.0 + margin)[:, np.newaxis]
+    failed = np.any(errors != 0, axis=1) | np.any(np.isnan(radius), axis=1)
+
+    for s in range(len(sites)):
+        angle = np.arccos(np.clip(r @ siteXyz[s] / (radius * siteRadius[s]), -1.0, 1.0))
+        slack = visibilityAngle(radius, siteRadius[s], minElevation) - angle
+        always = np.all(slack > syncMargin, axis=1) & ~failed
+        never = np.all(slack < -syncMargin, axis=1) & ~failed
+        screen[s, sync] = np.where(always, ALWAYS_VISIBLE,
+                                   np.where(never, NEVER_VISIBLE, screen[s, sync]))
+    return screen
+
+
+def printScreenSummary(screen, siteNames=None):
+    for s in range(len(screen)):
+        name = siteNames[s] if siteNames is not None else s
+        print("Screened:", name,
+              np.count_nonzero(screen[s] == NEVER_VISIBLE), "never visible,",
+              np.count_nonzero(screen[s] == ALWAYS_VISIBLE), "always visible,",
+              np.count_nonzero(screen[s] == SOMETIMES_VISIBLE), "to search")